@@ -0,0 +1,32 @@
+"""Add the update_alias_sequences table
+
+Revision ID: 13cfca635b99
+Revises: 2c1a6dbd0a71
+Create Date: 2015-04-23 09:48:12.734210
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '13cfca635b99'
+down_revision = '2c1a6dbd0a71'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    # Rows are seeded from the existing aliases the first time an id is
+    # allocated for a given prefix and year.
+    op.create_table(
+        'update_alias_sequences',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('id_prefix', sa.Unicode(length=25), nullable=False),
+        sa.Column('year', sa.Integer(), nullable=False),
+        sa.Column('value', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('id_prefix', 'year'),
+    )
+
+
+def downgrade():
+    op.drop_table('update_alias_sequences')
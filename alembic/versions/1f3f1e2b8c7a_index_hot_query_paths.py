@@ -0,0 +1,86 @@
+"""Index the columns used by the list views, the masher and lookups
+
+Revision ID: 1f3f1e2b8c7a
+Revises: 3a1f7d6c2b58
+Create Date: 2015-04-29 13:37:02.150946
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '1f3f1e2b8c7a'
+down_revision = '3a1f7d6c2b58'
+
+from alembic import op
+
+
+INDEXES = [
+    ('ix_updates_date_submitted', 'updates', ['date_submitted']),
+    ('ix_updates_date_modified', 'updates', ['date_modified']),
+    ('ix_updates_date_pushed', 'updates', ['date_pushed']),
+    ('ix_updates_release_status_submitted', 'updates',
+     ['release_id', 'status', 'date_submitted']),
+    ('ix_updates_user_submitted', 'updates', ['user_id', 'date_submitted']),
+    ('ix_updates_type_submitted', 'updates', ['type', 'date_submitted']),
+    ('ix_updates_critpath_submitted', 'updates',
+     ['critpath', 'date_submitted']),
+    ('ix_updates_request_status', 'updates', ['request', 'status']),
+
+    ('ix_comments_timestamp', 'comments', ['timestamp']),
+    ('ix_comments_update_timestamp', 'comments', ['update_id', 'timestamp']),
+    ('ix_comments_user_timestamp', 'comments', ['user_id', 'timestamp']),
+    ('ix_comment_bug_assoc_comment_id', 'comment_bug_assoc', ['comment_id']),
+    ('ix_comment_bug_assoc_bug_id', 'comment_bug_assoc', ['bug_id']),
+    ('ix_comment_testcase_assoc_comment_id', 'comment_testcase_assoc',
+     ['comment_id']),
+    ('ix_comment_testcase_assoc_testcase_id', 'comment_testcase_assoc',
+     ['testcase_id']),
+
+    ('ix_builds_release_id', 'builds', ['release_id']),
+    ('ix_builds_update_id', 'builds', ['update_id']),
+    ('ix_testcases_package_id', 'testcases', ['package_id']),
+
+    ('ix_buildroot_overrides_build_id', 'buildroot_overrides', ['build_id']),
+    ('ix_buildroot_overrides_submitter_id', 'buildroot_overrides',
+     ['submitter_id']),
+    ('ix_buildroot_overrides_submission_date', 'buildroot_overrides',
+     ['submission_date']),
+    ('ix_buildroot_overrides_expiration_date', 'buildroot_overrides',
+     ['expiration_date']),
+    ('ix_buildroot_overrides_expired_date', 'buildroot_overrides',
+     ['expired_date']),
+]
+
+# Both sides of each association table
+ASSOCIATIONS = {
+    'update_bug_table': ('update_id', 'bug_id'),
+    'update_cve_table': ('update_id', 'cve_id'),
+    'bug_cve_table': ('bug_id', 'cve_id'),
+    'user_package_table': ('user_id', 'package_id'),
+    'user_group_table': ('user_id', 'group_id'),
+    'stack_group_table': ('stack_id', 'group_id'),
+    'stack_user_table': ('stack_id', 'user_id'),
+}
+
+for table, columns in sorted(ASSOCIATIONS.items()):
+    for column in columns:
+        INDEXES.append(('ix_%s_%s' % (table, column), table, [column]))
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns)
+    # Titles can outgrow a btree entry on PostgreSQL, so index their md5
+    # there, as bodhi.models.hash_index does
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('CREATE INDEX ix_updates_title_md5 ON updates (md5(title))')
+    else:
+        op.create_index('ix_updates_title', 'updates', ['title'])
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('DROP INDEX ix_updates_title_md5')
+    else:
+        op.drop_index('ix_updates_title', 'updates')
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table)
@@ -0,0 +1,111 @@
+"""Add the update_votes, update_bug_votes and update_testcase_votes tables
+
+Revision ID: 2c1a6dbd0a71
+Revises: 4df1fcd59050
+Create Date: 2015-04-22 11:05:37.281940
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '2c1a6dbd0a71'
+down_revision = '4df1fcd59050'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# The most recent non-zero value of a column amongst a user's comments
+LATEST_VOTE = """coalesce((
+    SELECT c2.{column} FROM comments c2
+    WHERE c2.update_id = c.update_id AND c2.user_id = c.user_id
+      AND NOT c2.anonymous AND c2.{column} != 0
+    ORDER BY c2.timestamp DESC, c2.id DESC LIMIT 1), 0)"""
+
+BACKFILL_VOTES = """
+INSERT INTO update_votes (update_id, user_id, karma, karma_critpath,
+                          karma_total, voted_up, voted_down)
+SELECT c.update_id, c.user_id, {karma}, {karma_critpath}, sum(c.karma),
+       max(CASE WHEN c.karma > 0 THEN 1 ELSE 0 END) = 1,
+       max(CASE WHEN c.karma < 0 THEN 1 ELSE 0 END) = 1
+FROM comments c
+WHERE NOT c.anonymous AND (c.karma != 0 OR c.karma_critpath != 0)
+GROUP BY c.update_id, c.user_id
+""".format(karma=LATEST_VOTE.format(column='karma'),
+           karma_critpath=LATEST_VOTE.format(column='karma_critpath'))
+
+# The feedback given in each user's latest comment on an update
+BACKFILL_FEEDBACK = """
+INSERT INTO {table} (update_id, user_id, {column}, karma)
+SELECT c.update_id, c.user_id, f.{column}, f.karma
+FROM comments c JOIN {feedback} f ON f.comment_id = c.id
+WHERE c.id = (
+    SELECT c2.id FROM comments c2
+    WHERE c2.update_id = c.update_id AND c2.user_id = c.user_id
+    ORDER BY c2.timestamp DESC, c2.id DESC LIMIT 1)
+"""
+
+
+def upgrade():
+    op.create_table(
+        'update_votes',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('karma', sa.Integer(), nullable=False),
+        sa.Column('karma_critpath', sa.Integer(), nullable=False),
+        sa.Column('karma_total', sa.Integer(), nullable=False),
+        sa.Column('voted_up', sa.Boolean(), nullable=False),
+        sa.Column('voted_down', sa.Boolean(), nullable=False),
+        sa.Column('update_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['update_id'], ['updates.id'],
+                                ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('update_id', 'user_id'),
+    )
+    op.create_table(
+        'update_bug_votes',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('karma', sa.Integer(), nullable=False),
+        sa.Column('update_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('bug_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['update_id'], ['updates.id'],
+                                ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.ForeignKeyConstraint(['bug_id'], ['bugs.bug_id'], ),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_update_bug_votes_update_id', 'update_bug_votes',
+                    ['update_id'])
+    op.create_table(
+        'update_testcase_votes',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('karma', sa.Integer(), nullable=False),
+        sa.Column('update_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('testcase_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['update_id'], ['updates.id'],
+                                ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.ForeignKeyConstraint(['testcase_id'], ['testcases.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_update_testcase_votes_update_id',
+                    'update_testcase_votes', ['update_id'])
+
+    op.execute(BACKFILL_VOTES)
+    op.execute(BACKFILL_FEEDBACK.format(
+        table='update_bug_votes', column='bug_id',
+        feedback='comment_bug_assoc'))
+    op.execute(BACKFILL_FEEDBACK.format(
+        table='update_testcase_votes', column='testcase_id',
+        feedback='comment_testcase_assoc'))
+
+
+def downgrade():
+    op.drop_index('ix_update_testcase_votes_update_id',
+                  'update_testcase_votes')
+    op.drop_table('update_testcase_votes')
+    op.drop_index('ix_update_bug_votes_update_id', 'update_bug_votes')
+    op.drop_table('update_bug_votes')
+    op.drop_table('update_votes')
@@ -0,0 +1,21 @@
+"""Index builds.package_id
+
+Revision ID: 2fd3a6f24e3b
+Revises: 51b8a2c5e0d4
+Create Date: 2015-04-27 10:02:56.118342
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '2fd3a6f24e3b'
+down_revision = '51b8a2c5e0d4'
+
+from alembic import op
+
+
+def upgrade():
+    op.create_index('ix_builds_package_id', 'builds', ['package_id'])
+
+
+def downgrade():
+    op.drop_index('ix_builds_package_id', 'builds')
@@ -0,0 +1,60 @@
+"""Add full-text search indexes for updates, comments and stacks
+
+Revision ID: 3a1f7d6c2b58
+Revises: 2fd3a6f24e3b
+Create Date: 2015-04-28 16:44:09.527193
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3a1f7d6c2b58'
+down_revision = '2fd3a6f24e3b'
+
+from alembic import op
+
+
+# These must match the expressions built by SearchIndex.document()
+DOCUMENTS = {
+    'updates': "coalesce(title, '') || ' ' || coalesce(notes, '')",
+    'comments': "coalesce(text, '')",
+    'stacks': "coalesce(name, '') || ' ' || coalesce(description, '')",
+}
+
+# Columns filtered with LIKE '%...%'
+TRIGRAMS = {
+    'updates': 'title',
+    'comments': 'text',
+    'stacks': 'name',
+    'users': 'name',
+}
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for table, document in DOCUMENTS.items():
+            op.execute("CREATE INDEX ix_%s_search ON %s USING gin "
+                       "(to_tsvector('english', %s))"
+                       % (table, table, document))
+        for table, column in TRIGRAMS.items():
+            op.execute('CREATE INDEX ix_%s_%s_trgm ON %s USING gin '
+                       '(%s gin_trgm_ops)' % (table, column, table, column))
+    elif bind.dialect.name == 'sqlite':
+        for table, document in DOCUMENTS.items():
+            op.execute('CREATE VIRTUAL TABLE %s_fts USING fts5(document)'
+                       % table)
+            op.execute('INSERT INTO %s_fts (rowid, document) '
+                       'SELECT id, %s FROM %s' % (table, document, table))
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        for table, column in TRIGRAMS.items():
+            op.execute('DROP INDEX ix_%s_%s_trgm' % (table, column))
+        for table in DOCUMENTS:
+            op.execute('DROP INDEX ix_%s_search' % table)
+    elif bind.dialect.name == 'sqlite':
+        for table in DOCUMENTS:
+            op.execute('DROP TABLE %s_fts' % table)
@@ -0,0 +1,38 @@
+"""Add the build_tags table
+
+Revision ID: 3cde3882442a
+Revises: 1c58aa468b17
+Create Date: 2015-04-20 10:12:42.194512
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3cde3882442a'
+down_revision = '1c58aa468b17'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('build_tags',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('nvr', sa.Unicode(length=100), nullable=False),
+        sa.Column('package_name', sa.Unicode(length=50), nullable=False),
+        sa.Column('tag', sa.Unicode(length=50), nullable=False),
+        sa.Column('koji_build_id', sa.Integer(), nullable=True),
+        sa.Column('tagged', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('nvr', 'tag')
+    )
+    op.create_index('ix_build_tags_nvr', 'build_tags', ['nvr'])
+    op.create_index('ix_build_tags_package_name', 'build_tags',
+                    ['package_name'])
+    op.create_index('ix_build_tags_tag', 'build_tags', ['tag'])
+
+
+def downgrade():
+    op.drop_index('ix_build_tags_tag', 'build_tags')
+    op.drop_index('ix_build_tags_package_name', 'build_tags')
+    op.drop_index('ix_build_tags_nvr', 'build_tags')
+    op.drop_table('build_tags')
@@ -0,0 +1,33 @@
+"""Add the release_stats table
+
+Run bodhi-rebuild-release-stats after upgrading to fill it in.
+
+Revision ID: 4c9a2b7e5d13
+Revises: 1f3f1e2b8c7a
+Create Date: 2015-05-04 11:02:17.284519
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '4c9a2b7e5d13'
+down_revision = '1f3f1e2b8c7a'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table(
+        'release_stats',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('release_id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.Unicode(length=50), nullable=False),
+        sa.Column('value', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['release_id'], ['releases.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('release_id', 'name'),
+    )
+
+
+def downgrade():
+    op.drop_table('release_stats')
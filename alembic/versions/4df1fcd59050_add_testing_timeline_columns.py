@@ -0,0 +1,84 @@
+"""Add date_testing, date_stable and date_testing_approved to updates
+
+Revision ID: 4df1fcd59050
+Revises: 3cde3882442a
+Create Date: 2015-04-21 14:32:05.514283
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '4df1fcd59050'
+down_revision = '3cde3882442a'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+BATCH_SIZE = 1000
+
+# Bodhi's own comments, which these columns used to be derived from.  There
+# is no index on comments.update_id yet, so they are gathered in one pass
+# rather than looked up for every update.
+TIMELINE = """
+INSERT INTO testing_timeline
+SELECT comments.update_id,
+    max(CASE WHEN comments.text = 'This update has been pushed to testing'
+        THEN comments.timestamp END),
+    min(CASE WHEN comments.text = 'This update has been pushed to stable'
+        THEN comments.timestamp END),
+    min(CASE WHEN comments.text LIKE :approved
+        THEN comments.timestamp END)
+FROM comments, users
+WHERE comments.user_id = users.id AND users.name = 'bodhi'
+  AND comments.update_id IS NOT NULL
+GROUP BY comments.update_id
+"""
+
+APPROVED = (u'This update has reached %days in testing and can be pushed to'
+            u' stable now if the maintainer wishes')
+
+BACKFILL = """
+UPDATE updates SET
+    date_testing = (SELECT date_testing FROM testing_timeline
+                    WHERE testing_timeline.update_id = updates.id),
+    date_stable = (SELECT date_stable FROM testing_timeline
+                   WHERE testing_timeline.update_id = updates.id),
+    date_testing_approved = (SELECT date_testing_approved
+                             FROM testing_timeline
+                             WHERE testing_timeline.update_id = updates.id)
+WHERE updates.id >= :start AND updates.id < :end
+"""
+
+
+def upgrade():
+    op.add_column('updates', sa.Column('date_testing', sa.DateTime(),
+                                       nullable=True))
+    op.add_column('updates', sa.Column('date_stable', sa.DateTime(),
+                                       nullable=True))
+    op.add_column('updates', sa.Column('date_testing_approved', sa.DateTime(),
+                                       nullable=True))
+    op.create_index('ix_updates_date_testing', 'updates', ['date_testing'])
+    op.create_index('ix_updates_date_stable', 'updates', ['date_stable'])
+
+    op.create_table(
+        'testing_timeline',
+        sa.Column('update_id', sa.Integer(), primary_key=True),
+        sa.Column('date_testing', sa.DateTime()),
+        sa.Column('date_stable', sa.DateTime()),
+        sa.Column('date_testing_approved', sa.DateTime()),
+    )
+    connection = op.get_bind()
+    connection.execute(sa.text(TIMELINE), approved=APPROVED)
+    max_id = connection.execute('SELECT max(id) FROM updates').scalar() or 0
+    for start in range(0, max_id + 1, BATCH_SIZE):
+        connection.execute(sa.text(BACKFILL), start=start,
+                           end=start + BATCH_SIZE)
+    op.drop_table('testing_timeline')
+
+
+def downgrade():
+    op.drop_index('ix_updates_date_stable', 'updates')
+    op.drop_index('ix_updates_date_testing', 'updates')
+    op.drop_column('updates', 'date_testing_approved')
+    op.drop_column('updates', 'date_stable')
+    op.drop_column('updates', 'date_testing')
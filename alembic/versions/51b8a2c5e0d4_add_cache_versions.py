@@ -0,0 +1,29 @@
+"""Add the cache_versions table
+
+Revision ID: 51b8a2c5e0d4
+Revises: 13cfca635b99
+Create Date: 2015-04-24 15:20:41.602815
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '51b8a2c5e0d4'
+down_revision = '13cfca635b99'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table(
+        'cache_versions',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.Unicode(length=50), nullable=False),
+        sa.Column('value', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('name'),
+    )
+
+
+def downgrade():
+    op.drop_table('cache_versions')
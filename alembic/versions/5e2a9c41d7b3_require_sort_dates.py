@@ -0,0 +1,51 @@
+"""Make updates.date_submitted and comments.timestamp NOT NULL
+
+The list views page through updates and comments by these columns, which
+they can only do straight from their indexes if no row lacks a date.
+
+Revision ID: 5e2a9c41d7b3
+Revises: 4c9a2b7e5d13
+Create Date: 2015-05-05 10:14:52.604187
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '5e2a9c41d7b3'
+down_revision = '4c9a2b7e5d13'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# An update without a date was submitted no later than its first comment
+BACKFILL_UPDATES = """
+UPDATE updates SET date_submitted = coalesce(
+    (SELECT min(comments.timestamp) FROM comments
+     WHERE comments.update_id = updates.id),
+    updates.date_modified, CURRENT_TIMESTAMP)
+WHERE updates.date_submitted IS NULL
+"""
+
+BACKFILL_COMMENTS = """
+UPDATE comments SET timestamp = coalesce(
+    (SELECT updates.date_submitted FROM updates
+     WHERE updates.id = comments.update_id),
+    CURRENT_TIMESTAMP)
+WHERE comments.timestamp IS NULL
+"""
+
+
+def upgrade():
+    op.execute(BACKFILL_UPDATES)
+    op.execute(BACKFILL_COMMENTS)
+    op.alter_column('updates', 'date_submitted', existing_type=sa.DateTime(),
+                    nullable=False)
+    op.alter_column('comments', 'timestamp', existing_type=sa.DateTime(),
+                    nullable=False)
+
+
+def downgrade():
+    op.alter_column('comments', 'timestamp', existing_type=sa.DateTime(),
+                    nullable=True)
+    op.alter_column('updates', 'date_submitted', existing_type=sa.DateTime(),
+                    nullable=True)
@@ -0,0 +1,23 @@
+"""Add updates.related_version
+
+Revision ID: 7b1d3e5f9a24
+Revises: 5e2a9c41d7b3
+Create Date: 2015-05-05 15:42:08.319426
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '7b1d3e5f9a24'
+down_revision = '5e2a9c41d7b3'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('updates', sa.Column('related_version', sa.Integer(),
+                                       nullable=False, server_default='0'))
+
+
+def downgrade():
+    op.drop_column('updates', 'related_version')
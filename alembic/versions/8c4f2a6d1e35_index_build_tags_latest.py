@@ -0,0 +1,22 @@
+"""Index build_tags for finding the latest build of each package in a tag
+
+Revision ID: 8c4f2a6d1e35
+Revises: 7b1d3e5f9a24
+Create Date: 2015-05-06 09:27:41.882015
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '8c4f2a6d1e35'
+down_revision = '7b1d3e5f9a24'
+
+from alembic import op
+
+
+def upgrade():
+    op.create_index('ix_build_tags_tag_package_tagged', 'build_tags',
+                    ['tag', 'package_name', 'tagged'])
+
+
+def downgrade():
+    op.drop_index('ix_build_tags_tag_package_tagged', 'build_tags')
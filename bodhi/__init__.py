@@ -13,7 +13,6 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
 from collections import defaultdict
-from dogpile.cache import make_region
 from sqlalchemy import engine_from_config
 
 from pyramid.settings import asbool
@@ -47,16 +46,15 @@ def get_dbsession(request):
 
 
 def get_cacheregion(request):
-    region = make_region()
-    region.configure_from_config(request.registry.settings, "dogpile.cache.")
-    return region
+    from bodhi.cache import cache
+    return cache.region
 
 
 def get_user(request):
     from bodhi.models import User
     userid = unauthenticated_userid(request)
     if userid is not None:
-        return request.db.query(User).filter_by(name=unicode(userid)).first()
+        return User.get(unicode(userid), request.db)
 
 
 def groupfinder(userid, request):
@@ -105,6 +103,11 @@ def main(global_config, testing=None, **settings):
     # Setup our buildsystem
     buildsys.setup_buildsystem(settings)
 
+    from bodhi.cache import setup_cache
+    from bodhi.pagination import setup_count_cache
+    setup_cache(settings)
+    setup_count_cache(settings)
+
     # Sessions & Caching
     from pyramid.session import SignedCookieSessionFactory
     session_factory = SignedCookieSessionFactory(settings['session.secret'])
@@ -12,10 +12,22 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
+import copy
+import gzip
+import json
 import time
+import uuid
+import hashlib
+import Queue
 import logging
+import threading
 
-from os.path import join, expanduser
+from collections import OrderedDict
+from os.path import join, expanduser, exists
+
+from dogpile.cache import make_region
+from dogpile.cache.api import NO_VALUE
+from pyramid.settings import asbool
 
 log = logging.getLogger(__name__)
 
@@ -29,6 +41,9 @@ except ImportError:
 # URL of the koji hub
 _koji_hub = None
 
+# Defaults for the MulticallExecutor, overridden by koji_multicall.* settings
+multicall_defaults = {'chunk_size': 100, 'workers': 4, 'retries': 2}
+
 
 class Buildsystem:
     """
@@ -288,6 +303,660 @@ class DevBuildsys(Buildsystem):
         }
 
 
+class BoundedDict(object):
+    """
+    A dictionary that forgets its least recently used entries once it holds
+    more than ``size``, to be the ``cache_dict`` of a memory backed region.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._entries.pop(key)
+            except KeyError:
+                return default
+            self._entries[key] = value
+            return value
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = value
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._entries.pop(key, default)
+
+
+def _memory_region(expiration_time=300, max_entries=10000):
+    return make_region().configure(
+        'dogpile.cache.memory', expiration_time=expiration_time,
+        arguments={'cache_dict': BoundedDict(max_entries)})
+
+
+class KojiCache(object):
+    """
+    A read-through cache of Koji responses.
+
+    Responses are stored in a dogpile region, so pointing the region at a
+    shared backend (memcached, dbm) shares the cache between processes.
+    Without one, the region keeps the ``max_entries`` most recently used
+    responses of this process.  Methods fall into two policies:
+
+    * Immutable data (``getBuild``, ``listBuildRPMs``, ``getRPMHeaders``) is
+      cached forever.
+    * Tag membership (``listTags``, ``listTagged``, ``listPackages``) is
+      cached for the region's ``expiration_time``, and is additionally
+      invalidated whenever the build or tag it depends upon changes.
+
+    Invalidation works by bumping a generation token for a build or tag.
+    Each cached entry remembers the generations that were current before
+    Koji was asked, and is treated as a miss once any of them has moved on.
+    Builds and tags are known by NVR and name there, so tag membership is
+    only cached for calls naming them that way (build ids are looked up).
+
+    Tag membership changes underneath us whenever another process (the
+    masher, a packager running ``koji tag-build``) touches a tag, and those
+    changes only reach us through the koji fedmsg consumer.  Tag methods are
+    therefore only cached when ``shared`` is set, meaning the region lives in
+    a backend that the consumer's invalidations also reach.
+    """
+    permanent_methods = ('getBuild', 'listBuildRPMs', 'getRPMHeaders')
+    tag_methods = ('listTags', 'listTagged', 'listPackages')
+
+    # The keyword of each method's first argument
+    first_arguments = {
+        'getBuild': 'buildInfo',
+        'listBuildRPMs': 'buildID',
+        'getRPMHeaders': 'rpmID',
+        'listTags': 'build',
+        'listTagged': 'tag',
+        'listPackages': 'tagID',
+    }
+
+    def __init__(self, region=None, shared=False):
+        if region is None:
+            region = _memory_region()
+        self.region = region
+        self.shared = shared
+
+    def cacheable(self, method):
+        """ Return whether responses to this method may be cached """
+        if method in self.tag_methods:
+            return self.shared
+        return method in self.permanent_methods
+
+    def normalize(self, method, args, kw, nvr_of=None):
+        """
+        Return the arguments of a call in the form its cache entry is kept
+        under, with the first argument passed positionally, or None if it
+        can't be cached.  Tag methods must name their build by NVR, or have
+        ``nvr_of`` look up its id, and their tag by name.
+        """
+        args, kw = tuple(args), dict(kw)
+        name = self.first_arguments.get(method)
+        if not args and name in kw:
+            args = (kw.pop(name),)
+        if method not in self.tag_methods:
+            return args, kw
+        subject = args[0] if args else None
+        if method == 'listTags' and isinstance(subject, (int, long)) \
+                and nvr_of is not None:
+            subject = nvr_of(subject)
+            args = (subject,) + args[1:]
+        if not isinstance(subject, basestring):
+            return None
+        return args, kw
+
+    def _key(self, method, args, kw):
+        arguments = repr((args, sorted(kw.items())))
+        return 'koji:%s:%s' % (method, hashlib.sha1(arguments).hexdigest())
+
+    def _generation_key(self, kind, name):
+        return 'koji-generation:%s:%s' % (
+            kind, hashlib.sha1(repr(name)).hexdigest())
+
+    def _generations(self, dependencies):
+        generations = []
+        for kind, name in dependencies:
+            value = self.region.get(self._generation_key(kind, name),
+                                    ignore_expiration=True)
+            generations.append(None if value is NO_VALUE else value)
+        return generations
+
+    def dependencies(self, method, args):
+        """ Return the (kind, name) pairs a cached response depends upon """
+        if method == 'listTags':
+            return [('build', args[0])]
+        elif method in ('listTagged', 'listPackages'):
+            return [('tag', args[0])]
+        return []
+
+    def get_or_create(self, method, args, kw, creator):
+        """
+        Return the cached response to a call normalized by :meth:`normalize`,
+        calling ``creator`` for it on a miss.
+        """
+        # Read the generations first, so that an invalidation arriving while
+        # Koji answers leaves the response stale
+        generations = self._generations(self.dependencies(method, args))
+        key = self._key(method, args, kw)
+        stored = self.region.get(
+            key, ignore_expiration=method in self.permanent_methods)
+        if stored is not NO_VALUE and stored[0] == generations:
+            return copy.deepcopy(stored[1])
+        value = creator()
+        if value is not None:
+            self.region.set(key, (generations, copy.deepcopy(value)))
+        return value
+
+    def invalidate(self, build=None, tag=None):
+        """ Invalidate everything that depends on a given build and/or tag """
+        for kind, name in (('build', build), ('tag', tag)):
+            if name is not None:
+                log.debug('Invalidating cached koji %s %s' % (kind, name))
+                self.region.set(self._generation_key(kind, name),
+                                uuid.uuid4().hex)
+
+
+# The process-wide Koji response cache, configured by setup_buildsystem
+koji_cache = KojiCache()
+
+
+class CachedBuildsystem(Buildsystem):
+    """
+    A buildsystem that answers read-only Koji queries from the
+    :data:`koji_cache` and invalidates it when bodhi itself tags, untags or
+    moves builds.
+
+    While the wrapped session is in multicall mode, calls are queued by Koji
+    and their results come back from ``multiCall``, so reads bypass the cache
+    and invalidations are held back until ``multiCall`` has run the queue.
+    Invalidating only once Koji has answered keeps a concurrent reader from
+    caching the old tag membership in between.
+    """
+
+    def __init__(self, session, cache=None):
+        self.__dict__['_session'] = session
+        self.__dict__['_cache'] = cache or koji_cache
+        self.__dict__['_pending'] = []
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._session, name, value)
+
+    def _cached(self, method, *args, **kw):
+        call = getattr(self._session, method)
+        if getattr(self._session, 'multicall', False) or \
+                not self._cache.cacheable(method):
+            return call(*args, **kw)
+        normalized = self._cache.normalize(method, args, kw, self._nvr_of)
+        if normalized is None:
+            return call(*args, **kw)
+        return self._cache.get_or_create(method, normalized[0],
+                                         normalized[1],
+                                         lambda: call(*args, **kw))
+
+    def _nvr_of(self, build_id):
+        build = self.getBuild(build_id)
+        return build and build['nvr']
+
+    def getBuild(self, *args, **kw):
+        return self._cached('getBuild', *args, **kw)
+
+    def listBuildRPMs(self, *args, **kw):
+        return self._cached('listBuildRPMs', *args, **kw)
+
+    def getRPMHeaders(self, *args, **kw):
+        return self._cached('getRPMHeaders', *args, **kw)
+
+    def listTags(self, *args, **kw):
+        return self._cached('listTags', *args, **kw)
+
+    def listTagged(self, *args, **kw):
+        return self._cached('listTagged', *args, **kw)
+
+    def listPackages(self, *args, **kw):
+        return self._cached('listPackages', *args, **kw)
+
+    def _invalidate_after(self, call, args, kw, changes):
+        try:
+            return call(*args, **kw)
+        finally:
+            if getattr(self._session, 'multicall', False):
+                self._pending.extend(changes)
+            else:
+                for build, tag in changes:
+                    self._cache.invalidate(build=build, tag=tag)
+
+    def tagBuild(self, tag, build, *args, **kw):
+        return self._invalidate_after(self._session.tagBuild,
+                                      (tag, build) + args, kw, [(build, tag)])
+
+    def untagBuild(self, tag, build, *args, **kw):
+        return self._invalidate_after(self._session.untagBuild,
+                                      (tag, build) + args, kw, [(build, tag)])
+
+    def moveBuild(self, from_tag, to_tag, build, *args, **kw):
+        return self._invalidate_after(self._session.moveBuild,
+                                      (from_tag, to_tag, build) + args, kw,
+                                      [(build, from_tag), (None, to_tag)])
+
+    def getLatestBuilds(self, *args, **kw):
+        return self._session.getLatestBuilds(*args, **kw)
+
+    def ssl_login(self, *args, **kw):
+        return self._session.ssl_login(*args, **kw)
+
+    def taskFinished(self, *args, **kw):
+        return self._session.taskFinished(*args, **kw)
+
+    def multiCall(self, *args, **kw):
+        try:
+            return self._session.multiCall(*args, **kw)
+        finally:
+            pending, self.__dict__['_pending'] = self._pending, []
+            for build, tag in pending:
+                self._cache.invalidate(build=build, tag=tag)
+
+    def getTag(self, *args, **kw):
+        return self._session.getTag(*args, **kw)
+
+
+def _corpus_key(method, args, kw):
+    return json.dumps([method, args, kw], sort_keys=True)
+
+
+def _passthrough(method):
+    """ Return a method that hands a call over to ``self._call`` """
+    def call(self, *args, **kw):
+        return self._call(method, args, kw)
+    call.__name__ = method
+    return call
+
+
+class RecordingBuildsystem(Buildsystem):
+    """
+    A buildsystem that passes every call through to a real Koji session and
+    appends the responses to a gzipped corpus of JSON lines, for later use
+    by the :class:`ReplayBuildsystem`.
+
+    Calls queued in multicall mode are recorded once ``multiCall`` returns,
+    each with its own result or fault.
+    """
+    _lock = threading.Lock()
+
+    def __init__(self, session, corpus):
+        self.__dict__['_session'] = session
+        self.__dict__['_corpus'] = corpus
+        self.__dict__['_queued'] = []
+
+    def __setattr__(self, name, value):
+        setattr(self._session, name, value)
+
+    def __getattr__(self, name):
+        attr = getattr(self._session, name)
+        if not callable(attr):
+            return attr
+        return lambda *args, **kw: self._call(name, args, kw)
+
+    def _call(self, method, args, kw):
+        result = getattr(self._session, method)(*args, **kw)
+        if getattr(self._session, 'multicall', False):
+            self._queued.append((method, args, kw))
+        else:
+            self._record([(method, args, kw, {'result': result})])
+        return result
+
+    def multiCall(self, *args, **kw):
+        results = self._session.multiCall(*args, **kw)
+        queued, self.__dict__['_queued'] = self._queued, []
+        entries = []
+        for (method, args_, kw_), result in zip(queued, results or []):
+            if isinstance(result, dict):
+                entries.append((method, args_, kw_, {'fault': result}))
+            else:
+                entries.append((method, args_, kw_, {'result': result[0]}))
+        self._record(entries)
+        return results
+
+    def _record(self, entries):
+        lines = []
+        for method, args, kw, response in entries:
+            response['call'] = _corpus_key(method, args, kw)
+            lines.append(json.dumps(response) + '\n')
+        with self._lock:
+            corpus = gzip.open(self._corpus, 'ab')
+            try:
+                corpus.writelines(lines)
+            finally:
+                corpus.close()
+
+    getBuild = _passthrough('getBuild')
+    getLatestBuilds = _passthrough('getLatestBuilds')
+    moveBuild = _passthrough('moveBuild')
+    ssl_login = _passthrough('ssl_login')
+    listBuildRPMs = _passthrough('listBuildRPMs')
+    listTags = _passthrough('listTags')
+    listTagged = _passthrough('listTagged')
+    taskFinished = _passthrough('taskFinished')
+    tagBuild = _passthrough('tagBuild')
+    untagBuild = _passthrough('untagBuild')
+    getTag = _passthrough('getTag')
+
+
+class ReplayBuildsystem(Buildsystem):
+    """
+    A buildsystem that answers calls from a corpus recorded by the
+    :class:`RecordingBuildsystem`, without any network access.
+
+    Each call sleeps for the configured latency (per method, falling back to
+    the ``None`` default) to emulate a real Koji hub.  Multicalls are queued
+    and answered in a single round trip like Koji does, with a fault for each
+    call that was never recorded.  Tag operations that were not recorded get
+    fake task ids, which are reported as successfully finished.
+    """
+    task_methods = ('tagBuild', 'untagBuild', 'moveBuild')
+    _task_ids = iter(xrange(1, 2 ** 31))
+
+    def __init__(self, corpus, latency=None):
+        self._corpus = corpus
+        self._latency = latency or {}
+        self._queued = []
+        self.multicall = False
+
+    @classmethod
+    def load(cls, filename):
+        """ Load a corpus file into a dictionary of call -> response """
+        corpus = {}
+        if not exists(filename):
+            log.warn('Koji corpus %s does not exist' % filename)
+            return corpus
+        infile = gzip.open(filename, 'rb')
+        try:
+            for line in infile:
+                entry = json.loads(line)
+                corpus[entry.pop('call')] = entry
+        finally:
+            infile.close()
+        log.info('Loaded %d recorded koji responses' % len(corpus))
+        return corpus
+
+    def _sleep(self, method):
+        latency = self._latency.get(method, self._latency.get(None, 0))
+        if latency:
+            time.sleep(latency)
+
+    def _lookup(self, method, args, kw):
+        entry = self._corpus.get(_corpus_key(method, args, kw))
+        if entry is None:
+            if method in self.task_methods:
+                return {'result': next(self._task_ids)}
+            return {'fault': {
+                'faultCode': 1000,
+                'faultString': 'No recorded response for %s(%s)' % (
+                    method, ', '.join(map(repr, args)))}}
+        return entry
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return lambda *args, **kw: self._call(name, args, kw)
+
+    def _call(self, method, args, kw):
+        if self.multicall:
+            self._queued.append((method, args, kw))
+            return None
+        self._sleep(method)
+        entry = self._lookup(method, args, kw)
+        if 'fault' in entry:
+            raise Exception(entry['fault']['faultString'])
+        return copy.deepcopy(entry['result'])
+
+    def multiCall(self):
+        queued, self._queued = self._queued, []
+        self.multicall = False
+        self._sleep('multiCall')
+        results = []
+        for method, args, kw in queued:
+            entry = self._lookup(method, args, kw)
+            if 'fault' in entry:
+                results.append(entry['fault'])
+            else:
+                results.append([copy.deepcopy(entry['result'])])
+        return results
+
+    def taskFinished(self, task):
+        entry = self._corpus.get(_corpus_key('taskFinished', (task,), {}))
+        return entry['result'] if entry else True
+
+    def getTaskInfo(self, task):
+        entry = self._corpus.get(_corpus_key('getTaskInfo', (task,), {}))
+        return entry['result'] if entry else {'state': 2}  # CLOSED
+
+    getBuild = _passthrough('getBuild')
+    getLatestBuilds = _passthrough('getLatestBuilds')
+    moveBuild = _passthrough('moveBuild')
+    ssl_login = _passthrough('ssl_login')
+    listBuildRPMs = _passthrough('listBuildRPMs')
+    listTags = _passthrough('listTags')
+    listTagged = _passthrough('listTagged')
+    tagBuild = _passthrough('tagBuild')
+    untagBuild = _passthrough('untagBuild')
+    getTag = _passthrough('getTag')
+
+
+class MulticallExecutor(object):
+    """
+    Run a batch of Koji calls as a series of bounded multicalls.
+
+    Queued calls are split into chunks of ``chunk_size``, and up to
+    ``workers`` chunks are in flight at once, each on a session of its own.
+    Sessions are logged in once and reused for every chunk and retry.
+    Results are mapped back to the call that produced them.  Calls that fault
+    (or whose whole chunk failed) are retried on their own, up to ``retries``
+    times, and whatever still fails after that is listed in ``failures`` as
+    ``((method, args, kw), fault)`` tuples.
+
+    When a whole chunk fails we cannot tell which of its calls Koji ran
+    before the error, so tag changes from it are not blindly re-issued.
+    The build's current tags are checked first, and a change that already
+    took effect counts as done (with a ``None`` result, as its task id was
+    lost along with the response).  The lost call may still be running, so
+    a change issued again can fail because the first one got there after
+    all; :meth:`wait_for_tasks` checks the tags again before reporting such
+    a failure.
+
+    Buildsystems that do not return multicall results (like the DevBuildsys)
+    simply yield ``None`` for every call.
+    """
+
+    tag_methods = ('tagBuild', 'untagBuild', 'moveBuild')
+
+    def __init__(self, chunk_size=None, workers=None, retries=None,
+                 session_factory=None):
+        self.chunk_size = chunk_size or multicall_defaults['chunk_size']
+        self.workers = workers or multicall_defaults['workers']
+        if retries is None:
+            retries = multicall_defaults['retries']
+        self.retries = retries
+        self.session_factory = session_factory or get_session
+        self.calls = []
+        self.failures = []
+        self._idle = []
+        self._reissued = set()
+
+    def add(self, method, *args, **kw):
+        """ Queue a call, returning its index in the results """
+        self.calls.append((method, args, kw))
+        return len(self.calls) - 1
+
+    def run(self):
+        """ Execute all of the queued calls and return their results """
+        results = [None] * len(self.calls)
+        faults = {}
+        lost = set()
+        pending = range(len(self.calls))
+        for attempt in range(self.retries + 1):
+            if attempt:
+                log.info('Retrying %d failed koji calls' % len(pending))
+                pending = self._unapplied(pending, faults, lost)
+            self._execute(pending, results, faults, lost)
+            pending = sorted(faults)
+            if not pending:
+                break
+        self.failures = [(self.calls[i], faults[i]) for i in pending]
+        for call, fault in self.failures:
+            log.error('Koji call %s%r failed: %s' % (
+                call[0], call[1], fault.get('faultString')))
+        return results
+
+    def wait_for_tasks(self, results, sleep=300):
+        """
+        Wait for the tasks in the results of :meth:`run` to complete, and
+        return those that failed.
+        """
+        session = self._checkout()
+        try:
+            failed = wait_for_tasks(results, sleep, session=session)
+            calls = dict((task, i) for i, task in enumerate(results) if task)
+            for task in list(failed):
+                i = calls[task]
+                if i not in self._reissued:
+                    continue
+                method, args, kw = self.calls[i]
+                if self._applied(session, method, args):
+                    log.info('Koji task %d failed, but %s%r took effect' % (
+                        task, method, args))
+                    failed.remove(task)
+        finally:
+            self._checkin(session)
+        return failed
+
+    def _checkout(self):
+        """ Take an idle session, or log in a new one """
+        try:
+            return self._idle.pop()
+        except IndexError:
+            return self.session_factory()
+
+    def _checkin(self, session):
+        session.multicall = False
+        self._idle.append(session)
+
+    def _unapplied(self, indexes, faults, lost):
+        """
+        Return the calls that should be issued again.
+
+        Tag changes lost along with their chunk are checked against the
+        build's tags, and are only returned if they did not take effect.
+        Those we cannot check right now are held back for the next attempt.
+        """
+        retry = []
+        session = self._checkout()
+        for i in indexes:
+            method, args, kw = self.calls[i]
+            if i not in lost or method not in self.tag_methods:
+                retry.append(i)
+                continue
+            try:
+                applied = self._applied(session, method, args)
+            except Exception, e:
+                log.exception('Unable to check koji tags for %s%r' % (
+                    method, args))
+                faults[i] = {'faultCode': None, 'faultString': str(e)}
+                continue
+            if applied:
+                log.info('Koji already ran %s%r' % (method, args))
+                faults.pop(i)
+                lost.discard(i)
+            else:
+                self._reissued.add(i)
+                retry.append(i)
+        self._checkin(session)
+        return retry
+
+    def _applied(self, session, method, args):
+        """ Return whether a tag change is reflected in the build's tags """
+        if method == 'moveBuild':
+            from_tag, to_tag, build = args[:3]
+        else:
+            tag, build = args[:2]
+        tags = set()
+        for info in session.listTags(build) or []:
+            tags.update([info['name'], info['id']])
+        if method == 'tagBuild':
+            return tag in tags
+        elif method == 'untagBuild':
+            return tag not in tags
+        return to_tag in tags and from_tag not in tags
+
+    def _execute(self, indexes, results, faults, lost):
+        chunks = [indexes[i:i + self.chunk_size]
+                  for i in range(0, len(indexes), self.chunk_size)]
+        if len(chunks) <= 1 or self.workers <= 1:
+            session = self._checkout()
+            for chunk in chunks:
+                self._execute_chunk(chunk, session, results, faults, lost)
+            self._checkin(session)
+            return
+        queue = Queue.Queue()
+        for chunk in chunks:
+            queue.put(chunk)
+
+        def worker():
+            session = self._checkout()
+            while True:
+                try:
+                    chunk = queue.get_nowait()
+                except Queue.Empty:
+                    self._checkin(session)
+                    return
+                self._execute_chunk(chunk, session, results, faults, lost)
+
+        threads = [threading.Thread(target=worker)
+                   for i in range(min(self.workers, len(chunks)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def _execute_chunk(self, chunk, session, results, faults, lost):
+        for i in chunk:
+            faults.pop(i, None)
+            lost.discard(i)
+        try:
+            session.multicall = True
+            for i in chunk:
+                method, args, kw = self.calls[i]
+                getattr(session, method)(*args, **kw)
+            responses = session.multiCall() or []
+        except Exception, e:
+            log.exception('Koji multicall of %d calls failed' % len(chunk))
+            session.multicall = False
+            for i in chunk:
+                faults[i] = {'faultCode': None, 'faultString': str(e)}
+                lost.add(i)
+            return
+        for i, response in zip(chunk, responses):
+            if isinstance(response, dict):
+                faults[i] = response
+            else:
+                results[i] = response[0]
+
+
 def koji_login(config):
     """ Login to Koji and return the session """
     koji_client = koji.ClientSession(_koji_hub, {})
@@ -323,23 +992,67 @@ def setup_buildsystem(settings):
     _koji_hub = settings.get('koji_hub')
     buildsys = settings.get('buildsystem')
 
+    for key in multicall_defaults:
+        if settings.get('koji_multicall.' + key):
+            multicall_defaults[key] = int(settings['koji_multicall.' + key])
+
     if buildsys == 'koji':
         log.debug('Using Koji Buildsystem')
-        _buildsystem = lambda: koji_login(config=settings)
+        if asbool(settings.get('koji_cache.enabled', True)):
+            setup_koji_cache(settings)
+            _buildsystem = lambda: CachedBuildsystem(
+                koji_login(config=settings))
+        else:
+            _buildsystem = lambda: koji_login(config=settings)
+
+    elif buildsys == 'record':
+        corpus = settings['koji_replay.corpus']
+        log.debug('Recording Koji responses to %s' % corpus)
+        _buildsystem = lambda: RecordingBuildsystem(
+            koji_login(config=settings), corpus)
+
+    elif buildsys == 'replay':
+        corpus = ReplayBuildsystem.load(settings['koji_replay.corpus'])
+        latency = {None: float(settings.get('koji_replay.latency', 0))}
+        for key, value in settings.items():
+            if key.startswith('koji_replay.latency.'):
+                latency[key[len('koji_replay.latency.'):]] = float(value)
+        log.debug('Replaying recorded Koji responses')
+        _buildsystem = lambda: ReplayBuildsystem(corpus, latency)
 
     elif buildsys in ('dev', 'dummy', None):
         log.debug('Using DevBuildsys')
         _buildsystem = DevBuildsys
 
 
-def wait_for_tasks(tasks, sleep=300):
+def setup_koji_cache(settings):
+    """
+    Configure the :data:`koji_cache` region from ``koji_cache.*``.
+
+    Without a ``koji_cache.backend`` the region is private to this process,
+    which no tag message can reach, so only immutable build data is cached,
+    up to ``koji_cache.max_entries`` responses.
+    """
+    shared = bool(settings.get('koji_cache.backend'))
+    if shared:
+        region = make_region()
+        region.configure_from_config(settings, 'koji_cache.')
+    else:
+        region = _memory_region(
+            int(settings.get('koji_cache.expiration_time', 300)),
+            int(settings.get('koji_cache.max_entries', 10000)))
+    koji_cache.region = region
+    koji_cache.shared = shared
+
+
+def wait_for_tasks(tasks, sleep=300, session=None):
     """
     Wait for a list of koji tasks to complete.  Return the first task number
     to fail, otherwise zero.
     """
     log.debug("Waiting for %d tasks to complete: %s" % (len(tasks), tasks))
     failed_tasks = []
-    session = get_session()
+    session = session or get_session()
     for task in tasks:
         if not task:
             log.debug("Skipping task: %s" % task)
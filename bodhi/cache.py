@@ -0,0 +1,174 @@
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+The process-wide cache of data and rendered pages.
+
+Entries belong to namespaces, such as ``frontpage``, ``updates`` (the update
+list) or ``update:<title or alias>``.  The models invalidate the namespaces a
+change affects (see the events at the end of :mod:`bodhi.models.models`), so
+cached pages are only ever as old as the last change to the updates, comments,
+bugs, builds, overrides and users they show.  Pages showing updates also
+belong to ``releases`` and ``groups``, which any change to a release or group
+invalidates.  Set ``dogpile.cache.backend`` to a shared backend for
+invalidations made by the masher to be seen by the web application.
+"""
+
+import uuid
+import hashlib
+import logging
+
+from dogpile.cache import make_region
+from dogpile.cache.api import NO_VALUE
+from pyramid.response import Response
+from pyramid.security import unauthenticated_userid
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+log = logging.getLogger(__name__)
+
+
+class Cache(object):
+    """
+    A dogpile region whose entries are invalidated by namespace.
+
+    Like :class:`bodhi.buildsys.KojiCache`, invalidation works by bumping a
+    generation token per namespace.  Each entry remembers the generations it
+    was computed under, and is treated as a miss once any of them has moved
+    on.
+    """
+
+    def __init__(self, region=None):
+        if region is None:
+            region = make_region().configure('dogpile.cache.memory',
+                                             expiration_time=300)
+        self.region = region
+
+    def _key(self, kind, namespace, key=''):
+        # Titles have spaces, which some backends don't allow in keys
+        return '%s:%s%s' % (
+            kind, hashlib.sha1(namespace.encode('utf-8')).hexdigest(), key)
+
+    def generations(self, namespaces):
+        generations = []
+        for namespace in namespaces:
+            value = self.region.get(self._key('generation', namespace),
+                                    ignore_expiration=True)
+            generations.append(None if value is NO_VALUE else value)
+        return generations
+
+    def get(self, key, namespaces):
+        """ Return the value cached under key, or ``NO_VALUE`` """
+        stored = self.region.get(self._key('cache', namespaces[0], key))
+        if stored is NO_VALUE or stored[0] != self.generations(namespaces):
+            return NO_VALUE
+        return stored[1]
+
+    def set(self, key, namespaces, value, generations=None):
+        if generations is None:
+            generations = self.generations(namespaces)
+        self.region.set(self._key('cache', namespaces[0], key),
+                        (generations, value))
+
+    def get_or_create(self, key, creator, namespaces):
+        """ Return the value cached under key, calling creator on a miss """
+        generations = self.generations(namespaces)
+        value = self.get(key, namespaces)
+        if value is NO_VALUE:
+            value = creator()
+            self.set(key, namespaces, value, generations)
+        return value
+
+    def invalidate(self, *namespaces):
+        """ Invalidate everything cached in these namespaces """
+        for namespace in namespaces:
+            log.debug('Invalidating cached %s' % namespace)
+            self.region.set(self._key('generation', namespace),
+                            uuid.uuid4().hex)
+
+    def invalidate_with(self, session, *namespaces):
+        """
+        Invalidate namespaces that a session has written to.
+
+        They are invalidated right away, and again when the transaction is
+        over so that nothing cached in the meantime, from data that did not
+        include the change yet, outlives it.
+        """
+        self.invalidate(*namespaces)
+        if session is not None:
+            session.info.setdefault('cache_namespaces', set()).update(
+                namespaces)
+
+
+# The process-wide cache, configured by setup_cache
+cache = Cache()
+
+
+def setup_cache(settings):
+    """ Configure the :data:`cache` from the ``dogpile.cache.*`` settings """
+    region = make_region()
+    if settings.get('dogpile.cache.backend'):
+        region.configure_from_config(settings, 'dogpile.cache.')
+    else:
+        region.configure('dogpile.cache.memory', expiration_time=int(
+            settings.get('dogpile.cache.expiration_time', 300)))
+    cache.region = region
+
+
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_rollback')
+def _invalidate_written_namespaces(session):
+    cache.invalidate(*session.info.pop('cache_namespaces', ()))
+
+
+def cached_view(*namespaces):
+    """
+    A view decorator that serves GET requests from the :data:`cache`.
+
+    Namespaces are formatted with the matchdict of the route, so
+    ``update:%(id)s`` is the namespace of the update in the URL.  Rendered
+    responses are cached per URL, Accept header and user, and only when they
+    are plain 200s that don't set cookies.
+    """
+    def decorator(view):
+        def wrapper(context, request):
+            if request.method != 'GET' or request.session.peek_flash():
+                return view(context, request)
+
+            names = [namespace % request.matchdict for namespace in namespaces]
+            key = ':view:%s' % hashlib.sha1(repr((
+                request.path_qs,
+                request.headers.get('Accept'),
+                unauthenticated_userid(request),
+            ))).hexdigest()
+
+            stored = cache.get(key, names)
+            if stored is not NO_VALUE:
+                status, headerlist, body = stored
+                response = Response(status=status, headerlist=list(headerlist),
+                                    body=body)
+                # Answer If-None-Match and If-Modified-Since from the cached
+                # ETag and Last-Modified, if the page has them
+                response.conditional_response = True
+                return response
+
+            generations = cache.generations(names)
+            response = view(context, request)
+            if response.status_int == 200 and \
+                    'Set-Cookie' not in response.headers:
+                cache.set(key, names, (response.status, response.headerlist,
+                                       response.body), generations)
+            return response
+        return wrapper
+    return decorator
@@ -13,6 +13,7 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
 import os
+import json
 
 import click
 
@@ -90,6 +91,34 @@ def query(**kwargs):
     print_resp(resp)
 
 
+@cli.command()
+@click.argument('kind', default='updates',
+                type=click.Choice(['updates', 'comments']))
+@click.option('--releases', help='Only export these releases')
+@click.option('--status', help='Only export updates with this status',
+              type=click.Choice(['pending', 'testing', 'stable', 'obsolete',
+                                 'unpushed', 'processing']))
+@click.option('--modified-since',
+              help='Only export what changed after a specific timestamp')
+@click.option('--after', help='Resume an export after this cursor')
+@click.option('--output', type=click.File('w'), default='-',
+              help='Write the export to this file')
+def export(kind, output, **kwargs):
+    """ Export updates or comments as newline delimited JSON """
+    client = BodhiClient()
+    params = dict((key, value) for key, value in kwargs.items()
+                  if value is not None)
+    cursor = None
+    try:
+        for cursor, obj in client.export(kind, **params):
+            output.write(json.dumps(obj) + '\n')
+    except Exception as e:
+        click.echo('Export interrupted: %s' % e, err=True)
+        if cursor:
+            click.echo('Resume it with --after %s' % cursor, err=True)
+        raise SystemExit(1)
+
+
 def print_resp(resp):
     if resp.status_code == 200:
         try:
@@ -12,6 +12,10 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
+import json
+
+from urlparse import urljoin
+
 from fedora.client import OpenIdBaseClient
 
 BASE_URL = 'http://127.0.0.1:6543'
@@ -29,6 +33,39 @@ class BodhiClient(OpenIdBaseClient):
     def query(self, **kwargs):
         return self.send_request('/updates/', verb='GET', params=kwargs)
 
+    def lookup(self, ids, **kwargs):
+        """ Look up many updates by alias, title or build NVR at once.
+
+        Returns a dict mapping each identifier to its update, or to None.
+        Keyword arguments, such as ``fields``, are passed as query
+        parameters.
+
+        """
+        # Titles contain spaces, so the identifiers are sent as JSON
+        return self.send_request(
+            '/lookup/updates', verb='POST', params=kwargs,
+            data=json.dumps({'ids': list(ids)}),
+            headers={'Content-Type': 'application/json'})['updates']
+
+    def export(self, kind='updates', **kwargs):
+        """ Iterate over the (cursor, object) pairs of a bulk export.
+
+        :arg kind: Either ``updates`` or ``comments``.
+
+        Keyword arguments are passed as query parameters.  An export that is
+        interrupted can be resumed by passing the last cursor seen as
+        ``after``.
+
+        """
+        response = self._session.get(
+            urljoin(self.base_url, '/export/%s' % kind), params=kwargs,
+            stream=True, verify=not self.insecure)
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if line:
+                record = json.loads(line)
+                yield record['cursor'], record[kind[:-1]]
+
     def parse_file(self, input_file):
         """ Parse an update template file.
 
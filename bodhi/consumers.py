@@ -0,0 +1,73 @@
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program; if not, write to the Free Software Foundation, Inc., 51
+# Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+"""
+fedmsg consumers that keep Bodhi's view of Koji up to date.
+"""
+
+import fedmsg.consumers
+
+from sqlalchemy import engine_from_config
+
+from bodhi import log, buildsys
+from bodhi.config import config
+from bodhi.models import DBSession, BuildTag
+from bodhi.util import transactional_session_maker
+
+
+class KojiTagConsumer(fedmsg.consumers.FedmsgConsumer):
+    """Follow Koji tag and untag messages.
+
+    Cached Koji responses for the build and tag are invalidated, and the local
+    tag index (see :class:`bodhi.models.BuildTag`) is updated.
+
+    The cache region needs a shared backend (``koji_cache.backend``) for
+    invalidations made here to be seen by the web application processes.
+    """
+    config_key = 'koji_consumer'
+
+    def __init__(self, hub, db_factory=None, *args, **kw):
+        if db_factory is None:
+            DBSession.configure(bind=engine_from_config(config, 'sqlalchemy.'))
+            db_factory = transactional_session_maker
+        self.db_factory = db_factory
+        prefix = hub.config.get('topic_prefix')
+        env = hub.config.get('environment')
+        self.topic = [prefix + '.' + env + '.buildsys.tag',
+                      prefix + '.' + env + '.buildsys.untag']
+        buildsys.setup_koji_cache(config)
+        if not buildsys.koji_cache.shared:
+            log.warn('koji_cache.backend is not set, cache invalidations '
+                     'will not reach the web application')
+        super(KojiTagConsumer, self).__init__(hub, *args, **kw)
+        log.info('Bodhi koji consumer listening on topics: %s' % self.topic)
+
+    def consume(self, msg):
+        body = msg['body']['msg']
+        try:
+            build = '%(name)s-%(version)s-%(release)s' % body
+            tag = body['tag']
+        except KeyError:
+            log.warn('Ignoring malformed koji tag message: %r' % body)
+            return
+        log.debug('%s changed in %s, invalidating cache' % (build, tag))
+        buildsys.koji_cache.invalidate(build=build, tag=tag)
+
+        if not BuildTag.enabled():
+            return
+        with self.db_factory() as session:
+            if msg['topic'].endswith('.untag'):
+                BuildTag.untagged_event(session, tag, build)
+            else:
+                BuildTag.tagged_event(session, tag, build, body['name'],
+                                      body.get('build_id'))
@@ -30,10 +30,11 @@ import fedmsg.consumers
 from collections import defaultdict
 
 from bodhi import log, buildsys, notifications, mail, util
+from bodhi.cache import setup_cache
 from bodhi.util import sorted_updates, sanity_check_repodata
 from bodhi.config import config
 from bodhi.models import (Update, UpdateRequest, UpdateType, Release,
-                          UpdateStatus, ReleaseState)
+                          UpdateStatus, ReleaseState, BuildTag, Build)
 from bodhi.metadata import ExtendedMetadata
 
 
@@ -87,6 +88,8 @@ Once mash is done:
                  *args, **kw):
         self.db_factory = db_factory
         self.mash_dir = mash_dir
+        # Pushes invalidate the pages of the updates they change
+        setup_cache(config)
         prefix = hub.config.get('topic_prefix')
         env = hub.config.get('environment')
         self.topic = prefix + '.' + env + '.' + hub.config.get('masher_topic')
@@ -203,8 +206,7 @@ class MasherThread(threading.Thread):
 
     def work(self):
         self.koji = buildsys.get_session()
-        self.release = self.db.query(Release)\
-                              .filter_by(name=self.release).one()
+        self.release = Release.registry.get(self.release, self.db)
         self.id = getattr(self.release, '%s_tag' % self.request.value)
         self.log.info('Running MasherThread(%s)' % self.id)
         self.init_state()
@@ -279,8 +281,10 @@ class MasherThread(threading.Thread):
     def load_updates(self):
         self.log.debug('Loading updates')
         updates = []
+        query = self.db.query(Update).options(
+            *Update.loading_options('masher'))
         for title in self.state['updates']:
-            update = self.db.query(Update).filter_by(title=title).first()
+            update = query.filter_by(title=title).first()
             if update:
                 updates.append(update)
         if not updates:
@@ -374,7 +378,7 @@ class MasherThread(threading.Thread):
                     bug.update_details()
 
     def determine_tag_actions(self):
-        tag_types, tag_rels = Release.get_tags()
+        tag_types, tag_rels = Release.get_tags(self.db)
         for update in sorted_updates(self.updates):
             if update.status is UpdateStatus.testing:
                 status = 'testing'
@@ -401,20 +405,49 @@ class MasherThread(threading.Thread):
                                            build.nvr))
 
     def perform_tag_actions(self):
-        self.koji.multicall = True
+        executor = buildsys.MulticallExecutor()
         for action in self.add_tags:
             tag, build = action
             self.log.info("Adding tag %s to %s" % (tag, build))
-            self.koji.tagBuild(tag, build, force=True)
+            executor.add('tagBuild', tag, build, force=True)
         for action in self.move_tags:
             from_tag, to_tag, build = action
             self.log.info('Moving %s from %s to %s' % (
                           build, from_tag, to_tag))
-            self.koji.moveBuild(from_tag, to_tag, build, force=True)
-        results = self.koji.multiCall()
-        failed_tasks = buildsys.wait_for_tasks([task[0] for task in results])
+            executor.add('moveBuild', from_tag, to_tag, build, force=True)
+        results = executor.run()
+        if executor.failures:
+            raise Exception("Failed to move builds: %s" % ', '.join(
+                '%s %r: %s' % (method, args, fault.get('faultString'))
+                for (method, args, kw), fault in executor.failures))
+        failed_tasks = executor.wait_for_tasks(results)
         if failed_tasks:
             raise Exception("Failed to move builds: %s" % failed_tasks)
+        if BuildTag.enabled():
+            self.index_tag_actions()
+
+    def index_tag_actions(self):
+        """Apply our tag actions to the local tag index right away, instead of
+        waiting for the koji consumer to hear about them"""
+        packages = dict((build.nvr, build.package.name)
+                        for update in self.updates for build in update.builds)
+
+        def package_of(nvr):
+            if nvr not in packages:
+                build = Build.get(nvr, self.db)
+                packages[nvr] = build and build.package.name
+                if build is None:
+                    self.log.warn('Not indexing unknown build %s' % nvr)
+            return packages[nvr]
+
+        for tag, build in self.add_tags:
+            if package_of(build):
+                BuildTag.tagged_event(self.db, tag, build, package_of(build))
+        for from_tag, to_tag, build in self.move_tags:
+            BuildTag.untagged_event(self.db, from_tag, build)
+            if package_of(build):
+                BuildTag.tagged_event(self.db, to_tag, build,
+                                      package_of(build))
 
     def expire_buildroot_overrides(self):
         """ Obsolete any buildroot overrides that are in this push """
@@ -427,16 +460,26 @@ class MasherThread(threading.Thread):
     def remove_pending_tags(self):
         """ Remove all pending tags from these updates """
         log.debug("Removing pending tags from builds")
-        self.koji.multicall = True
+        executor = buildsys.MulticallExecutor()
         for update in self.updates:
             if update.request is UpdateRequest.stable:
                 update.remove_tag(update.release.pending_stable_tag,
-                                  koji=self.koji)
+                                  executor=executor)
             elif update.request is UpdateRequest.testing:
                 update.remove_tag(update.release.pending_testing_tag,
-                                  koji=self.koji)
-        result = self.koji.multiCall()
+                                  executor=executor)
+        result = executor.run()
         log.debug('remove_pending_tags koji.multiCall result = %r' % result)
+        if BuildTag.enabled():
+            for update in self.updates:
+                if update.request is UpdateRequest.stable:
+                    tag = update.release.pending_stable_tag
+                elif update.request is UpdateRequest.testing:
+                    tag = update.release.pending_testing_tag
+                else:
+                    continue
+                for build in update.builds:
+                    BuildTag.untagged_event(self.db, tag, build.nvr)
 
     def update_comps(self):
         """
@@ -479,6 +522,7 @@ class MasherThread(threading.Thread):
 
     def complete_requests(self):
         log.debug("Running post-request actions on updates")
+        Update.assign_aliases([up for up in self.updates if up.request])
         for update in self.updates:
             if update.request:
                 update.request_complete()
@@ -26,7 +26,8 @@ from datetime import datetime
 from urlgrabber.grabber import urlgrab
 
 from bodhi.config import config
-from bodhi.models import Build, UpdateStatus, UpdateRequest, UpdateSuggestion
+from bodhi.models import (Update, Build, BuildTag, UpdateStatus,
+                          UpdateRequest, UpdateSuggestion)
 from bodhi.buildsys import get_session
 from bodhi.modifyrepo import RepoMetadata
 
@@ -146,16 +147,25 @@ class ExtendedMetadata(object):
     def _fetch_updates(self):
         """Based on our given koji tag, populate a list of Update objects"""
         log.debug("Fetching builds tagged with '%s'" % self.tag)
-        kojiBuilds = self.koji.listTagged(self.tag, latest=True)
-        nonexistent = []
-        log.debug("%d builds found" % len(kojiBuilds))
-        for build in kojiBuilds:
-            self.builds[build['nvr']] = build
-            build_obj = self.db.query(Build).filter_by(nvr=build['nvr']).first()
-            if build_obj:
-                self.updates.add(build_obj.update)
-            else:
-                nonexistent.append(build['nvr'])
+        if BuildTag.enabled():
+            # The koji build info is fetched later on, as it is needed
+            nvrs = [row.nvr for row in BuildTag.latest(self.tag, self.db)]
+        else:
+            kojiBuilds = self.koji.listTagged(self.tag, latest=True)
+            for build in kojiBuilds:
+                self.builds[build['nvr']] = build
+            nvrs = [build['nvr'] for build in kojiBuilds]
+        log.debug("%d builds found" % len(nvrs))
+        found = set()
+        options = Update.loading_options('metadata')
+        for i in range(0, len(nvrs), 500):
+            query = self.db.query(Update).join(Update.builds)\
+                        .filter(Build.nvr.in_(nvrs[i:i + 500]))\
+                        .options(*options)
+            for update in query:
+                self.updates.add(update)
+                found.update(build.nvr for build in update.builds)
+        nonexistent = [nvr for nvr in nvrs if nvr not in found]
         if nonexistent:
             log.warning("Couldn't find the following koji builds tagged as "
                         "%s in bodhi: %s" % (self.tag, nonexistent))
@@ -28,17 +28,25 @@ from collections import defaultdict
 
 from sqlalchemy import Unicode, UnicodeText, Integer, Boolean
 from sqlalchemy import DateTime
-from sqlalchemy import Table, Column, ForeignKey
-from sqlalchemy import and_, or_
+from sqlalchemy import Table, Column, ForeignKey, Index, UniqueConstraint
+from sqlalchemy import and_, or_, func, event, inspect, select, exists
 from sqlalchemy.orm import scoped_session, sessionmaker, relationship, backref
-from sqlalchemy.orm import class_mapper
+from sqlalchemy.orm import class_mapper, object_session, Session
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm import subqueryload, lazyload, noload, contains_eager
+from sqlalchemy.orm import joinedload, aliased
 from sqlalchemy.orm.properties import RelationshipProperty
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm.exc import NoResultFound
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import DDL
+from sqlalchemy.sql.expression import FunctionElement, ClauseElement
+from sqlalchemy.ext.compiler import compiles
 from zope.sqlalchemy import ZopeTransactionExtension
 from pyramid.settings import asbool
 
 from bodhi import buildsys, mail, notifications
+from bodhi.cache import cache
 from bodhi.util import (
     header, build_evr, get_nvr, flash_log,
     get_age, get_critpath_pkgs, get_rpm_header
@@ -54,6 +62,7 @@ from bodhi.models.enum import DeclEnum, EnumSymbol
 from bodhi.exceptions import BodhiException, LockedUpdateException
 from bodhi.config import config
 from bodhi.bugs import bugtracker
+from bodhi.search import SearchIndex
 
 log = logging.getLogger(__name__)
 
@@ -63,6 +72,79 @@ except ImportError:
     log.warning("Could not import 'rpm'")
 
 
+class text_hash(FunctionElement):
+    """
+    The md5 of a text value on PostgreSQL, and the value itself elsewhere.
+    """
+    name = 'text_hash'
+
+
+@compiles(text_hash)
+def _compile_text_hash(element, compiler, **kw):
+    return compiler.process(element.clauses, **kw)
+
+
+@compiles(text_hash, 'postgresql')
+def _compile_text_hash_postgresql(element, compiler, **kw):
+    return 'md5(%s)' % compiler.process(element.clauses, **kw)
+
+
+class HashIndexedText(UnicodeText):
+    """
+    Unlimited text that is looked up by its exact value.
+
+    PostgreSQL cannot put values much over 2.7KB in a btree index, so it
+    indexes the md5 of these columns instead (see :func:`hash_index`), and
+    comparisons match the md5 as well as the text to go through that index.
+    """
+
+    class comparator_factory(UnicodeText.comparator_factory):
+
+        def __eq__(self, other):
+            plain = UnicodeText.comparator_factory.__eq__(self, other)
+            if other is None or isinstance(other, ClauseElement):
+                return plain
+            return and_(text_hash(self.expr) == text_hash(other), plain)
+
+        def in_(self, other):
+            if isinstance(other, ClauseElement):
+                return UnicodeText.comparator_factory.in_(self, other)
+            other = list(other)
+            return and_(text_hash(self.expr).in_(
+                [text_hash(value) for value in other]),
+                UnicodeText.comparator_factory.in_(self, other))
+
+
+def hash_index(name, table, column):
+    """ Index a HashIndexedText column, by md5 on PostgreSQL """
+    on_postgresql = lambda ddl, target, bind, **kw: \
+        bind.dialect.name == 'postgresql'
+    event.listen(table, 'after_create', DDL(
+        'CREATE INDEX %s_md5 ON %s (md5(%s))' % (name, table.name, column)
+    ).execute_if(callable_=on_postgresql))
+    event.listen(table, 'after_create', DDL(
+        'CREATE INDEX %s ON %s (%s)' % (name, table.name, column)
+    ).execute_if(callable_=lambda *args, **kw: not on_postgresql(*args, **kw)))
+
+
+def _json_selection(request):
+    """
+    Return the ``fields`` and ``expand`` a request asked for, as frozensets or
+    None.  They are resolved once per request, which serializes every object
+    of a list with the same selection.
+    """
+    if request is None:
+        return None, None
+    selection = getattr(request, '_json_selection', None)
+    if selection is None:
+        validated = getattr(request, 'validated', None) or {}
+        selection = tuple(
+            None if validated.get(name) is None
+            else frozenset(validated[name]) for name in ('fields', 'expand'))
+        request._json_selection = selection
+    return selection
+
+
 class BodhiBase(object):
     """ Our custom model base class """
     __exclude_columns__ = ('id',)  # List of columns to exclude from JSON
@@ -72,10 +154,27 @@ class BodhiBase(object):
     id = Column(Integer, primary_key=True)
 
     @classmethod
-    def get(cls, id, db):
-        return db.query(cls).filter(or_(
-            getattr(cls, col) == id for col in cls.__get_by__
-        )).first()
+    def get(cls, id, db, options=()):
+        """
+        Return the object whose ``__get_by__`` columns match id, or None.
+
+        Results are remembered until the session next flushes or its
+        transaction ends, which in the web application means for the rest of
+        the request, so the ACLs, validators and views that look up the same
+        object only query it once.  The loading ``options`` of the first
+        lookup are the ones that apply.  Misses are not remembered, since the
+        caller may well go on to add the object it didn't find.
+        """
+        lookups = db.info.setdefault('lookups', {})
+        key = (cls, id)
+        obj = lookups.get(key)
+        if obj is None or obj in db.deleted:
+            obj = db.query(cls).options(*options).filter(or_(
+                getattr(cls, col) == id for col in cls.__get_by__
+            )).first()
+            if obj is not None:
+                lookups[key] = obj
+        return obj
 
     def __getitem__(self, key):
         return getattr(self, key)
@@ -84,36 +183,82 @@ class BodhiBase(object):
         return '<{0} {1}>'.format(self.__class__.__name__, self.__json__())
 
     def __json__(self, request=None, anonymize=False):
-        return self._to_json(self, request=request, anonymize=anonymize)
+        """
+        The requested ``fields`` and ``expand``\ed relationships of a list
+        service (see :class:`bodhi.schemas.SparseSchema`) restrict what is
+        serialized of the objects it returns.
+        """
+        fields, expand = _json_selection(request)
+        return self._to_json(self, request=request, anonymize=anonymize,
+                             fields=fields, expand=expand)
+
+    @classmethod
+    def json_relationships(cls, fields=None, expand=None):
+        """ The relationships that __json__ will expand """
+        rels = cls._json_plan(frozenset())[2]
+        return [rel for rel in rels
+                if (fields is None or rel in fields)
+                and (expand is None or rel in expand)]
+
+    # Serialization plans, keyed by (model class, classes already seen)
+    _json_plans = {}
+
+    @classmethod
+    def _json_plan(cls, seen):
+        """
+        Return the (columns, extras, relationships, seen) to serialize for
+        instances of this class, having already expanded the ``seen`` classes.
 
-    def _to_json(self, obj, seen=None, request=None, anonymize=False):
-        if not seen:
-            seen = []
+        Inspecting the mapper is expensive, so plans are computed once and
+        cached.
+        """
+        key = (cls, seen)
+        plan = BodhiBase._json_plans.get(key)
+        if plan is None:
+            exclude = getattr(cls, '__exclude_columns__', [])
+            properties = list(class_mapper(cls).iterate_properties)
+            rels = [p.key for p in properties
+                    if type(p) is RelationshipProperty]
+            attrs = [p.key for p in properties if p.key not in rels]
+            plan = BodhiBase._json_plans[key] = (
+                [attr for attr in attrs
+                 if attr not in exclude and not attr.startswith('_')],
+                list(getattr(cls, '__include_extras__', [])),
+                [attr for attr in rels if attr not in exclude],
+                seen | frozenset([cls]))
+        return plan
+
+    def _to_json(self, obj, seen=None, request=None, anonymize=False,
+                 fields=None, expand=None):
         if not obj:
             return
 
-        exclude = getattr(obj, '__exclude_columns__', [])
-        properties = list(class_mapper(type(obj)).iterate_properties)
-        rels = [p.key for p in properties if type(p) is RelationshipProperty]
-        attrs = [p.key for p in properties if p.key not in rels]
-        d = dict([(attr, getattr(obj, attr)) for attr in attrs
-                  if attr not in exclude and not attr.startswith('_')])
+        seen = frozenset(seen or ())
+        attrs, extras, rels, child_seen = type(obj)._json_plan(seen)
+        if fields is not None:
+            attrs = [attr for attr in attrs if attr in fields]
+            extras = [name for name in extras if name in fields]
+            rels = [attr for attr in rels if attr in fields]
+        if expand is not None:
+            rels = [attr for attr in rels if attr in expand]
+
+        d = {}
+        for attr in attrs:
+            d[attr] = getattr(obj, attr)
 
-        extras = getattr(obj, '__include_extras__', [])
         for name in extras:
             d[name] = getattr(obj, name)(request)
 
-        for attr in rels:
-            if attr in exclude:
-                continue
-            d[attr] = self._expand(obj, getattr(obj, attr), seen, request)
-
         for key, value in d.iteritems():
             if isinstance(value, datetime):
                 d[key] = value.strftime('%Y-%m-%d %H:%M:%S')
-            if isinstance(value, EnumSymbol):
+            elif isinstance(value, EnumSymbol):
                 d[key] = unicode(value)
 
+        for attr in rels:
+            d[attr] = self._expand(getattr(obj, attr), seen, child_seen,
+                                   request)
+
         # If explicitly asked to, we will overwrite some fields if the
         # corresponding condition of each evaluates to True.
         # This is primarily for anonymous Comments.  We want to serialize
@@ -126,16 +271,18 @@ class BodhiBase(object):
 
         return d
 
-    def _expand(self, obj, relation, seen, req):
+    def _expand(self, relation, seen, child_seen, req):
         """ Return the to_json or id of a sqlalchemy relationship. """
+        if isinstance(relation, BodhiBase):
+            if type(relation) in seen:
+                return relation.id
+            return self._to_json(relation, child_seen, req)
         if hasattr(relation, 'all'):
             relation = relation.all()
         if hasattr(relation, '__iter__'):
-            return [self._expand(obj, item, seen, req) for item in relation]
-        if type(relation) not in seen:
-            return self._to_json(relation, seen + [type(obj)], req)
-        else:
-            return relation.id
+            return [self._expand(item, seen, child_seen, req)
+                    for item in relation]
+        return self._to_json(relation, child_seen, req)
 
     @classmethod
     def grid_columns(cls):
@@ -188,6 +335,14 @@ metadata = Base.metadata
 DBSession = scoped_session(sessionmaker(extension=ZopeTransactionExtension()))
 
 
+@event.listens_for(Session, 'after_flush')
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_rollback')
+def _forget_lookups(session, *args):
+    # Anything that was just written may have changed what get() would find
+    session.info.pop('lookups', None)
+
+
 ##
 ## Enumerated type declarations
 ##
@@ -253,20 +408,20 @@ class ReleaseState(DeclEnum):
 ##
 
 update_bug_table = Table('update_bug_table', metadata,
-        Column('update_id', Integer, ForeignKey('updates.id')),
-        Column('bug_id', Integer, ForeignKey('bugs.id')))
+        Column('update_id', Integer, ForeignKey('updates.id'), index=True),
+        Column('bug_id', Integer, ForeignKey('bugs.id'), index=True))
 
 update_cve_table = Table('update_cve_table', metadata,
-        Column('update_id', Integer, ForeignKey('updates.id')),
-        Column('cve_id', Integer, ForeignKey('cves.id')))
+        Column('update_id', Integer, ForeignKey('updates.id'), index=True),
+        Column('cve_id', Integer, ForeignKey('cves.id'), index=True))
 
 bug_cve_table = Table('bug_cve_table', metadata,
-        Column('bug_id', Integer, ForeignKey('bugs.id')),
-        Column('cve_id', Integer, ForeignKey('cves.id')))
+        Column('bug_id', Integer, ForeignKey('bugs.id'), index=True),
+        Column('cve_id', Integer, ForeignKey('cves.id'), index=True))
 
 user_package_table = Table('user_package_table', metadata,
-        Column('user_id', Integer, ForeignKey('users.id')),
-        Column('package_id', Integer, ForeignKey('packages.id')))
+        Column('user_id', Integer, ForeignKey('users.id'), index=True),
+        Column('package_id', Integer, ForeignKey('packages.id'), index=True))
 
 
 class Release(Base):
@@ -316,30 +471,305 @@ class Release(Base):
         return ' '.join(self.long_name.split()[:-1])
 
     @classmethod
-    def get_tags(cls):
-        if cls._tag_cache:
-            return cls._tag_cache
-        data = {'candidate': [], 'testing': [], 'stable': [], 'override': [],
-                'pending_testing': [], 'pending_stable': []}
-        tags = {}  # tag -> release lookup
-        for release in DBSession.query(cls).all():
-            for key in data:
-                tag = getattr(release, '%s_tag' % key)
-                data[key].append(tag)
-                tags[tag] = release.name
-        cls._tag_cache = (data, tags)
-        return cls._tag_cache
-    _tag_cache = None
+    def get_tags(cls, db=None):
+        """
+        Return a dict of tag type to the tags of that type across all
+        releases, and a dict mapping each tag to the name of its release.
+        """
+        return cls.registry.get_tags(db or DBSession())
 
     @classmethod
     def from_tags(cls, tags, db):
-        tag_types, tag_rels = cls.get_tags()
+        tag_types, tag_rels = cls.get_tags(db)
         for tag in tags:
-            release = db.query(cls).filter_by(name=tag_rels[tag]).first()
+            release = cls.registry.get(tag_rels[tag], db)
             if release:
                 return release
 
 
+class CacheVersion(Base):
+    """
+    A counter that is bumped whenever some cached data changes, so that every
+    process can cheaply tell whether its own copy has gone stale.
+    """
+    __tablename__ = 'cache_versions'
+
+    name = Column(Unicode(50), unique=True, nullable=False)
+    value = Column(Integer, nullable=False, default=0)
+
+    @classmethod
+    def current(cls, name, db):
+        return db.query(cls.value).filter_by(name=name).scalar() or 0
+
+    @classmethod
+    def bump(cls, name, bind):
+        """ Increment a counter using a session or a raw connection """
+        table = cls.__table__
+        result = bind.execute(table.update().where(table.c.name == name)
+                              .values(value=table.c.value + 1))
+        if not result.rowcount:
+            bind.execute(table.insert().values(name=name, value=1))
+
+
+# Comments by these users are not feedback
+STATS_IGNORED_USERS = (u'bodhi', u'autoqa')
+
+
+def _update_stats(status, type, critpath, karma, date_testing, date_stable):
+    """ The ReleaseStat counters that an update with these values is in """
+    karma = karma or 0
+    stats = ['updates', 'status:%s' % status.value, 'type:%s' % type.value]
+    if critpath:
+        stats.append('critpath')
+        if status is UpdateStatus.stable or \
+                karma >= int(config.get('critpath.min_karma', 2)):
+            stats.append('critpath:approved')
+        elif status in (UpdateStatus.testing, UpdateStatus.pending):
+            stats.append('critpath:unapproved')
+    if status is UpdateStatus.stable:
+        if karma < 0:
+            stats.append('stable:negative_karma')
+        if date_testing and date_stable:
+            stats.append('testing_days:%d' % (date_stable - date_testing).days)
+    return stats
+
+
+def _comment_stats(username, karma, anonymous):
+    """ The ReleaseStat counters that a comment is in """
+    if username in STATS_IGNORED_USERS:
+        return []
+    stats = ['karma:%d' % karma]
+    if karma:
+        stats.append(anonymous and 'feedback:anonymous'
+                     or 'feedback:authenticated')
+    return stats
+
+
+class ReleaseStat(Base):
+    """
+    A statistic of a release, such as its number of stable updates.
+
+    The counters are kept up to date as updates and comments are written (see
+    the events at the end of this module), so reports don't need to go
+    through every update of a release.  ``rebuild`` recomputes them from
+    scratch, and has to be run once after the table is created, with the
+    writers stopped.
+
+    Every transaction that writes an update or a comment would otherwise
+    lock the same few counter rows until it is over, so changes are queued
+    in the session by ``queue`` and only applied once it has committed.
+
+    Counters are named:
+
+    * ``updates``, ``status:<status>`` and ``type:<type>``
+    * ``critpath``, ``critpath:approved`` and ``critpath:unapproved``
+    * ``stable:negative_karma``, stable updates with negative karma
+    * ``testing_days:<days>``, stable updates that spent that long in testing
+    * ``karma:<karma>``, the comments of each karma
+    * ``feedback:authenticated`` and ``feedback:anonymous``, the comments
+      with karma
+    * ``feedback``, the updates that got karma from a logged in user
+    """
+    __tablename__ = 'release_stats'
+    __table_args__ = (UniqueConstraint('release_id', 'name'),)
+
+    release_id = Column(Integer, ForeignKey('releases.id'), nullable=False)
+    name = Column(Unicode(50), nullable=False)
+    value = Column(Integer, nullable=False, default=0)
+
+    @classmethod
+    def add(cls, bind, release_id, name, amount=1):
+        """ Change a counter using a session or a raw connection """
+        table = cls.__table__
+        result = bind.execute(table.update().where(and_(
+            table.c.release_id == release_id, table.c.name == name))
+            .values(value=table.c.value + amount))
+        if not result.rowcount:
+            bind.execute(table.insert().values(
+                release_id=release_id, name=name, value=amount))
+
+    @classmethod
+    def queue(cls, session, release_id, name, amount=1):
+        """ Change a counter once the session's transaction has committed """
+        changes = session.info.setdefault('release_stats', defaultdict(int))
+        changes[release_id, name] += amount
+
+    @classmethod
+    def apply(cls, engine, changes):
+        """
+        Apply queued changes in a short transaction of their own.
+
+        Counters are changed in the same order by every process, so that
+        concurrent transactions don't deadlock, and the transaction is run
+        again if another one created one of the counters in the meantime.
+        """
+        changes = sorted(item for item in changes.items() if item[1])
+        for attempt in range(2):
+            try:
+                with engine.begin() as connection:
+                    for (release_id, name), amount in changes:
+                        cls.add(connection, release_id, name, amount)
+                return
+            except IntegrityError:
+                if attempt:
+                    raise
+
+    @classmethod
+    def for_release(cls, release, db):
+        """
+        Return a dict of the counters of a release, including the changes
+        still queued in the session.
+        """
+        stats = defaultdict(int)
+        stats.update(db.query(cls.name, cls.value)
+                     .filter(cls.release_id == release.id).all())
+        for (release_id, name), amount in \
+                db.info.get('release_stats', {}).items():
+            if release_id == release.id:
+                stats[name] += amount
+        return stats
+
+    @classmethod
+    def rebuild(cls, db, releases=None):
+        """
+        Recompute the counters of the given releases, or of all of them.
+
+        Only a few columns of each update are read, and comments are counted
+        by the database.
+
+        Other processes apply their changes after they commit, so a change
+        committed while this runs may be counted here and then applied on
+        top of it.  Run it with everything that writes updates or comments
+        (the web application, the masher and the consumers) stopped.
+        """
+        counts = defaultdict(int)
+        release_ids = None
+        if releases is not None:
+            release_ids = [release.id for release in releases]
+
+        def restrict(query):
+            if release_ids is not None:
+                query = query.filter(Update.release_id.in_(release_ids))
+            return query.filter(Update.release_id != None)
+
+        updates = restrict(db.query(
+            Update.release_id, Update.status, Update.type, Update.critpath,
+            Update.karma, Update.date_testing, Update.date_stable))
+        for row in updates.yield_per(1000):
+            for name in _update_stats(*row[1:]):
+                counts[row[0], name] += 1
+
+        comments = restrict(db.query(
+            Update.release_id, User.name, Comment.karma, Comment.anonymous,
+            func.count(Comment.id))
+            .join(Comment.update).join(Comment.user)
+            .group_by(Update.release_id, User.name, Comment.karma,
+                      Comment.anonymous))
+        for release_id, username, karma, anonymous, num in comments:
+            for name in _comment_stats(username, karma, anonymous):
+                counts[release_id, name] += num
+
+        feedback = restrict(db.query(
+            Update.release_id, func.count(Comment.update_id.distinct()))
+            .join(Comment.update).join(Comment.user)
+            .filter(Comment.karma != 0)
+            .filter(Comment.anonymous == False)
+            .filter(~User.name.in_(STATS_IGNORED_USERS))
+            .group_by(Update.release_id))
+        for release_id, num in feedback:
+            counts[release_id, 'feedback'] = num
+
+        query = db.query(cls)
+        if release_ids is not None:
+            query = query.filter(cls.release_id.in_(release_ids))
+        query.delete(synchronize_session=False)
+        # What was queued is part of the new counts
+        queued = db.info.get('release_stats', {})
+        for key in list(queued):
+            if release_ids is None or key[0] in release_ids:
+                del queued[key]
+        for (release_id, name), value in counts.items():
+            db.add(cls(release_id=release_id, name=name, value=value))
+        db.flush()
+
+
+class ReleaseRegistry(object):
+    """
+    A process-wide cache of every release and of the Koji tags they own.
+
+    The releases are kept as detached copies and merged into the caller's
+    session without a query.  Whether the cache is current is checked
+    against the ``releases`` CacheVersion at most once per transaction, and
+    the counter is bumped whenever a release is inserted, edited or deleted.
+    """
+    version_name = u'releases'
+
+    def __init__(self):
+        self._state = None
+
+    def invalidate(self):
+        self._state = None
+
+    def _load(self, db):
+        state = self._state
+        if state is not None and db.info.get('release_registry') is state:
+            return state
+        version = CacheVersion.current(self.version_name, db)
+        if state is None or state[0] != version:
+            state = self._state = self._build(db, version)
+        db.info['release_registry'] = state
+        return state
+
+    def _build(self, db, version):
+        columns = [prop.key for prop in class_mapper(Release).column_attrs]
+        releases = {}
+        tag_types = {'candidate': [], 'testing': [], 'stable': [],
+                     'override': [], 'pending_testing': [],
+                     'pending_stable': []}
+        tag_rels = {}  # tag -> release lookup
+        for release in db.query(Release).all():
+            copy = Release(**dict((key, getattr(release, key))
+                                  for key in columns))
+            make_transient_to_detached(copy)
+            releases[release.name] = copy
+            for key in tag_types:
+                tag = getattr(release, '%s_tag' % key)
+                tag_types[key].append(tag)
+                tag_rels[tag] = release.name
+        return version, releases, tag_types, tag_rels
+
+    def get_tags(self, db):
+        version, releases, tag_types, tag_rels = self._load(db)
+        return tag_types, tag_rels
+
+    def get(self, name, db):
+        """ Return the named release, attached to the given session """
+        release = self._load(db)[1].get(name)
+        if release is not None:
+            return db.merge(release, load=False)
+
+    def all(self, db):
+        return [db.merge(release, load=False)
+                for release in self._load(db)[1].values()]
+
+
+Release.registry = ReleaseRegistry()
+
+
+@event.listens_for(Release, 'after_insert')
+@event.listens_for(Release, 'after_update')
+@event.listens_for(Release, 'after_delete')
+def _release_changed(mapper, connection, target):
+    CacheVersion.bump(ReleaseRegistry.version_name, connection)
+    Release.registry.invalidate()
+
+
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_rollback')
+def _forget_release_registry(session):
+    session.info.pop('release_registry', None)
+
+
 class TestCase(Base):
     """Test cases from the wiki"""
     __tablename__ = 'testcases'
@@ -347,7 +777,7 @@ class TestCase(Base):
 
     name = Column(UnicodeText, nullable=False)
 
-    package_id = Column(Integer, ForeignKey('packages.id'))
+    package_id = Column(Integer, ForeignKey('packages.id'), index=True)
     # package backref
 
 
@@ -464,9 +894,9 @@ class Build(Base):
 
     nvr = Column(Unicode(100), unique=True, nullable=False)
     inherited = Column(Boolean, default=False)
-    package_id = Column(Integer, ForeignKey('packages.id'))
-    release_id = Column(Integer, ForeignKey('releases.id'))
-    update_id = Column(Integer, ForeignKey('updates.id'))
+    package_id = Column(Integer, ForeignKey('packages.id'), index=True)
+    release_id = Column(Integer, ForeignKey('releases.id'), index=True)
+    update_id = Column(Integer, ForeignKey('updates.id'), index=True)
 
     release = relationship('Release', backref='builds', lazy=False)
 
@@ -526,8 +956,8 @@ class Build(Base):
         return str
 
     def get_tags(self):
-        koji = buildsys.get_session()
-        return [tag['name'] for tag in koji.listTags(self.nvr)]
+        return BuildTag.tags_for(self.nvr, object_session(self) or DBSession,
+                                 buildsys.get_session())
 
     def untag(self, koji):
         """Remove all known tags from this build"""
@@ -538,12 +968,208 @@ class Build(Base):
                 koji.untagBuild(tag, self.nvr)
 
 
+class BuildTag(Base):
+    """
+    A local mirror of which builds are tagged into the Bodhi-managed Koji tags.
+
+    The table is seeded by ``bodhi-sync-build-tags`` and kept current by the
+    koji fedmsg consumer.  When the ``koji_index`` setting is enabled, tag
+    lookups are answered from here instead of asking Koji.
+    """
+    __tablename__ = 'build_tags'
+    __table_args__ = (
+        UniqueConstraint('nvr', 'tag'),
+        # For finding the latest build of each package in a tag
+        Index('ix_build_tags_tag_package_tagged',
+              'tag', 'package_name', 'tagged'),
+    )
+
+    nvr = Column(Unicode(100), nullable=False, index=True)
+    package_name = Column(Unicode(50), nullable=False, index=True)
+    tag = Column(Unicode(50), nullable=False, index=True)
+    koji_build_id = Column(Integer)
+    tagged = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    @classmethod
+    def enabled(cls):
+        return asbool(config.get('koji_index', False))
+
+    @classmethod
+    def tags_for(cls, nvr, db, koji):
+        """ Return the names of the tags that a given build is tagged with """
+        if not cls.enabled():
+            return [tag['name'] for tag in koji.listTags(nvr)]
+        return [row.tag for row in db.query(cls.tag).filter_by(nvr=nvr)]
+
+    @classmethod
+    def latest(cls, tag, db, package=None):
+        """
+        Return the most recently tagged build of each package in a tag,
+        ordered by package name.  Of builds tagged at the same time, the one
+        recorded last wins.
+        """
+        newer = aliased(cls)
+        query = db.query(cls).filter(cls.tag == tag).filter(~exists().where(
+            and_(newer.tag == cls.tag,
+                 newer.package_name == cls.package_name,
+                 or_(newer.tagged > cls.tagged,
+                     and_(newer.tagged == cls.tagged, newer.id > cls.id)))))
+        if package:
+            query = query.filter(cls.package_name == package)
+        return query.order_by(cls.package_name).all()
+
+    @classmethod
+    def tagged_event(cls, db, tag, nvr, package_name, koji_build_id=None):
+        """ Record that a build was tagged, ignoring unmanaged tags """
+        tag_types, tag_rels = Release.get_tags(db)
+        if tag not in tag_rels:
+            return
+        row = db.query(cls).filter_by(nvr=nvr, tag=tag).first()
+        if row is None:
+            row = cls(nvr=nvr, tag=tag, package_name=package_name)
+            db.add(row)
+        row.koji_build_id = koji_build_id or row.koji_build_id
+        row.tagged = datetime.utcnow()
+
+    @classmethod
+    def untagged_event(cls, db, tag, nvr):
+        """ Record that a build was removed from a tag """
+        db.query(cls).filter_by(nvr=nvr, tag=tag).delete()
+
+    @classmethod
+    def sync(cls, db, koji, tags=None):
+        """
+        Mirror the contents of the given tags (all of the Bodhi-managed tags
+        by default) from Koji, using a single multicall.
+
+        Returns a tuple of how many memberships were added and removed.
+        """
+        if tags is None:
+            tags = sorted(Release.get_tags(db)[1])
+        koji.multicall = True
+        for tag in tags:
+            koji.listTagged(tag)
+        results = koji.multiCall() or []
+        added = removed = 0
+        for tag, result in zip(tags, results):
+            if isinstance(result, dict):
+                log.error('Unable to list builds tagged with %s: %s' % (
+                    tag, result.get('faultString')))
+                continue
+            builds = dict((build['nvr'], build) for build in result[0])
+            existing = dict((row.nvr, row) for row in
+                            db.query(cls).filter_by(tag=tag))
+            for nvr in set(existing) - set(builds):
+                db.delete(existing[nvr])
+                removed += 1
+            for nvr in set(builds) - set(existing):
+                build = builds[nvr]
+                tagged = datetime.utcnow()
+                if build.get('create_ts'):
+                    tagged = datetime.utcfromtimestamp(build['create_ts'])
+                db.add(cls(nvr=nvr, tag=tag,
+                           package_name=build['package_name'],
+                           koji_build_id=build.get('build_id'),
+                           tagged=tagged))
+                added += 1
+        db.flush()
+        return added, removed
+
+
+class UpdateAliasSequence(Base):
+    """
+    The last update id handed out for an id_prefix in a given year.
+
+    Ids are allocated by incrementing the counter in place, in a short
+    transaction of their own that commits right away, so concurrent pushes
+    sharing a prefix can never be given the same alias and don't wait for
+    each other's push to finish.  The ids of a push that fails are never
+    handed out again.  The first allocation of a year has no row to lock
+    yet, so it locks the table while it creates one.
+    """
+    __tablename__ = 'update_alias_sequences'
+    __table_args__ = (UniqueConstraint('id_prefix', 'year'),)
+
+    id_prefix = Column(Unicode(25), nullable=False)
+    year = Column(Integer, nullable=False)
+    value = Column(Integer, nullable=False, default=0)
+
+    @classmethod
+    def allocate(cls, id_prefix, year, db, count=1):
+        """ Reserve ``count`` consecutive ids, returning the first of them """
+        bind = db.get_bind()
+        if bind.dialect.name == 'sqlite':
+            # SQLite only has one writer at a time, which the session
+            # already is, so a connection of our own would wait for it
+            return cls._allocate(db.connection(), id_prefix, year, count)
+        with bind.begin() as connection:
+            first = cls._allocate(connection, id_prefix, year, count)
+        return first
+
+    @classmethod
+    def _allocate(cls, connection, id_prefix, year, count):
+        table = cls.__table__
+        criteria = and_(table.c.id_prefix == id_prefix, table.c.year == year)
+        increment = table.update().where(criteria).values(
+            value=table.c.value + count)
+        if not connection.execute(increment).rowcount:
+            cls.lock(connection)
+            # Another push may have created the row while we waited
+            if not connection.execute(increment).rowcount:
+                connection.execute(table.insert().values(
+                    id_prefix=id_prefix, year=year,
+                    value=cls.last_assigned(id_prefix, year, connection)
+                    + count))
+        value = connection.execute(
+            select([table.c.value]).where(criteria)).scalar()
+        return value - count + 1
+
+    @classmethod
+    def lock(cls, connection):
+        """ Keep other transactions from creating sequences until we finish """
+        if connection.dialect.name == 'postgresql':
+            connection.execute('LOCK TABLE %s IN SHARE ROW EXCLUSIVE MODE'
+                               % cls.__tablename__)
+
+    @staticmethod
+    def last_assigned(id_prefix, year, connection):
+        """ Find the highest id already given to an update this year """
+        pattern = u'%s-%s-%%' % (id_prefix, year)
+        alias = Update.__table__.c.alias
+        last = 0
+        for value, in connection.execute(
+                select([alias]).where(alias.like(pattern))):
+            suffix = value[len(pattern) - 1:]
+            if suffix.isdigit():
+                last = max(last, int(suffix))
+        return last
+
+
+def _user_options(user):
+    """ The options that load what the JSON of users loaded by ``user`` needs """
+    # Each override's build refers back to the override
+    return [user.subqueryload(User.buildroot_overrides)
+            .joinedload(BuildrootOverride.build)
+            .joinedload(Build.override),
+            user.subqueryload(User.stacks)]
+
+
 class Update(Base):
     __tablename__ = 'updates'
-    __exclude_columns__ = ('id', 'user_id', 'release_id')
+    __exclude_columns__ = ('id', 'user_id', 'release_id', 'related_version')
     __get_by__ = ('title', 'alias')
-
-    title = Column(UnicodeText, default=None)
+    __table_args__ = (
+        # The list views filter on these and sort by date_submitted
+        Index('ix_updates_release_status_submitted',
+              'release_id', 'status', 'date_submitted'),
+        Index('ix_updates_user_submitted', 'user_id', 'date_submitted'),
+        Index('ix_updates_type_submitted', 'type', 'date_submitted'),
+        Index('ix_updates_critpath_submitted', 'critpath', 'date_submitted'),
+        # The masher and the request checks look updates up by request
+        Index('ix_updates_request_status', 'request', 'status'),
+    )
+
+    title = Column(HashIndexedText, default=None)
 
     karma = Column(Integer, default=0)
     stable_karma = Column(Integer, nullable=True)
@@ -572,10 +1198,14 @@ class Update(Base):
     close_bugs = Column(Boolean, default=True)
 
     # Timestamps
-    date_submitted = Column(DateTime, default=datetime.utcnow)
-    date_modified = Column(DateTime)
+    date_submitted = Column(DateTime, default=datetime.utcnow, nullable=False,
+                            index=True)
+    date_modified = Column(DateTime, index=True)
     date_approved = Column(DateTime)
-    date_pushed = Column(DateTime)
+    date_pushed = Column(DateTime, index=True)
+    date_testing = Column(DateTime, index=True)
+    date_stable = Column(DateTime, index=True)
+    date_testing_approved = Column(DateTime)
 
     # eg: FEDORA-EPEL-2009-12345
     alias = Column(Unicode(32), default=None, unique=True)
@@ -583,20 +1213,24 @@ class Update(Base):
     # deprecated: our legacy update ID
     old_updateid = Column(Unicode(32), default=None)
 
+    # Bumped whenever a row shown with the update changes (see
+    # _invalidate_updates), so conditional requests needn't load them all
+    related_version = Column(Integer, default=0, nullable=False)
+
     # One-to-one relationships
     release_id = Column(Integer, ForeignKey('releases.id'))
     release = relationship('Release', lazy='joined')
 
     # One-to-many relationships
-    comments = relationship('Comment', backref='update', lazy='joined',
+    comments = relationship('Comment', backref='update',
                             order_by='Comment.timestamp')
-    builds = relationship('Build', backref='update', lazy='joined')
+    builds = relationship('Build', backref='update')
 
     # Many-to-many relationships
     bugs = relationship('Bug', secondary=update_bug_table,
-                        backref='updates', lazy='joined')
+                        backref='updates')
     cves = relationship('CVE', secondary=update_cve_table,
-                        backref='updates', lazy='joined')
+                        backref='updates')
 
     # We may or may not need this, since we can determine the releases from the
     # builds
@@ -605,6 +1239,83 @@ class Update(Base):
 
     user_id = Column(Integer, ForeignKey('users.id'))
 
+    @classmethod
+    def loading_options(cls, profile, relationships=None, parent=None):
+        """
+        Return the query options that eagerly load what a given kind of
+        request needs, each collection in a single extra query.
+
+        :list: and :detail: load everything that ends up in the JSON and the
+            templates, or only the given ``relationships`` of the updates.
+            With a ``parent`` loader option, the updates are the ones loaded
+            through it, such as the updates of a list of comments.
+        :masher: loads the builds, bugs and CVEs.  Comments are only loaded
+            for the updates that end up being commented on.
+        :metadata: loads what goes into updateinfo.xml, never the comments.
+        """
+        collections = [subqueryload(cls.builds), subqueryload(cls.bugs),
+                       subqueryload(cls.cves)]
+        if profile in ('list', 'detail'):
+            if parent is None:
+                load, skip = subqueryload, lazyload
+            else:
+                load, skip = parent.subqueryload, parent.lazyload
+
+            comments = load(cls.comments)
+            options = {
+                'builds': [load(cls.builds)],
+                'bugs': [load(cls.bugs), load(cls.bugs).subqueryload(
+                    Bug.feedback)],
+                'cves': [load(cls.cves)],
+                'user': _user_options(load(cls.user)),
+                'comments': _user_options(comments.subqueryload(Comment.user))
+                + [comments.subqueryload(Comment.bug_feedback),
+                   comments.subqueryload(Comment.testcase_feedback)],
+            }
+            if relationships is None:
+                return sum(options.values(), [])
+            # The release and the submitter are joined unless left out
+            result = [skip(getattr(cls, name)) for name in ('release', 'user')
+                      if name not in relationships]
+            for name in relationships:
+                result.extend(options.get(name, []))
+            return result
+        elif profile == 'masher':
+            return collections + [lazyload(cls.comments)]
+        elif profile == 'metadata':
+            return collections + [noload(cls.comments)]
+        raise ValueError('Unknown loading profile: %s' % profile)
+
+    @classmethod
+    def lookup(cls, ids, db, options=(), chunk_size=300):
+        """
+        Return a dict mapping each of the given aliases, titles or build NVRs
+        to its update, or to None when it doesn't match one.
+
+        Identifiers are looked up ``chunk_size`` at a time, to stay within
+        the number of parameters a database accepts in a single statement.
+        """
+        ids = list(ids)
+        found = {}
+        for start in range(0, len(ids), chunk_size):
+            chunk = ids[start:start + chunk_size]
+            builds = dict(db.query(Build.nvr, Build.update_id)
+                          .filter(Build.nvr.in_(chunk))
+                          .filter(Build.update_id != None).all())
+            criteria = [cls.title.in_(chunk), cls.alias.in_(chunk)]
+            if builds:
+                criteria.append(cls.id.in_(set(builds.values())))
+            updates = db.query(cls).options(*options)\
+                        .filter(or_(*criteria)).all()
+            by_id = dict((update.id, update) for update in updates)
+            for update in updates:
+                found[update.title] = update
+                if update.alias:
+                    found[update.alias] = update
+            for nvr, update_id in builds.items():
+                found.setdefault(nvr, by_id.get(update_id))
+        return dict((id, found.get(id)) for id in ids)
+
     @classmethod
     def new(cls, request, data):
         """ Create a new update """
@@ -793,14 +1504,28 @@ class Update(Base):
         """
         db = request.db
         buildinfo = request.buildinfo
+
+        # Fetch the pending/testing builds of the same packages in one go
+        candidates = defaultdict(list)
+        nvrs = [build.nvr for build in self.builds]
+        for oldBuild in db.query(Build).join(Update.builds).filter(
+            and_(Build.package_id.in_([b.package.id for b in self.builds]),
+                 ~Build.nvr.in_(nvrs),
+                 Update.request == None,
+                 Update.release == self.release,
+                 or_(Update.status == UpdateStatus.testing,
+                     Update.status == UpdateStatus.pending))
+        ).options(contains_eager(Build.update),
+                  subqueryload(Build.update, Update.builds),
+                  subqueryload(Build.update, Update.bugs)).all():
+            candidates[oldBuild.package_id].append(oldBuild)
+
+        # A multi-build update turns up once for each of its builds
+        obsoleted = set()
         for build in self.builds:
-            for oldBuild in db.query(Build).join(Update.builds).filter(
-                and_(Build.nvr != build.nvr,
-                     Update.request == None,
-                     Update.release == self.release,
-                     or_(Update.status == UpdateStatus.testing,
-                         Update.status == UpdateStatus.pending))
-            ).all():
+            for oldBuild in candidates[build.package.id]:
+                if oldBuild.update.id in obsoleted:
+                    continue
                 obsoletable = False
                 nvr = buildinfo[build.nvr]['nvr']
                 if rpm.labelCompare(get_nvr(oldBuild.nvr), nvr) < 0:
@@ -836,6 +1561,7 @@ class Update(Base):
                     # Also inherit the older updates notes as well
                     self.notes += '\n' + oldBuild.update.notes
                     oldBuild.update.obsolete(newer=build.nvr)
+                    obsoleted.add(oldBuild.update.id)
                     self.comment('This update has obsoleted %s, and has '
                                  'inherited its bugs and notes.' % oldBuild.nvr,
                                  author='bodhi')
@@ -872,78 +1598,75 @@ class Update(Base):
         return u' '.join([cve.cve_id for cve in self.cves])
 
     def get_bug_karma(self, bug):
-        good, bad, seen = 0, 0, set()
-        for comment in reversed(self.comments):
-            if comment.user.name in seen:
-                continue
-            seen.add(comment.user.name)
-            for feedback in comment.bug_feedback:
-                if feedback.bug == bug:
-                    if feedback.karma > 0:
-                        good += 1
-                    elif feedback.karma < 0:
-                        bad += 1
-        return good, bad * -1
+        return self._feedback_karma(BugVote, bug_id=bug.bug_id)
 
     def get_testcase_karma(self, testcase):
-        good, bad, seen = 0, 0, set()
-        for comment in reversed(self.comments):
-            if comment.user.name in seen:
-                continue
-            seen.add(comment.user.name)
-            for feedback in comment.testcase_feedback:
-                if feedback.testcase == testcase:
-                    if feedback.karma > 0:
-                        good += 1
-                    elif feedback.karma < 0:
-                        bad += 1
+        return self._feedback_karma(TestCaseVote, testcase_id=testcase.id)
+
+    def get_feedback_karma(self):
+        """
+        Tally the feedback given to every bug and test case of this update.
+
+        Returns a dict with ``bugs`` mapping bug ids, and ``testcases``
+        mapping test case names, to (good, bad) tuples.  This takes two
+        grouped queries no matter how many bugs, tests or comments there are.
+        """
+        bugs = dict((bug.bug_id, [0, 0]) for bug in self.bugs)
+        query = DBSession.query(BugVote.bug_id, BugVote.karma,
+                                func.count(BugVote.id))\
+            .filter_by(update_id=self.id)\
+            .group_by(BugVote.bug_id, BugVote.karma)
+        self._tally_feedback(bugs, query)
+
+        testcases = dict((test.name, [0, 0]) for test in self.full_test_cases)
+        query = DBSession.query(TestCase.name, TestCaseVote.karma,
+                                func.count(TestCaseVote.id))\
+            .join(TestCaseVote, TestCaseVote.testcase_id == TestCase.id)\
+            .filter(TestCaseVote.update_id == self.id)\
+            .group_by(TestCase.name, TestCaseVote.karma)
+        self._tally_feedback(testcases, query)
+
+        return dict(
+            bugs=dict((k, tuple(v)) for k, v in bugs.items()),
+            testcases=dict((k, tuple(v)) for k, v in testcases.items()),
+        )
+
+    @staticmethod
+    def _tally_feedback(tally, rows):
+        for key, karma, count in rows:
+            if karma > 0:
+                tally.setdefault(key, [0, 0])[0] += count
+            elif karma < 0:
+                tally.setdefault(key, [0, 0])[1] -= count
+
+    def _feedback_karma(self, vote_cls, **criteria):
+        """ Tally the positive and negative feedback given to a bug or test """
+        good, bad = 0, 0
+        query = DBSession.query(vote_cls.karma, func.count(vote_cls.id))\
+            .filter_by(update_id=self.id, **criteria)\
+            .group_by(vote_cls.karma)
+        for karma, count in query:
+            if karma > 0:
+                good += count
+            elif karma < 0:
+                bad += count
         return good, bad * -1
 
     def assign_alias(self):
         """Assign an update ID to this update.
 
-        This function finds the next number in the sequence of pushed updates
-        for this release, increments it and prefixes it with the id_prefix of
+        This function takes the next number in the sequence of pushed updates
+        for this release's id_prefix and prefixes it with the id_prefix of
         the release and the year (ie FEDORA-2007-0001).
         """
         if self.alias not in (None, u'None'):
             log.debug("Keeping current update id %s" % self.alias)
             return
 
-        releases = DBSession.query(Release) \
-                            .filter_by(id_prefix=self.release.id_prefix) \
-                            .all()
-
-        subquery = DBSession.query(Update.date_pushed) \
-                          .filter(
-                              and_(Update.date_pushed != None,
-                                   Update.alias != None,
-                                   or_(*[Update.release == release
-                                         for release in releases]))) \
-                          .order_by(Update.date_pushed.desc()) \
-                          .group_by(Update.date_pushed) \
-                          .limit(1)
-
-        update = DBSession.query(Update).filter(
-             Update.date_pushed.in_(subquery.subquery())
-        ).all()
-
-        if not update:
-            id = 1
-        else:
-            aliases = []
-            for upd in update:
-                split = upd.alias.split('-')
-                year, id = split[-2:]
-                aliases.append((int(year), int(id)))
-
-            year, id = max(aliases)
-            if int(year) != time.localtime()[0]:  # new year
-                id = 0
-            id = int(id) + 1
-
-        self.alias = u'%s-%s-%0.4d' % (self.release.id_prefix,
-                                       time.localtime()[0], id)
+        year = time.localtime()[0]
+        id = UpdateAliasSequence.allocate(self.release.id_prefix, year,
+                                          object_session(self) or DBSession())
+        self.alias = u'%s-%s-%0.4d' % (self.release.id_prefix, year, id)
         log.debug("Setting alias for %s to %s" % (self.title, self.alias))
 
         # FIXME: don't do this here:
@@ -994,9 +1717,15 @@ class Update(Base):
             koji = request.koji
             for build in self.builds:
                 mybuild = koji.getBuild(build.nvr)
-                kojiBuilds = koji.listTagged(self.release.stable_tag,
-                                             package=build.package.name,
-                                             latest=True)
+                if BuildTag.enabled():
+                    kojiBuilds = [koji.getBuild(row.nvr) for row in
+                                  BuildTag.latest(self.release.stable_tag,
+                                                  request.db,
+                                                  package=build.package.name)]
+                else:
+                    kojiBuilds = koji.listTagged(self.release.stable_tag,
+                                                 package=build.package.name,
+                                                 latest=True)
                 for oldBuild in kojiBuilds:
                     if rpm.labelCompare(build_evr(mybuild),
                                         build_evr(oldBuild)) < 0:
@@ -1086,26 +1815,50 @@ class Update(Base):
         # FIXME: track date pushed to testing & stable in different fields
         self.date_pushed = None
 
-    def add_tag(self, tag):
-        """ Add a koji tag to all builds in this update """
+    @classmethod
+    def assign_aliases(cls, updates):
+        """
+        Assign update IDs to many updates at once, reserving a single block
+        of ids for each id_prefix rather than allocating them one at a time.
+        """
+        by_prefix = defaultdict(list)
+        for update in updates:
+            if update.alias in (None, u'None'):
+                by_prefix[update.release.id_prefix].append(update)
+
+        year = time.localtime()[0]
+        for id_prefix, group in by_prefix.items():
+            db = object_session(group[0]) or DBSession()
+            id = UpdateAliasSequence.allocate(id_prefix, year, db,
+                                              count=len(group))
+            for update in group:
+                update.alias = u'%s-%s-%0.4d' % (id_prefix, year, id)
+                log.debug("Setting alias for %s to %s" % (
+                    update.title, update.alias))
+                id += 1
+
+    def add_tag(self, tag, executor=None):
+        """ Add a koji tag to all builds in this update.
+
+        The calls are queued onto the given :class:`MulticallExecutor`, or
+        run right away if none is given.
+        """
         log.debug('Adding tag %s to %s' % (tag, self.title))
-        koji = buildsys.get_session()
-        koji.multicall = True
-        for build in self.builds:
-            koji.tagBuild(tag, build.nvr, force=True)
-        return koji.multiCall()
+        return self._tag_action('tagBuild', tag, executor)
 
-    def remove_tag(self, tag, koji=None):
+    def remove_tag(self, tag, executor=None):
         """ Remove a koji tag from all builds in this update """
         log.debug('Removing tag %s from %s' % (tag, self.title))
-        return_multicall = not koji
-        if not koji:
-            koji = buildsys.get_session()
-            koji.multicall = True
+        return self._tag_action('untagBuild', tag, executor)
+
+    def _tag_action(self, method, tag, executor=None):
+        run = executor is None
+        if run:
+            executor = buildsys.MulticallExecutor()
         for build in self.builds:
-            koji.untagBuild(tag, build.nvr, force=True)
-        if return_multicall:
-            return koji.multiCall()
+            executor.add(method, tag, build.nvr, force=True)
+        if run:
+            return executor.run()
 
     def request_complete(self):
         """Perform post-request actions"""
@@ -1365,17 +2118,27 @@ class Update(Base):
         bug_feedback = bug_feedback or []
         testcase_feedback = testcase_feedback or []
 
-        if not anonymous and karma != 0 and \
-           not filter(lambda c: c.user.name == author and c.karma == karma,
-                      self.comments):
-            mycomments = [
-                c.karma for c in self.comments if c.user.name == author]
-            if karma == 1 and -1 in mycomments:
-                self.karma += 2
-            elif karma == -1 and 1 in mycomments:
-                self.karma -= 2
-            else:
-                self.karma += karma
+        session = DBSession()
+        try:
+            user = session.query(User).filter_by(
+                name=anonymous and u'anonymous' or author).one()
+        except NoResultFound:
+            user = User(name=anonymous and u'anonymous' or author)
+            session.add(user)
+            session.flush()
+
+        delta = 0
+        if not anonymous and (karma != 0 or karma_critpath != 0):
+            vote = self.get_vote(user)
+            if vote is None:
+                vote = UpdateVote(update=self, user=user, karma=0,
+                                  karma_critpath=0, karma_total=0,
+                                  voted_up=False, voted_down=False)
+                session.add(vote)
+            delta = vote.cast(karma, karma_critpath)
+
+        if delta:
+            self.karma += delta
 
             # TODO -- this block of code should be moved out of here and to
             # some kind of policy module.. so its not embedded in the model.
@@ -1395,7 +2158,6 @@ class Update(Base):
                 self.obsolete()
                 mail.send(self.get_maintainers(), 'unstable', self)
 
-        session = DBSession()
         comment = Comment(
             text=text, anonymous=anonymous,
             karma=karma, karma_critpath=karma_critpath)
@@ -1418,19 +2180,25 @@ class Update(Base):
             session.add(feedback)
             comment.testcase_feedback.append(feedback)
 
-        session.flush()
+        # Only the feedback in a user's latest comment counts
+        for vote_cls in (BugVote, TestCaseVote):
+            session.query(vote_cls).filter_by(
+                update_id=self.id, user_id=user.id).delete()
+        for feedback in comment.bug_feedback:
+            session.add(BugVote(update_id=self.id, user_id=user.id,
+                                bug_id=feedback.bug.bug_id,
+                                karma=feedback.karma))
+        for feedback in comment.testcase_feedback:
+            session.add(TestCaseVote(update_id=self.id, user_id=user.id,
+                                     testcase_id=feedback.testcase.id,
+                                     karma=feedback.karma))
 
-        if anonymous:
-            author = u'anonymous'
-        try:
-            user = session.query(User).filter_by(name=author).one()
-        except NoResultFound:
-            user = User(name=author)
-            session.add(user)
-            session.flush()
+        session.flush()
 
         user.comments.append(comment)
         self.comments.append(comment)
+        if author == u'bodhi':
+            self.track_status_comment(comment)
         session.flush()
 
         # Send a notification to everyone that has commented on this update
@@ -1444,6 +2212,22 @@ class Update(Base):
         mail.send(people, 'comment', self)
         return comment
 
+    def track_status_comment(self, comment):
+        """
+        Record when this update was pushed to testing, pushed to stable, and
+        approved for stable, based on the comments bodhi makes about it.
+        """
+        if comment.text == u'This update has been pushed to testing':
+            self.date_testing = comment.timestamp
+        elif comment.text == u'This update has been pushed to stable':
+            if not self.date_stable:
+                self.date_stable = comment.timestamp
+        elif comment.text.startswith(u'This update has reached') and \
+                comment.text.endswith(u'days in testing and can be pushed to'
+                                      u' stable now if the maintainer wishes'):
+            if not self.date_testing_approved:
+                self.date_testing_approved = comment.timestamp
+
     def unpush(self):
         """ Move this update back to its dist-fX-updates-candidate tag """
         log.debug("Unpushing %s" % self.title)
@@ -1600,13 +2384,8 @@ class Update(Base):
             # Ensure there is no negative karma. We're looking at the sum of
             # each users karma for this update, which takes into account
             # changed votes.
-            feedback = defaultdict(int)
-            for comment in self.comments:
-                if not comment.anonymous:
-                    feedback[comment.user.name] += comment.karma
-            for karma in feedback.values():
-                if karma < 0:
-                    return False
+            if self.has_negative_feedback:
+                return False
             num_days = config.get('critpath.stable_after_days_without_negative_karma')
             return self.days_in_testing >= num_days
         num_days = self.release.mandatory_days_in_testing
@@ -1614,6 +2393,18 @@ class Update(Base):
             return True
         return self.days_in_testing >= num_days
 
+    @property
+    def has_negative_feedback(self):
+        """ Return whether any user's votes on this update add up to < 0 """
+        query = DBSession.query(UpdateVote.id).filter(and_(
+            UpdateVote.update_id == self.id, UpdateVote.karma_total < 0))
+        return query.first() is not None
+
+    def get_vote(self, user):
+        """ Return the UpdateVote that a given user has cast, if any """
+        return DBSession.query(UpdateVote).filter_by(
+            update_id=self.id, user_id=user.id).first()
+
     @property
     def met_testing_requirements(self):
         """
@@ -1630,33 +2421,16 @@ class Update(Base):
                 return False
         else:
             return True
-        for comment in self.comments:
-            if comment.user.name == 'bodhi' and \
-               comment.text.startswith('This update has reached') and \
-               comment.text.endswith('days in testing and can be pushed to'
-                                     ' stable now if the maintainer wishes'):
-                return True
-        return False
+        return self.date_testing_approved is not None
 
     @property
     def days_in_testing(self):
         """ Return the number of days that this update has been in testing """
-        timestamp = None
-        for comment in self.comments[::-1]:
-            if comment.text == 'This update has been pushed to testing' and \
-                    comment.user.name == 'bodhi':
-                timestamp = comment.timestamp
-                if self.status == UpdateStatus.testing:
-                    return (datetime.utcnow() - timestamp).days
-                else:
-                    break
-        if not timestamp:
+        if not self.date_testing:
             return
-        for comment in self.comments:
-            if comment.text == 'This update has been pushed to stable' and \
-                    comment.user.name == 'bodhi':
-                return (comment.timestamp - timestamp).days
-        return (datetime.utcnow() - timestamp).days
+        if self.status != UpdateStatus.testing and self.date_stable:
+            return (self.date_stable - self.date_testing).days
+        return (datetime.utcnow() - self.date_testing).days
 
     @property
     def num_admin_approvals(self):
@@ -1713,10 +2487,10 @@ class BugKarma(Base):
 
     karma = Column(Integer, default=0)
 
-    comment_id = Column(Integer, ForeignKey('comments.id'))
+    comment_id = Column(Integer, ForeignKey('comments.id'), index=True)
     comment = relationship("Comment", backref='bug_feedback')
 
-    bug_id = Column(Integer, ForeignKey('bugs.bug_id'))
+    bug_id = Column(Integer, ForeignKey('bugs.bug_id'), index=True)
     bug = relationship("Bug", backref='feedback')
 
 
@@ -1726,29 +2500,133 @@ class TestCaseKarma(Base):
 
     karma = Column(Integer, default=0)
 
-    comment_id = Column(Integer, ForeignKey('comments.id'))
+    comment_id = Column(Integer, ForeignKey('comments.id'), index=True)
     comment = relationship("Comment", backref='testcase_feedback')
 
-    testcase_id = Column(Integer, ForeignKey('testcases.id'))
+    testcase_id = Column(Integer, ForeignKey('testcases.id'), index=True)
     testcase = relationship("TestCase", backref='feedback')
 
 
+class UpdateVote(Base):
+    """
+    The karma that a single user has given an update.
+
+    This is kept up to date by ``Update.comment`` so that the karma rules
+    never have to walk the whole comment history of an update.  ``karma`` and
+    ``karma_critpath`` are the user's most recent votes, ``karma_total`` is the
+    sum of every vote they have cast, and ``voted_up``/``voted_down`` record
+    whether they have ever given positive or negative karma.
+    """
+    __tablename__ = 'update_votes'
+    __table_args__ = (UniqueConstraint('update_id', 'user_id'),)
+
+    karma = Column(Integer, default=0, nullable=False)
+    karma_critpath = Column(Integer, default=0, nullable=False)
+    karma_total = Column(Integer, default=0, nullable=False)
+    voted_up = Column(Boolean, default=False, nullable=False)
+    voted_down = Column(Boolean, default=False, nullable=False)
+
+    update_id = Column(Integer, ForeignKey('updates.id', ondelete='CASCADE'),
+                       nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+
+    update = relationship('Update')
+    user = relationship('User')
+
+    def cast(self, karma, karma_critpath=0):
+        """
+        Record a new vote, returning how much it changes the update's karma.
+
+        Only the first vote in each direction counts, and switching direction
+        takes back the earlier vote as well.
+        """
+        delta = 0
+        if karma > 0 and not self.voted_up:
+            delta = self.voted_down and 2 or karma
+        elif karma < 0 and not self.voted_down:
+            delta = self.voted_up and -2 or karma
+        if karma:
+            self.karma = karma
+            self.karma_total += karma
+            self.voted_up = self.voted_up or karma > 0
+            self.voted_down = self.voted_down or karma < 0
+        if karma_critpath:
+            self.karma_critpath = karma_critpath
+        return delta
+
+
+class BugVote(Base):
+    """ The feedback a user's latest comment on an update gave one bug """
+    __tablename__ = 'update_bug_votes'
+
+    karma = Column(Integer, default=0, nullable=False)
+
+    update_id = Column(Integer, ForeignKey('updates.id', ondelete='CASCADE'),
+                       nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    bug_id = Column(Integer, ForeignKey('bugs.bug_id'), nullable=False)
+
+
+class TestCaseVote(Base):
+    """ The feedback a user's latest comment on an update gave one test """
+    __tablename__ = 'update_testcase_votes'
+
+    karma = Column(Integer, default=0, nullable=False)
+
+    update_id = Column(Integer, ForeignKey('updates.id', ondelete='CASCADE'),
+                       nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    testcase_id = Column(Integer, ForeignKey('testcases.id'), nullable=False)
+
+
 class Comment(Base):
     __tablename__ = 'comments'
     __exclude_columns__ = tuple()
     __get_by__ = ('id',)
     # If 'anonymous' is true, then scrub the 'author' field in __json__(...)
     __anonymity_map__ = {'author': 'anonymous'}
+    __table_args__ = (
+        Index('ix_comments_update_timestamp', 'update_id', 'timestamp'),
+        Index('ix_comments_user_timestamp', 'user_id', 'timestamp'),
+    )
 
     karma = Column(Integer, default=0)
     karma_critpath = Column(Integer, default=0)
     text = Column(UnicodeText)
     anonymous = Column(Boolean, default=False)
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    timestamp = Column(DateTime, default=datetime.utcnow, nullable=False,
+                       index=True)
 
     update_id = Column(Integer, ForeignKey('updates.id'))
     user_id = Column(Integer, ForeignKey('users.id'))
 
+    @classmethod
+    def loading_options(cls, relationships=None):
+        """
+        Return the query options that eagerly load what ends up in the JSON
+        of a list of comments, or only the given ``relationships`` of them.
+        """
+        # The update only shows the ids of its comments, so they are loaded
+        # without any of their own relationships
+        update = joinedload(cls.update)
+        options = {
+            'update': [update] + Update.loading_options(
+                'list', ['builds', 'bugs', 'cves', 'user', 'release'],
+                parent=update) + [
+                update.subqueryload(Update.comments).lazyload('*')],
+            'user': _user_options(subqueryload(cls.user)),
+            'bug_feedback': [subqueryload(cls.bug_feedback)
+                             .joinedload(BugKarma.bug)],
+            'testcase_feedback': [subqueryload(cls.testcase_feedback)
+                                  .joinedload(TestCaseKarma.testcase)],
+        }
+        if relationships is None:
+            return sum(options.values(), [])
+        result = [] if 'user' in relationships else [lazyload(cls.user)]
+        for name in relationships:
+            result.extend(options.get(name, []))
+        return result
+
     def url(self):
         url = '/updates/' + self.update.title + '#comment-' + str(self.id)
         return url
@@ -1842,16 +2720,16 @@ class Bug(Base):
 
 
 user_group_table = Table('user_group_table', Base.metadata,
-                         Column('user_id', Integer, ForeignKey('users.id')),
-                         Column('group_id', Integer, ForeignKey('groups.id')))
+                         Column('user_id', Integer, ForeignKey('users.id'), index=True),
+                         Column('group_id', Integer, ForeignKey('groups.id'), index=True))
 
 stack_group_table = Table('stack_group_table', Base.metadata,
-                          Column('stack_id', Integer, ForeignKey('stacks.id')),
-                          Column('group_id', Integer, ForeignKey('groups.id')))
+                          Column('stack_id', Integer, ForeignKey('stacks.id'), index=True),
+                          Column('group_id', Integer, ForeignKey('groups.id'), index=True))
 
 stack_user_table = Table('stack_user_table', Base.metadata,
-                         Column('stack_id', Integer, ForeignKey('stacks.id')),
-                         Column('user_id', Integer, ForeignKey('users.id')))
+                         Column('stack_id', Integer, ForeignKey('stacks.id'), index=True),
+                         Column('user_id', Integer, ForeignKey('users.id'), index=True))
 
 
 class User(Base):
@@ -1893,20 +2771,22 @@ class BuildrootOverride(Base):
     __tablename__ = 'buildroot_overrides'
     __get_by__ = ('build_id',)
 
-    build_id = Column(Integer, ForeignKey('builds.id'), nullable=False)
-    submitter_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    build_id = Column(Integer, ForeignKey('builds.id'), nullable=False,
+                      index=True)
+    submitter_id = Column(Integer, ForeignKey('users.id'), nullable=False,
+                          index=True)
     notes = Column(Unicode, nullable=False)
 
-    submission_date = Column(DateTime, default=datetime.utcnow, nullable=False)
-    expiration_date = Column(DateTime, nullable=False)
-    expired_date = Column(DateTime)
+    submission_date = Column(DateTime, default=datetime.utcnow,
+                             nullable=False, index=True)
+    expiration_date = Column(DateTime, nullable=False, index=True)
+    expired_date = Column(DateTime, index=True)
 
     build = relationship('Build', lazy='joined',
                          backref=backref('override', lazy='joined',
                                          uselist=False))
     submitter = relationship('User', lazy='joined',
-                             backref=backref('buildroot_overrides',
-                                             lazy='joined'))
+                             backref='buildroot_overrides')
 
     @classmethod
     def new(cls, request, **data):
@@ -2009,3 +2889,317 @@ class Stack(Base):
     # Many-to-many relationships
     groups = relationship("Group", secondary=stack_group_table, backref='stacks')
     users = relationship("User", secondary=stack_user_table, backref='stacks')
+
+
+# Full-text search indexes
+Update.search_index = SearchIndex(Update, ['title', 'notes'])
+hash_index('ix_updates_title', Update.__table__, 'title')
+Comment.search_index = SearchIndex(Comment, ['text'])
+Stack.search_index = SearchIndex(Stack, ['name', 'description'])
+
+
+# Invalidate the cached pages that show updates when they change
+def _update_namespaces(update):
+    namespaces = ['frontpage', 'updates', 'comments']
+    namespaces.extend('update:%s' % name
+                      for name in (update.title, update.alias) if name)
+    return namespaces
+
+
+def _update_changed(mapper, connection, target, charted=True):
+    namespaces = _update_namespaces(target)
+    if charted:
+        # The charts of /metrics and the release pages
+        namespaces.append('metrics')
+        moved_from = inspect(target).attrs.release_id.history.deleted
+        namespaces.extend('release:%s' % release_id for release_id in
+                          set([target.release_id]) | set(moved_from or ())
+                          if release_id is not None)
+    cache.invalidate_with(object_session(target), *namespaces)
+
+
+@event.listens_for(Update, 'after_insert')
+@event.listens_for(Update, 'after_delete')
+def _update_added_or_removed(mapper, connection, target):
+    _update_changed(mapper, connection, target)
+
+
+@event.listens_for(Update, 'after_update')
+def _update_edited(mapper, connection, target):
+    attrs = inspect(target).attrs
+    _update_changed(mapper, connection, target, charted=any(
+        getattr(attrs, name).history.has_changes()
+        for name in ('status', 'type', 'release_id', 'date_submitted')))
+
+
+def _values_of(target, name):
+    """ The values a column has had in the flush, leaving out NULLs """
+    values = set([getattr(target, name)])
+    values.update(getattr(inspect(target).attrs, name).history.deleted or ())
+    values.discard(None)
+    return list(values)
+
+
+def _invalidate_updates(session, connection, where, bump=True):
+    """
+    Invalidate the pages showing the updates matching a clause, if any, and
+    unless told otherwise bump their related_version.
+    """
+    updates = Update.__table__
+    rows = connection.execute(select([updates.c.title, updates.c.alias])
+                              .where(where)).fetchall()
+    if rows and bump:
+        connection.execute(updates.update().where(where).values(
+            related_version=updates.c.related_version + 1))
+    if rows:
+        namespaces = ['frontpage', 'updates', 'comments']
+        namespaces.extend('update:%s' % name for row in rows for name in row
+                          if name)
+        cache.invalidate_with(session, *namespaces)
+
+
+def _shown_with_users(user_ids):
+    """
+    A clause matching the updates that show some users, as their submitter or
+    as the author of a comment.
+    """
+    updates, comments = Update.__table__, Comment.__table__
+    return or_(updates.c.user_id.in_(user_ids), updates.c.id.in_(
+        select([comments.c.update_id]).where(comments.c.user_id.in_(user_ids))))
+
+
+@event.listens_for(Comment, 'after_insert')
+@event.listens_for(Comment, 'after_update')
+@event.listens_for(Comment, 'after_delete')
+def _comment_changed(mapper, connection, target):
+    # Read the foreign key, loading target.update would flush mid-flush
+    update_ids = _values_of(target, 'update_id')
+    if update_ids:
+        _invalidate_updates(object_session(target), connection,
+                            Update.__table__.c.id.in_(update_ids))
+    else:
+        cache.invalidate_with(object_session(target), 'frontpage', 'comments')
+
+
+@event.listens_for(Bug, 'after_insert')
+@event.listens_for(Bug, 'after_update')
+@event.listens_for(Bug, 'before_delete')
+def _bug_changed(mapper, connection, target):
+    _invalidate_updates(object_session(target), connection,
+                        Update.__table__.c.id.in_(
+                            select([update_bug_table.c.update_id]).where(
+                                update_bug_table.c.bug_id == target.id)))
+
+
+@event.listens_for(Build, 'after_insert')
+@event.listens_for(Build, 'after_update')
+@event.listens_for(Build, 'after_delete')
+def _build_changed(mapper, connection, target):
+    update_ids = _values_of(target, 'update_id')
+    if update_ids:
+        _invalidate_updates(object_session(target), connection,
+                            Update.__table__.c.id.in_(update_ids))
+
+
+@event.listens_for(BuildrootOverride, 'after_insert')
+@event.listens_for(BuildrootOverride, 'after_update')
+@event.listens_for(BuildrootOverride, 'after_delete')
+def _override_changed(mapper, connection, target):
+    # Overrides are shown with their build's update and with their submitter
+    builds = Build.__table__
+    _invalidate_updates(object_session(target), connection, or_(
+        Update.__table__.c.id.in_(
+            select([builds.c.update_id]).where(
+                builds.c.id.in_(_values_of(target, 'build_id')))),
+        _shown_with_users(_values_of(target, 'submitter_id'))))
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _user_changed(mapper, connection, target):
+    # Too many updates show a user to bump them all, conditional requests
+    # check the submitter's row itself
+    _invalidate_updates(object_session(target), connection,
+                        _shown_with_users([target.id]), bump=False)
+
+
+@event.listens_for(Update, 'after_delete')
+@event.listens_for(Comment, 'after_delete')
+def _row_deleted(mapper, connection, target):
+    # The lists tell they changed from the maxima of their columns, which
+    # a deleted row needn't change
+    CacheVersion.bump(u'%s:deleted' % mapper.local_table.name, connection)
+
+
+# Releases and groups are shown with too many updates to find them all, so
+# every page showing updates is invalidated at once through these namespaces
+@event.listens_for(Release, 'after_update')
+@event.listens_for(Release, 'after_delete')
+def _release_changed(mapper, connection, target):
+    cache.invalidate_with(object_session(target), 'releases')
+
+
+@event.listens_for(Group, 'after_update')
+@event.listens_for(Group, 'after_delete')
+def _group_changed(mapper, connection, target):
+    cache.invalidate_with(object_session(target), 'groups')
+
+
+_STATS_COLUMNS = ('release_id', 'status', 'type', 'critpath', 'karma',
+                  'date_testing', 'date_stable')
+
+
+def _count_update(session, counts):
+    for (release_id, name), amount in counts.items():
+        if release_id is not None and amount:
+            ReleaseStat.queue(session, release_id, name, amount)
+
+
+def _update_counts(values, amount, counts=None):
+    if counts is None:
+        counts = defaultdict(int)
+    for name in _update_stats(*values[1:]):
+        counts[values[0], name] += amount
+    return counts
+
+
+@event.listens_for(Update, 'after_insert')
+def _update_inserted(mapper, connection, target):
+    values = [getattr(target, name) for name in _STATS_COLUMNS]
+    _count_update(object_session(target), _update_counts(values, 1))
+
+
+@event.listens_for(Update, 'after_update')
+def _update_recounted(mapper, connection, target):
+    attrs = inspect(target).attrs
+    old, new = [], []
+    for name in _STATS_COLUMNS:
+        value = getattr(target, name)
+        deleted = getattr(attrs, name).history.deleted
+        old.append(deleted[0] if deleted else value)
+        new.append(value)
+    if old != new:
+        counts = _update_counts(old, -1)
+        _count_update(object_session(target),
+                      _update_counts(new, 1, counts))
+    if old[0] != new[0]:
+        _move_comments(connection, object_session(target), target.id,
+                       old[0], new[0])
+
+
+@event.listens_for(Update, 'after_delete')
+def _update_deleted(mapper, connection, target):
+    values = [getattr(target, name) for name in _STATS_COLUMNS]
+    _count_update(object_session(target), _update_counts(values, -1))
+
+
+_COMMENT_STATS_COLUMNS = ('update_id', 'user_id', 'karma', 'anonymous')
+
+
+def _count_comment(connection, session, comment_id, values, amount):
+    """
+    Count a comment with the given values in (or, with a negative amount,
+    out of) the statistics of its release.  Comments only count once they
+    belong to an update.
+    """
+    update_id, user_id, karma, anonymous = values
+    if update_id is None:
+        return
+    updates, comments, users = (Update.__table__, Comment.__table__,
+                                User.__table__)
+    release_id = connection.execute(select([updates.c.release_id])
+                                    .where(updates.c.id == update_id)).scalar()
+    if release_id is None:
+        return
+    username = None
+    if user_id is not None:
+        username = connection.execute(select([users.c.name])
+                                      .where(users.c.id == user_id)).scalar()
+
+    stats = _comment_stats(username, karma or 0, anonymous)
+    for name in stats:
+        ReleaseStat.queue(session, release_id, name, amount)
+
+    # The update got (or lost) feedback if this is its only such comment
+    if 'feedback:authenticated' in stats:
+        others = connection.execute(
+            select([func.count(comments.c.id)])
+            .select_from(comments.join(users,
+                                       comments.c.user_id == users.c.id))
+            .where(and_(comments.c.update_id == update_id,
+                        comments.c.id != comment_id,
+                        comments.c.karma != 0,
+                        comments.c.anonymous == False,
+                        ~users.c.name.in_(STATS_IGNORED_USERS)))).scalar()
+        if not others:
+            ReleaseStat.queue(session, release_id, 'feedback', amount)
+
+
+def _move_comments(connection, session, update_id, old_release_id,
+                   new_release_id):
+    """ Move the comment counters of an update that changed releases """
+    comments, users = Comment.__table__, User.__table__
+    rows = connection.execute(
+        select([users.c.name, comments.c.karma, comments.c.anonymous,
+                func.count(comments.c.id)])
+        .select_from(comments.outerjoin(users,
+                                        comments.c.user_id == users.c.id))
+        .where(comments.c.update_id == update_id)
+        .group_by(users.c.name, comments.c.karma, comments.c.anonymous))
+    counts = defaultdict(int)
+    for username, karma, anonymous, num in rows:
+        stats = _comment_stats(username, karma or 0, anonymous)
+        for name in stats:
+            counts[name] += num
+        if 'feedback:authenticated' in stats:
+            counts['feedback'] = 1
+    for release_id, sign in ((old_release_id, -1), (new_release_id, 1)):
+        if release_id is not None:
+            for name, num in counts.items():
+                ReleaseStat.queue(session, release_id, name, sign * num)
+
+
+@event.listens_for(Comment, 'after_insert')
+def _comment_inserted(mapper, connection, target):
+    values = [getattr(target, name) for name in _COMMENT_STATS_COLUMNS]
+    _count_comment(connection, object_session(target), target.id, values, 1)
+
+
+@event.listens_for(Comment, 'after_update')
+def _comment_recounted(mapper, connection, target):
+    # Update.comment() only attaches comments to their update and author
+    # after inserting them
+    attrs = inspect(target).attrs
+    old, new = [], []
+    for name in _COMMENT_STATS_COLUMNS:
+        value = getattr(target, name)
+        deleted = getattr(attrs, name).history.deleted
+        old.append(deleted[0] if deleted else value)
+        new.append(value)
+    if old != new:
+        session = object_session(target)
+        _count_comment(connection, session, target.id, old, -1)
+        _count_comment(connection, session, target.id, new, 1)
+
+
+@event.listens_for(Comment, 'after_delete')
+def _comment_deleted(mapper, connection, target):
+    values = [getattr(target, name) for name in _COMMENT_STATS_COLUMNS]
+    _count_comment(connection, object_session(target), target.id, values,
+                   -1)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_release_stats(session):
+    changes = session.info.pop('release_stats', None)
+    if changes:
+        try:
+            ReleaseStat.apply(session.get_bind(), changes)
+        except Exception:
+            # The transaction itself is over, run bodhi-rebuild-release-stats
+            log.exception('Unable to update the release statistics')
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_release_stats(session):
+    session.info.pop('release_stats', None)
@@ -0,0 +1,295 @@
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Pagination of the list services.
+
+Pages can be requested by number, which is what the web UI does, or by
+passing the opaque ``next`` token of the previous page back as ``after``.
+The latter is a keyset over the sort key and id of the last row that was
+seen, so every page costs the same no matter how deep into the results it
+is, which makes it the better choice for clients that crawl everything.
+
+The total number of results is kept in the :data:`count_cache`, so flipping
+through the pages of the same listing only counts it once.
+"""
+
+import json
+import math
+import uuid
+import base64
+import hashlib
+import logging
+
+from datetime import datetime
+
+from dogpile.cache import make_region
+from dogpile.cache.api import NO_VALUE
+from pyramid.settings import asbool
+from sqlalchemy import and_, or_, event
+from sqlalchemy.orm import Session, object_mapper
+from sqlalchemy.sql.util import find_tables
+
+log = logging.getLogger(__name__)
+
+
+def encode_cursor(values):
+    """ Turn the sort key and id of a row into an ``after`` token """
+    values = [isinstance(value, datetime) and value.isoformat() or value
+              for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values))
+
+
+def decode_cursor(token):
+    """ The inverse of encode_cursor, raising ValueError for a bad token """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(str(token)))
+    except (TypeError, ValueError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list) or not 1 <= len(values) <= 2:
+        raise ValueError('Invalid cursor')
+    return values
+
+
+def parse_cursor(token, id, key=None):
+    """
+    Decode an ``after`` token into the sort key and id of a listing ordered
+    by ``key`` and ``id``, raising ValueError if it isn't one of its tokens.
+    """
+    columns = _columns(id, key)
+    values = decode_cursor(token)
+    if len(values) != len(columns):
+        raise ValueError('Invalid cursor')
+    return [_parse(column, value) for column, value in zip(columns, values)]
+
+
+def _columns(id, key):
+    return [key, id] if key is not None else [id]
+
+
+def _parse(column, value):
+    if column.type.python_type is datetime:
+        for format in ('%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S'):
+            try:
+                return datetime.strptime(value, format)
+            except (TypeError, ValueError):
+                pass
+        raise ValueError('Invalid cursor')
+    if column.type.python_type is int:
+        if not isinstance(value, (int, long)) or isinstance(value, bool):
+            raise ValueError('Invalid cursor')
+    elif not isinstance(value, basestring):
+        raise ValueError('Invalid cursor')
+    return value
+
+
+class CountCache(object):
+    """
+    A cache of the number of rows that list queries match.
+
+    Entries are keyed by the SQL of the query and its parameters, so two
+    requests with the same filters share a count whatever page they are on.
+    They are kept for the region's (short) ``expiration_time``, and are
+    additionally invalidated whenever a row of one of the tables the query
+    reads from is written through a session, whether by a flush or by a bulk
+    ``Query.update()`` or ``Query.delete()``.
+
+    Like :class:`bodhi.buildsys.KojiCache`, invalidation works by bumping a
+    generation token per table, so pointing the region at a shared backend
+    shares invalidations between processes.
+    """
+
+    def __init__(self, region=None):
+        if region is None:
+            region = make_region().configure('dogpile.cache.memory',
+                                             expiration_time=60)
+        self.region = region
+        self.enabled = True
+
+    def _key(self, statement):
+        compiled = statement.compile()
+        arguments = repr((unicode(compiled), sorted(compiled.params.items())))
+        return 'count:%s' % hashlib.sha1(arguments.encode('utf-8')).hexdigest()
+
+    def _generations(self, tables):
+        generations = []
+        for table in tables:
+            value = self.region.get('count-generation:%s' % table,
+                                    ignore_expiration=True)
+            generations.append(None if value is NO_VALUE else value)
+        return generations
+
+    def count(self, query):
+        """ Return the number of rows a query matches """
+        query = query.order_by(None)
+        if not self.enabled:
+            return query.count()
+        statement = query.statement
+        tables = sorted(set(table.name for table in find_tables(
+            statement, include_joins=True, include_aliases=True)
+            if hasattr(table, 'name')))
+        key = self._key(statement)
+        generations = self._generations(tables)
+        stored = self.region.get(key)
+        if stored is not NO_VALUE and stored[0] == generations:
+            return stored[1]
+        value = query.count()
+        self.region.set(key, (generations, value))
+        return value
+
+    def invalidate(self, *tables):
+        """ Invalidate the counts of every query that reads these tables """
+        for table in tables:
+            log.debug('Invalidating cached counts of %s' % table)
+            self.region.set('count-generation:%s' % table, uuid.uuid4().hex)
+
+
+# The process-wide count cache, configured by setup_count_cache
+count_cache = CountCache()
+
+
+def setup_count_cache(settings):
+    """ Configure the :data:`count_cache` from ``count_cache.*`` """
+    region = make_region()
+    if settings.get('count_cache.backend'):
+        region.configure_from_config(settings, 'count_cache.')
+    else:
+        region.configure('dogpile.cache.memory', expiration_time=int(
+            settings.get('count_cache.expiration_time', 60)))
+    count_cache.region = region
+    count_cache.enabled = asbool(settings.get('count_cache.enabled', True))
+
+
+@event.listens_for(Session, 'after_flush')
+def _invalidate_flushed_tables(session, flush_context):
+    # Invalidate right away so that this session counts its own writes, and
+    # again once the transaction is over so that nobody keeps a count made
+    # in the meantime, which may not have seen them.
+    written = set()
+    for obj in session.new | session.dirty | session.deleted:
+        written.update(table.name for table in object_mapper(obj).tables)
+    session.info.setdefault('count_cache_tables', set()).update(written)
+    count_cache.invalidate(*written)
+
+
+@event.listens_for(Session, 'after_bulk_update')
+@event.listens_for(Session, 'after_bulk_delete')
+def _invalidate_bulk_table(context):
+    # Query.update() and Query.delete() don't go through the flush
+    table = context.primary_table.name
+    context.session.info.setdefault('count_cache_tables', set()).add(table)
+    count_cache.invalidate(table)
+
+
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_rollback')
+def _invalidate_written_tables(session):
+    count_cache.invalidate(*session.info.pop('count_cache_tables', ()))
+
+
+def estimate_count(query, threshold=10000):
+    """
+    Ask the database how many rows a query will return, without running it.
+
+    Only PostgreSQL can tell us, from the planner's statistics.  Estimates
+    are rough, so small results, where an exact count is cheap anyway, and
+    other databases get an exact count.
+    """
+    bind = query.session.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return count_cache.count(query)
+    statement = query.order_by(None).statement.compile(dialect=bind.dialect)
+    plan = query.session.connection().execute(
+        'EXPLAIN (FORMAT JSON) %s' % statement, statement.params).scalar()
+    if isinstance(plan, basestring):
+        plan = json.loads(plan)
+    estimate = int(plan[0]['Plan']['Plan Rows'])
+    if estimate < threshold:
+        return count_cache.count(query)
+    return estimate
+
+
+def paginate(query, data, id, key=None, descending=True, keyset=True):
+    """
+    Return one page of a query, along with the pagination details to put in
+    the response.
+
+    Rows are ordered by ``key`` and then ``id``, after any ordering the
+    query already has (such as search relevance).  Both columns must be
+    NOT NULL, so the ordering matches their indexes.  The ``after`` token only encodes the key and id, so queries
+    with an ordering of their own must pass ``keyset=False`` to be paged by
+    number, and get no ``next`` token.
+
+    ``data`` is the validated PaginatedSchema of the request, whose ``after``
+    token has been decoded by :func:`bodhi.validators.validate_after`.
+    """
+    columns = _columns(id, key)
+    if descending:
+        order = [column.desc() for column in columns]
+    else:
+        order = list(columns)
+    rows_per_page = data.get('rows_per_page')
+    page = data.get('page')
+
+    count = data.get('count')
+    if count == 'exact':
+        total = count_cache.count(query)
+    elif count == 'estimate':
+        total = estimate_count(query)
+    else:
+        total = None
+
+    after = data.get('after')
+    if after is not None:
+        query = query.order_by(None).order_by(*order)
+        query = query.filter(_after(columns, after, descending))
+    else:
+        query = query.order_by(*order)
+        query = query.offset(rows_per_page * (page - 1))
+
+    # Fetch one extra row to know whether there is a next page
+    rows = query.limit(rows_per_page + 1).all()
+    next = None
+    if len(rows) > rows_per_page:
+        rows = rows[:rows_per_page]
+        if keyset:
+            last = rows[-1]
+            next = encode_cursor([getattr(last, column.key)
+                                  for column in columns])
+
+    if total is not None:
+        pages = int(math.ceil(total / float(rows_per_page)))
+    else:
+        pages = None
+
+    return rows, dict(
+        page=page,
+        pages=pages,
+        rows_per_page=rows_per_page,
+        total=total,
+        next=next,
+    )
+
+
+def _after(columns, values, descending):
+    """ The rows that sort after the given sort key and id """
+    column, value = columns[0], values[0]
+    if descending:
+        beyond = column < value
+    else:
+        beyond = column > value
+    if len(columns) == 1:
+        return beyond
+    return or_(beyond, and_(column == value,
+                            _after(columns[1:], values[1:], descending)))
@@ -20,6 +20,7 @@ from kitchen.iterutils import iterate
 
 from bodhi.models import (UpdateRequest, UpdateSeverity, UpdateStatus,
                           UpdateSuggestion, UpdateType, ReleaseState)
+from bodhi.pagination import decode_cursor
 
 
 CVE_REGEX = re.compile(r"CVE-[0-9]{4,4}-[0-9]{4,}")
@@ -42,6 +43,10 @@ def splitter(value):
     return items
 
 
+class Fields(colander.SequenceSchema):
+    field = colander.SchemaNode(colander.String(), missing=None)
+
+
 class Bugs(colander.SequenceSchema):
     bug = colander.SchemaNode(colander.Integer(), missing=None)
 
@@ -204,6 +209,14 @@ class Cosmetics(colander.MappingSchema):
     )
 
 
+def validate_cursor(node, value):
+    """ Make sure an ``after`` token is one we handed out """
+    try:
+        decode_cursor(value)
+    except ValueError:
+        raise colander.Invalid(node, 'Invalid cursor')
+
+
 class PaginatedSchema(colander.MappingSchema):
     chrome = colander.SchemaNode(
         colander.Boolean(true_choices=('true', '1')),
@@ -225,6 +238,20 @@ class PaginatedSchema(colander.MappingSchema):
         missing=20,
     )
 
+    after = colander.SchemaNode(
+        colander.String(),
+        validator=validate_cursor,
+        location="querystring",
+        missing=None,
+    )
+
+    count = colander.SchemaNode(
+        colander.String(),
+        validator=colander.OneOf(['exact', 'estimate', 'none']),
+        location="querystring",
+        missing='exact',
+    )
+
 
 class SearchableSchema(colander.MappingSchema):
     like = colander.SchemaNode(
@@ -234,6 +261,30 @@ class SearchableSchema(colander.MappingSchema):
     )
 
 
+class FullTextSchema(colander.MappingSchema):
+    search = colander.SchemaNode(
+        colander.String(),
+        location="querystring",
+        missing=None,
+    )
+
+
+class SparseSchema(colander.MappingSchema):
+    fields = Fields(
+        colander.Sequence(accept_scalar=True),
+        location="querystring",
+        missing=None,
+        preparer=[splitter],
+    )
+
+    expand = Fields(
+        colander.Sequence(accept_scalar=True),
+        location="querystring",
+        missing=None,
+        preparer=[splitter],
+    )
+
+
 class ListReleaseSchema(PaginatedSchema):
     name = colander.SchemaNode(
         colander.String(),
@@ -307,7 +358,7 @@ class SaveReleaseSchema(colander.MappingSchema):
     )
 
 
-class ListStackSchema(PaginatedSchema, SearchableSchema):
+class ListStackSchema(PaginatedSchema, SearchableSchema, FullTextSchema):
     name = colander.SchemaNode(
         colander.String(),
         location="querystring",
@@ -373,7 +424,8 @@ class ListUserSchema(PaginatedSchema, SearchableSchema):
     )
 
 
-class ListUpdateSchema(PaginatedSchema, SearchableSchema, Cosmetics):
+class ListUpdateSchema(PaginatedSchema, SearchableSchema, FullTextSchema,
+                       SparseSchema, Cosmetics):
     approved_since = colander.SchemaNode(
         colander.DateTime(),
         location="querystring",
@@ -515,6 +567,45 @@ class ListBuildSchema(PaginatedSchema):
     )
 
 
+class ExportSchema(SparseSchema):
+    after = colander.SchemaNode(
+        colander.String(),
+        validator=validate_cursor,
+        location="querystring",
+        missing=None,
+    )
+
+    modified_since = colander.SchemaNode(
+        colander.DateTime(),
+        location="querystring",
+        missing=None,
+    )
+
+    releases = Releases(
+        colander.Sequence(accept_scalar=True),
+        location="querystring",
+        missing=None,
+        preparer=[splitter],
+    )
+
+
+class ExportUpdateSchema(ExportSchema):
+    status = colander.SchemaNode(
+        colander.String(),
+        location="querystring",
+        missing=None,
+        validator=colander.OneOf(UpdateStatus.values()),
+    )
+
+
+class LookupUpdateSchema(SparseSchema):
+    # Titles contain spaces, so these are not split like other lists
+    ids = Updates(
+        colander.Sequence(accept_scalar=True),
+        validator=colander.Length(min=1, max=1000),
+    )
+
+
 class UpdateRequestSchema(colander.MappingSchema):
     request = colander.SchemaNode(
         colander.String(),
@@ -522,7 +613,8 @@ class UpdateRequestSchema(colander.MappingSchema):
     )
 
 
-class ListCommentSchema(PaginatedSchema, SearchableSchema):
+class ListCommentSchema(PaginatedSchema, SearchableSchema, FullTextSchema,
+                        SparseSchema):
     updates = Updates(
         colander.Sequence(accept_scalar=True),
         location="querystring",
@@ -0,0 +1,73 @@
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Recompute the per-release statistics from the updates and comments.
+
+Besides filling in the statistics after the release_stats table is created,
+this is how counters are repaired after changes were lost, such as those of
+a process that died between committing and applying them, or that could not
+apply them (see ReleaseStat.apply).
+
+Stop everything that writes updates or comments (the web application, the
+masher and the fedmsg consumers) first, or changes committed while this
+runs may be counted twice.
+"""
+
+import logging
+import os
+import sys
+
+from pyramid.paster import get_appsettings, setup_logging
+from sqlalchemy import engine_from_config
+import transaction
+
+from ..models import DBSession, Release, ReleaseStat
+
+
+def usage(argv):
+    cmd = os.path.basename(argv[0])
+    print('usage: %s <config_uri> [release ...]\n'
+          '(example: "%s development.ini")' % (cmd, cmd))
+    sys.exit(1)
+
+
+def main(argv=sys.argv):
+    if len(argv) < 2:
+        usage(argv)
+
+    config_uri = argv[1]
+    names = argv[2:] or None
+
+    setup_logging(config_uri)
+    log = logging.getLogger(__name__)
+
+    settings = get_appsettings(config_uri)
+    engine = engine_from_config(settings, 'sqlalchemy.')
+    DBSession.configure(bind=engine)
+
+    with transaction.manager:
+        db = DBSession()
+        releases = None
+        if names:
+            releases = []
+            for name in names:
+                release = Release.get(name, db)
+                if release is None:
+                    log.error("Unknown release: %s", name)
+                    sys.exit(1)
+                releases.append(release)
+        ReleaseStat.rebuild(db, releases)
+        log.info("Rebuilt the statistics of %s",
+                 names and ', '.join(names) or 'every release')
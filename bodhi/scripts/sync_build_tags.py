@@ -0,0 +1,56 @@
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Seed or resynchronize the local Koji tag index from Koji itself.
+"""
+
+import logging
+import os
+import sys
+
+from pyramid.paster import get_appsettings, setup_logging
+from sqlalchemy import engine_from_config
+import transaction
+
+from .. import buildsys
+from ..models import DBSession, BuildTag
+
+
+def usage(argv):
+    cmd = os.path.basename(argv[0])
+    print('usage: %s <config_uri> [tag ...]\n'
+          '(example: "%s development.ini")' % (cmd, cmd))
+    sys.exit(1)
+
+
+def main(argv=sys.argv):
+    if len(argv) < 2:
+        usage(argv)
+
+    config_uri = argv[1]
+    tags = argv[2:] or None
+
+    setup_logging(config_uri)
+    log = logging.getLogger(__name__)
+
+    settings = get_appsettings(config_uri)
+    engine = engine_from_config(settings, 'sqlalchemy.')
+    DBSession.configure(bind=engine)
+    buildsys.setup_buildsystem(settings)
+
+    with transaction.manager:
+        db = DBSession()
+        added, removed = BuildTag.sync(db, buildsys.get_session(), tags=tags)
+        log.info("Added %d and removed %d tagged builds", added, removed)
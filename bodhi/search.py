@@ -0,0 +1,174 @@
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""
+Full-text search over the text columns of our models.
+
+On PostgreSQL the searchable text is covered by GIN indexes on the same
+``to_tsvector`` expressions that are used to query it, along with pg_trgm
+indexes that let the ``like`` filters use an index as well (see the alembic
+migration that creates them).
+
+SQLite, which the test suite and development instances run on, has no such
+indexes, so each searchable model gets an FTS5 table created alongside it and
+kept in sync by mapper events.  Not every SQLite is built with FTS5; without
+it the tables are not created, and searches fall back to unindexed ``LIKE``
+filters on the same columns.
+
+Bulk ``Query.update()`` and ``Query.delete()`` bypass the mapper events, so
+they leave the FTS5 tables stale.  Searches only return rows that still
+exist, but rows changed that way keep matching their old text until they are
+saved through the ORM again.
+
+Results are ordered by relevance, which a keyset ``after`` token cannot
+express, so searches are paged by number only.
+"""
+
+import re
+import weakref
+
+from sqlalchemy import and_, or_, event, func, false, inspect, literal_column
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.sql import table, column
+
+from bodhi import log
+
+WORD = re.compile(r'\w+', re.UNICODE)
+
+
+# The FTS5 tables of each SQLite engine, found when first needed
+_fts_tables = weakref.WeakKeyDictionary()
+
+
+def has_fts5(connection):
+    """ Return whether an SQLite database can hold our full-text indexes """
+    try:
+        connection.execute('CREATE VIRTUAL TABLE temp.fts5_check USING '
+                           'fts5(document)')
+        connection.execute('DROP TABLE temp.fts5_check')
+    except OperationalError:
+        return False
+    return True
+
+
+def fts_tables(connection):
+    """ The names of the FTS5 tables in an SQLite database """
+    tables = _fts_tables.get(connection.engine)
+    if tables is None:
+        tables = _fts_tables[connection.engine] = set(
+            name for name, in connection.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' "
+                "AND sql LIKE '%USING fts5%'"))
+    return tables
+
+
+class SearchIndex(object):
+    """
+    Make some text columns of a model searchable.
+
+    The last word of a search is treated as a prefix so that the index can be
+    used for typeahead, and results are ordered by relevance.
+    """
+
+    config = 'english'
+
+    def __init__(self, model, columns):
+        self.model = model
+        self.columns = columns
+        self.table_name = '%s_fts' % model.__tablename__
+        self.fts = table(self.table_name, column('rowid'),
+                         column(self.table_name), column('rank'))
+
+        model_table = model.__table__
+        event.listen(model_table, 'after_create', self._create)
+        event.listen(model_table, 'before_drop', self._drop)
+        event.listen(model, 'after_insert', self._index)
+        event.listen(model, 'after_update', self._reindex)
+        event.listen(model, 'after_delete', self._unindex)
+
+    def _create(self, target, connection, **kw):
+        if connection.dialect.name != 'sqlite':
+            return
+        if not has_fts5(connection):
+            log.warning('SQLite lacks FTS5, searching %s without an index'
+                        % self.model.__tablename__)
+            return
+        connection.execute('CREATE VIRTUAL TABLE %s USING fts5(document)'
+                           % self.table_name)
+        _fts_tables.pop(connection.engine, None)
+
+    def _drop(self, target, connection, **kw):
+        if connection.dialect.name == 'sqlite':
+            connection.execute('DROP TABLE IF EXISTS %s' % self.table_name)
+            _fts_tables.pop(connection.engine, None)
+
+    def _indexed(self, connection):
+        return connection.dialect.name == 'sqlite' and \
+            self.table_name in fts_tables(connection)
+
+    def document(self):
+        """ The SQL expression that PostgreSQL indexes for this model """
+        parts = [func.coalesce(getattr(self.model, name), literal_column("''"))
+                 for name in self.columns]
+        text = parts[0]
+        for part in parts[1:]:
+            text = text.op('||')(literal_column("' '")).op('||')(part)
+        return func.to_tsvector(literal_column("'%s'" % self.config), text)
+
+    def filter(self, query, terms):
+        """ Restrict a query to the rows that match, best matches first """
+        words = WORD.findall(terms)
+        if not words:
+            return query.filter(false())
+
+        connection = query.session.connection()
+        if self._indexed(connection):
+            match = u' '.join(u'"%s"' % word for word in words) + u'*'
+            return query.join(self.fts, self.fts.c.rowid == self.model.id)\
+                        .filter(self.fts.c[self.table_name].match(match))\
+                        .order_by(self.fts.c.rank)
+        elif connection.dialect.name == 'sqlite':
+            # Every word, somewhere in one of the columns
+            return query.filter(and_(*[
+                or_(*[getattr(self.model, name).like(u'%%%s%%' % word)
+                      for name in self.columns])
+                for word in words]))
+
+        tsquery = func.to_tsquery(literal_column("'%s'" % self.config),
+                                  u' & '.join(words) + u':*')
+        vector = self.document()
+        return query.filter(vector.op('@@')(tsquery))\
+                    .order_by(func.ts_rank_cd(vector, tsquery).desc())
+
+    def _text_of(self, target):
+        return u' '.join(getattr(target, name) or u'' for name in self.columns)
+
+    def _index(self, mapper, connection, target):
+        if self._indexed(connection):
+            connection.execute(
+                'INSERT INTO %s (rowid, document) VALUES (?, ?)'
+                % self.table_name, (target.id, self._text_of(target)))
+
+    def _reindex(self, mapper, connection, target):
+        state = inspect(target)
+        if not any(state.attrs[name].history.has_changes()
+                   for name in self.columns):
+            return
+        self._unindex(mapper, connection, target)
+        self._index(mapper, connection, target)
+
+    def _unindex(self, mapper, connection, target):
+        if self._indexed(connection):
+            connection.execute('DELETE FROM %s WHERE rowid = ?'
+                               % self.table_name, (target.id,))
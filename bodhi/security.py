@@ -16,6 +16,7 @@ from pyramid.security import (Allow, Deny, Everyone, Authenticated,
                               ALL_PERMISSIONS, DENY_ALL)
 from pyramid.security import remember, forget
 from pyramid.httpexceptions import HTTPFound
+from pyramid.decorator import reify
 
 from . import log
 from .models import User, Group, Update
@@ -42,13 +43,31 @@ def packagers_allowed_acl(request):
 
 def package_maintainers_only_acl(request):
     """An ACL that only allows package maintainers for a given package"""
-    update = Update.get(request.matchdict['id'], request.db)
+    # Loaded the way validate_update_id would, since the lookup is shared
+    update = Update.get(request.matchdict['id'], request.db,
+                        options=Update.loading_options('detail'))
     acl = admin_only_acl(request)
+    if update is None:
+        return acl
     for committer in update.get_maintainers():
         acl.insert(0, (Allow, committer, ALL_PERMISSIONS))
     return acl
 
 
+class PackageMaintainersOnly(object):
+    """
+    A route factory for package_maintainers_only_acl that only builds the ACL
+    once a permission is checked, so that anonymous reads and conditional
+    requests answered by a validator never load the update for it.
+    """
+    def __init__(self, request):
+        self.request = request
+
+    @reify
+    def __acl__(self):
+        return package_maintainers_only_acl(self.request)
+
+
 #
 # OpenID views
 #
@@ -91,7 +110,7 @@ def remember_me(context, request, info, *args, **kw):
 
     # Find the user in our database. Create it if it doesn't exist.
     db = request.db
-    user = db.query(User).filter_by(name=username).first()
+    user = User.get(username, db)
     if not user:
         user = User(name=username)
         db.add(user)
@@ -99,7 +118,7 @@ def remember_me(context, request, info, *args, **kw):
 
     # Keep track of what groups the user is a memeber of
     for group_name in info['groups']:
-        group = db.query(Group).filter_by(name=group_name).first()
+        group = Group.get(group_name, db)
         if not group:
             group = Group(name=group_name)
             db.add(group)
@@ -16,9 +16,9 @@ from cornice import Service
 from pyramid.exceptions import HTTPNotFound
 from sqlalchemy.sql import or_
 
-import math
 
 from bodhi import log
+from bodhi.pagination import paginate
 from bodhi.models import Update, Build, Bug, CVE, Package, User, Release, Group
 import bodhi.schemas
 import bodhi.security
@@ -35,6 +35,7 @@ from bodhi.validators import (
     validate_release,
     validate_username,
     validate_groups,
+    validate_after,
 )
 
 
@@ -57,7 +58,7 @@ def get_build(request):
 
 @builds.get(schema=bodhi.schemas.ListBuildSchema, renderer='json',
             validators=(validate_releases, validate_updates,
-                        validate_packages))
+                        validate_packages, validate_after(Build.id)))
 def query_builds(request):
     db = request.db
     data = request.validated
@@ -85,17 +86,9 @@ def query_builds(request):
         query = query.join(Build.release)
         query = query.filter(or_(*[Release.id==r.id for r in releases]))
 
-    total = query.count()
-
-    page = data.get('page')
-    rows_per_page = data.get('rows_per_page')
-    pages = int(math.ceil(total / float(rows_per_page)))
-    query = query.offset(rows_per_page * (page - 1)).limit(rows_per_page)
+    builds, pagination = paginate(query, data, Build.id, descending=False)
 
     return dict(
-        builds=query.all(),
-        page=page,
-        pages=pages,
-        rows_per_page=rows_per_page,
-        total=total,
+        builds=builds,
+        **pagination
     )
@@ -12,13 +12,14 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
-import math
 
 from cornice import Service
 from pyramid.httpexceptions import HTTPBadRequest
 from sqlalchemy.sql import or_
 
 from bodhi import log
+from bodhi.cache import cached_view
+from bodhi.pagination import paginate
 from bodhi.models import Comment, Build, Bug, CVE, Package, Update
 import bodhi.captcha
 import bodhi.schemas
@@ -33,11 +34,15 @@ from bodhi.validators import (
     validate_bug_feedback,
     validate_testcase_feedback,
     validate_captcha,
+    validate_comment_unchanged,
+    validate_comments_unchanged,
+    validate_search_cursor,
+    validate_after,
 )
 
 
 comment = Service(name='comment', path='/comments/{id}',
-                 validators=(validate_comment_id,),
+                 validators=(validate_comment_unchanged, validate_comment_id),
                  description='Comment submission service')
 
 comments = Service(name='comments', path='/comments/',
@@ -56,35 +61,51 @@ def get_comment(request):
 @comments.get(schema=bodhi.schemas.ListCommentSchema,
              accept=('application/json', 'text/json'), renderer='json',
              validators=(
+                 validate_comments_unchanged,
                  validate_username,
                  validate_update_owner,
                  validate_updates,
                  validate_packages,
-             ))
+                 validate_search_cursor,
+                 validate_after(Comment.id, Comment.timestamp),
+             ),
+             decorator=cached_view('comments', 'releases', 'groups'))
 @comments.get(schema=bodhi.schemas.ListCommentSchema,
              accept=('application/javascript'), renderer='jsonp',
              validators=(
+                 validate_comments_unchanged,
                  validate_username,
                  validate_update_owner,
                  validate_updates,
                  validate_packages,
-             ))
+                 validate_search_cursor,
+                 validate_after(Comment.id, Comment.timestamp),
+             ),
+             decorator=cached_view('comments', 'releases', 'groups'))
 @comments.get(schema=bodhi.schemas.ListCommentSchema,
              accept=('application/rss'), renderer='rss',
              validators=(
+                 validate_comments_unchanged,
                  validate_username,
                  validate_update_owner,
                  validate_updates,
                  validate_packages,
-             ))
+                 validate_search_cursor,
+                 validate_after(Comment.id, Comment.timestamp),
+             ),
+             decorator=cached_view('comments', 'releases', 'groups'))
 @comments.get(schema=bodhi.schemas.ListCommentSchema,
              accept=('text/html'), renderer='comments.html',
              validators=(
+                 validate_comments_unchanged,
                  validate_username,
                  validate_update_owner,
                  validate_updates,
                  validate_packages,
-             ))
+                 validate_search_cursor,
+                 validate_after(Comment.id, Comment.timestamp),
+             ),
+             decorator=cached_view('comments', 'releases', 'groups'))
 def query_comments(request):
     db = request.db
     data = request.validated
@@ -100,6 +121,10 @@ def query_comments(request):
             Comment.text.like('%%%s%%' % like)
         ]))
 
+    search = data.get('search')
+    if search is not None:
+        query = Comment.search_index.filter(query, search)
+
     packages = data.get('packages')
     if packages is not None:
         query = query\
@@ -125,22 +150,19 @@ def query_comments(request):
     if user is not None:
         query = query.filter(Comment.user==user)
 
-    query = query.order_by(Comment.timestamp.desc())
-
-    total = query.count()
-
-    page = data.get('page')
-    rows_per_page = data.get('rows_per_page')
-    pages = int(math.ceil(total / float(rows_per_page)))
-    query = query.offset(rows_per_page * (page - 1)).limit(rows_per_page)
+    relationships = None
+    if data.get('fields') is not None or data.get('expand') is not None:
+        relationships = Comment.json_relationships(data.get('fields'),
+                                                   data.get('expand'))
+    query = query.options(*Comment.loading_options(relationships))
+    comments, pagination = paginate(query, data, Comment.id,
+                                    Comment.timestamp,
+                                    keyset=search is None)
 
     return dict(
-        comments=query.all(),
-        page=page,
-        pages=pages,
-        rows_per_page=rows_per_page,
-        total=total,
+        comments=comments,
         chrome=data.get('chrome'),
+        **pagination
     )
 
 
@@ -0,0 +1,146 @@
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import json
+
+from cornice import Service
+from pyramid.response import Response
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.sql import or_
+
+from bodhi import log
+from bodhi.models import Comment, Update
+from bodhi.pagination import encode_cursor
+import bodhi.schemas
+from bodhi.validators import validate_enums, validate_releases, validate_after
+
+
+export_updates = Service(name='export_updates', path='/export/updates',
+                         description='Bulk export of updates')
+
+export_comments = Service(name='export_comments', path='/export/comments',
+                          description='Bulk export of comments')
+
+# How many rows are loaded, written out and forgotten at a time
+BATCH_SIZE = 500
+
+
+def stream(request, name, model, criteria=(), options=()):
+    """
+    Return a response that writes out every matching row of a model as a line
+    of JSON, in primary key order.
+
+    Each line is ``{"cursor": ..., name: {...}}``.  Passing the cursor of the
+    last line received as ``after`` resumes an interrupted export.
+
+    The response body is generated after the request's transaction is over,
+    so rows are read through a session of their own.  They are read in
+    batches, and each batch is forgotten before the next one is loaded, so
+    memory use does not grow with the size of the export.
+    """
+    after = request.validated.get('after')
+    if after is not None:
+        after = after[0]
+
+    engine = request.db.get_bind()
+
+    def lines(last=after):
+        session = sessionmaker(bind=engine)()
+        try:
+            while True:
+                query = session.query(model).options(*options)\
+                               .filter(*criteria)
+                if last is not None:
+                    query = query.filter(model.id > last)
+                batch = query.order_by(model.id).limit(BATCH_SIZE).all()
+                if not batch:
+                    break
+                for obj in batch:
+                    yield json.dumps({
+                        'cursor': encode_cursor([obj.id]),
+                        name: obj.__json__(request),
+                    }) + '\n'
+                last = batch[-1].id
+                session.expunge_all()
+        except Exception:
+            log.exception('Export of %s failed after %s' % (name, last))
+            raise
+        finally:
+            session.close()
+
+    return Response(app_iter=lines(), content_type='application/x-ndjson',
+                    charset='utf-8')
+
+
+@export_updates.get(schema=bodhi.schemas.ExportUpdateSchema,
+                    validators=(validate_releases, validate_enums,
+                                validate_after(Update.id)))
+def export_updates_ndjson(request):
+    """
+    Stream updates as newline delimited JSON.
+
+    ``modified_since`` picks the updates that were submitted, edited, pushed
+    or commented on since then, for incremental syncs.
+    """
+    data = request.validated
+    criteria = []
+
+    releases = data.get('releases')
+    if releases is not None:
+        criteria.append(Update.release_id.in_([r.id for r in releases]))
+
+    status = data.get('status')
+    if status is not None:
+        criteria.append(Update.status == status)
+
+    since = data.get('modified_since')
+    if since is not None:
+        criteria.append(or_(
+            Update.date_submitted >= since,
+            Update.date_modified >= since,
+            Update.date_pushed >= since,
+            Update.comments.any(Comment.timestamp >= since),
+        ))
+
+    relationships = None
+    if data.get('fields') is not None or data.get('expand') is not None:
+        relationships = Update.json_relationships(data.get('fields'),
+                                                  data.get('expand'))
+    return stream(request, 'update', Update, criteria,
+                  Update.loading_options('list', relationships))
+
+
+@export_comments.get(schema=bodhi.schemas.ExportSchema,
+                     validators=(validate_releases,
+                                 validate_after(Comment.id)))
+def export_comments_ndjson(request):
+    """ Stream comments as newline delimited JSON """
+    data = request.validated
+    criteria = []
+
+    releases = data.get('releases')
+    if releases is not None:
+        criteria.append(Comment.update.has(
+            Update.release_id.in_([r.id for r in releases])))
+
+    since = data.get('modified_since')
+    if since is not None:
+        criteria.append(Comment.timestamp >= since)
+
+    relationships = None
+    if data.get('fields') is not None or data.get('expand') is not None:
+        relationships = Comment.json_relationships(data.get('fields'),
+                                                   data.get('expand'))
+    return stream(request, 'comment', Comment, criteria,
+                  Comment.loading_options(relationships))
@@ -12,7 +12,6 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
-import math
 
 from cornice import Service
 from pyramid.exceptions import HTTPNotFound
@@ -20,11 +19,12 @@ from pyramid.exceptions import HTTPNotFound
 from sqlalchemy.sql import or_
 
 from bodhi import log
+from bodhi.pagination import paginate
 from bodhi.models import Build, BuildrootOverride, Package, Release
 import bodhi.schemas
 from bodhi.validators import (validate_override_build, validate_expiration_date,
                               validate_packages, validate_releases,
-                              validate_username)
+                              validate_username, validate_after)
 
 
 override = Service(name='override', path='/overrides/{nvr}',
@@ -60,22 +60,30 @@ def get_override(request):
 @overrides.get(schema=bodhi.schemas.ListOverrideSchema,
                accept=("application/json", "text/json"), renderer="json",
                validators=(validate_packages, validate_releases,
-                           validate_username)
+                           validate_username,
+                           validate_after(BuildrootOverride.id,
+                                          BuildrootOverride.submission_date))
                )
 @overrides.get(schema=bodhi.schemas.ListOverrideSchema,
                accept=("application/javascript"), renderer="jsonp",
                validators=(validate_packages, validate_releases,
-                           validate_username)
+                           validate_username,
+                           validate_after(BuildrootOverride.id,
+                                          BuildrootOverride.submission_date))
                )
 @overrides.get(schema=bodhi.schemas.ListOverrideSchema,
                accept=('application/rss'), renderer='rss',
                validators=(validate_packages, validate_releases,
-                           validate_username)
+                           validate_username,
+                           validate_after(BuildrootOverride.id,
+                                          BuildrootOverride.submission_date))
                )
 @overrides.get(schema=bodhi.schemas.ListOverrideSchema,
                accept=('text/html'), renderer='overrides.html',
                validators=(validate_packages, validate_releases,
-                           validate_username)
+                           validate_username,
+                           validate_after(BuildrootOverride.id,
+                                          BuildrootOverride.submission_date))
                )
 def query_overrides(request):
     db = request.db
@@ -103,22 +111,14 @@ def query_overrides(request):
     if submitter is not None:
         query = query.filter(BuildrootOverride.submitter==submitter)
 
-    query = query.order_by(BuildrootOverride.submission_date.desc())
-    total = query.count()
-
-    page = data.get('page')
-    rows_per_page = data.get('rows_per_page')
-    pages = int(math.ceil(total / float(rows_per_page)))
-    query = query.offset(rows_per_page * (page - 1)).limit(rows_per_page)
+    overrides, pagination = paginate(
+        query, data, BuildrootOverride.id, BuildrootOverride.submission_date)
 
     return dict(
-        overrides=query.all(),
-        page=page,
-        pages=pages,
-        rows_per_page=rows_per_page,
-        total=total,
+        overrides=overrides,
         chrome=data.get('chrome'),
         display_user=data.get('display_user'),
+        **pagination
     )
 
 
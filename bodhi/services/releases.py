@@ -12,14 +12,17 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
-import math
 
-from datetime import datetime, timedelta
+from collections import OrderedDict
+
 from cornice import Service
 from pyramid.exceptions import HTTPNotFound
+from sqlalchemy import extract, func
 from sqlalchemy.sql import or_
 
 from bodhi import log
+from bodhi.cache import cache
+from bodhi.pagination import paginate
 from bodhi.models import Update, Build, Package, Release
 import bodhi.schemas
 import bodhi.security
@@ -37,6 +40,7 @@ from bodhi.validators import (
     validate_release,
     validate_username,
     validate_groups,
+    validate_after,
 )
 
 
@@ -56,33 +60,36 @@ def get_release_html(request):
         Update.release==release).order_by(
             Update.date_submitted.desc())
 
-    updates_count = request.db.query(Update.date_submitted, Update.type).filter(
-        Update.release==release).order_by(
-            Update.date_submitted.desc())
-
-    now = updates[0].date_submitted
-    year = timedelta(days=365)
-    diff = now - year
-
-    date_commits = {}
-    dates = set()
-
-    for update in updates_count.all():
-        d = update.date_submitted
-        yearmonth = str(d.year) + '/' + str(d.month).zfill(2)
-        dates.add(yearmonth)
-        if not update.type.description in date_commits:
-            date_commits[update.type.description] = {}
-        if yearmonth in date_commits[update.type.description]:
-            date_commits[update.type.description][yearmonth] += 1
-        else:
-            date_commits[update.type.description][yearmonth] = 0
+    def work():
+        # Number of updates of each type submitted per month
+        year = extract('year', Update.date_submitted).label('year')
+        month = extract('month', Update.date_submitted).label('month')
+        rows = request.db.query(Update.type, year, month,
+                                func.count(Update.id))\
+            .filter(Update.release_id == release.id)\
+            .group_by(Update.type, year, month).all()
+
+        dates = sorted(set('%d/%02d' % (row.year, row.month)
+                           for row in rows if row.year is not None))
+        date_commits = {}
+        for type, y, m, num in rows:
+            if y is None:
+                continue
+            commits = date_commits.setdefault(
+                type.description, OrderedDict((d, 0) for d in dates))
+            commits['%d/%02d' % (y, m)] += num
+        return date_commits, dates, sum(row[-1] for row in rows)
+
+    date_commits, dates, count = {}, [], 0
+    if release:
+        date_commits, dates, count = cache.get_or_create(
+            'chart', work, namespaces=['release:%d' % release.id, 'releases'])
 
     return dict(release=release,
                 latest_updates=updates.limit(25).all(),
-                count=updates.count(),
+                count=count,
                 date_commits=date_commits,
-                dates = sorted(dates))
+                dates=dates)
 
 @release.get(accept=('application/json', 'text/json'), renderer='json')
 @release.get(accept=('application/javascript'), renderer='jsonp')
@@ -115,7 +122,7 @@ def query_releases_html(request):
 @releases.get(accept=('application/json', 'text/json'),
               schema=bodhi.schemas.ListReleaseSchema, renderer='json',
               validators=(validate_release, validate_updates,
-                          validate_packages))
+                          validate_packages, validate_after(Release.id)))
 def query_releases_json(request):
     db = request.db
     data = request.validated
@@ -138,19 +145,11 @@ def query_releases_json(request):
         query = query.join(Release.builds).join(Build.package)
         query = query.filter(or_(*[Package.id == p.id for p in packages]))
 
-    total = query.count()
-
-    page = data.get('page')
-    rows_per_page = data.get('rows_per_page')
-    pages = int(math.ceil(total / float(rows_per_page)))
-    query = query.offset(rows_per_page * (page - 1)).limit(rows_per_page)
+    releases, pagination = paginate(query, data, Release.id, descending=False)
 
     return dict(
-        releases=query.all(),
-        page=page,
-        pages=pages,
-        rows_per_page=rows_per_page,
-        total=total,
+        releases=releases,
+        **pagination
     )
 
 @releases.post(schema=bodhi.schemas.SaveReleaseSchema,
@@ -12,7 +12,6 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
-import math
 
 from cornice import Service
 from pyramid.view import view_config
@@ -22,6 +21,7 @@ from sqlalchemy.sql import or_
 
 from bodhi import log, notifications
 from bodhi.models import Package, Stack, Group, User
+from bodhi.pagination import paginate
 import bodhi.schemas
 import bodhi.security
 from bodhi.util import tokenize
@@ -29,6 +29,8 @@ from bodhi.validators import (
     validate_packages,
     validate_stack,
     validate_requirements,
+    validate_search_cursor,
+    validate_after,
 )
 
 
@@ -49,14 +51,17 @@ def get_stack(request):
 
 @stacks.get(accept="text/html", renderer='stacks.html',
             schema=bodhi.schemas.ListStackSchema,
-            validators=(validate_packages,))
+            validators=(validate_packages, validate_search_cursor,
+                        validate_after(Stack.id, Stack.name)))
 @stacks.get(accept=('application/json', 'text/json'),
             schema=bodhi.schemas.ListStackSchema,
-            validators=(validate_packages,), renderer='json')
+            validators=(validate_packages, validate_search_cursor,
+                        validate_after(Stack.id, Stack.name)),
+            renderer='json')
 def query_stacks(request):
     """Return a paginated list of stacks"""
     data = request.validated
-    query = request.db.query(Stack).order_by(Stack.name.desc())
+    query = request.db.query(Stack)
 
     name = data.get('name')
     if name:
@@ -66,23 +71,21 @@ def query_stacks(request):
     if like:
         query = query.filter(Stack.name.like('%%%s%%' % like))
 
+    search = data.get('search')
+    if search is not None:
+        query = Stack.search_index.filter(query, search)
+
     packages = data.get('packages')
     if packages:
         query = query.join(Package.stack)
         query = query.filter(or_(*[Package.name==pkg.name for pkg in packages]))
 
-    total = query.count()
-    page = data.get('page')
-    rows_per_page = data.get('rows_per_page')
-    pages = int(math.ceil(total / float(rows_per_page)))
-    query = query.offset(rows_per_page * (page - 1)).limit(rows_per_page)
+    stacks, pagination = paginate(query, data, Stack.id, Stack.name,
+                                  keyset=search is None)
 
     return dict(
-        stacks=query.all(),
-        page=page,
-        pages=pages,
-        rows_per_page=rows_per_page,
-        total=total,
+        stacks=stacks,
+        **pagination
     )
 
 
@@ -12,13 +12,14 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
-import math
 
 from cornice import Service
 from pyramid.security import has_permission
 from sqlalchemy.sql import or_
 
 from bodhi import log
+from bodhi.cache import cached_view
+from bodhi.pagination import paginate
 from bodhi.exceptions import BodhiException, LockedUpdateException
 from bodhi.models import Update, Build, Bug, CVE, Package, UpdateRequest
 import bodhi.schemas
@@ -35,35 +36,47 @@ from bodhi.validators import (
     validate_username,
     validate_update_id,
     validate_requirements,
+    validate_update_unchanged,
+    validate_updates_unchanged,
+    validate_search_cursor,
+    validate_after,
 )
 
 
 update = Service(name='update', path='/updates/{id}',
-                 validators=(validate_update_id,),
+                 validators=(validate_update_unchanged, validate_update_id),
                  description='Update submission service',
-                 acl=bodhi.security.package_maintainers_only_acl)
+                 factory=bodhi.security.PackageMaintainersOnly)
 
 update_edit = Service(name='update_edit', path='/updates/{id}/edit',
                  validators=(validate_update_id,),
                  description='Update submission service',
-                 acl=bodhi.security.package_maintainers_only_acl)
+                 factory=bodhi.security.PackageMaintainersOnly)
 
 updates = Service(name='updates', path='/updates/',
                   acl=bodhi.security.packagers_allowed_acl,
                   description='Update submission service')
 
+updates_lookup = Service(name='updates_lookup', path='/lookup/updates',
+                         description='Batch lookup of updates')
+
 update_request = Service(name='update_request', path='/updates/{id}/request',
                          description='Update request service',
-                         acl=bodhi.security.package_maintainers_only_acl)
+                         factory=bodhi.security.PackageMaintainersOnly)
 
 
-@update.get(accept=('application/json', 'text/json'), renderer='json')
-@update.get(accept=('application/javascript'), renderer='jsonp')
-@update.get(accept="text/html", renderer="update.html")
+@update.get(accept=('application/json', 'text/json'), renderer='json',
+            decorator=cached_view('update:%(id)s', 'releases', 'groups'))
+@update.get(accept=('application/javascript'), renderer='jsonp',
+            decorator=cached_view('update:%(id)s', 'releases', 'groups'))
+@update.get(accept="text/html", renderer="update.html",
+            decorator=cached_view('update:%(id)s', 'releases', 'groups'))
 def get_update(request):
     """Return a single update from an id, title, or alias"""
     can_edit = has_permission('edit', request.context, request)
-    return dict(update=request.validated['update'], can_edit=can_edit)
+    update = request.validated['update']
+    return dict(update=update, can_edit=can_edit,
+                feedback=update.get_feedback_karma())
 
 
 @update_edit.get(accept="text/html", renderer="new_update.html")
@@ -106,18 +119,52 @@ def set_request(request):
     return dict(update=update)
 
 
+@updates_lookup.post(schema=bodhi.schemas.LookupUpdateSchema,
+                     renderer='json')
+def lookup_updates(request):
+    """
+    Return many updates at once, keyed by the aliases, titles or build NVRs
+    they were requested by.  Identifiers that don't match an update map to
+    null.
+    """
+    data = request.validated
+    relationships = None
+    if data.get('fields') is not None or data.get('expand') is not None:
+        relationships = Update.json_relationships(data.get('fields'),
+                                                  data.get('expand'))
+    return dict(updates=Update.lookup(
+        data['ids'], request.db,
+        options=Update.loading_options('list', relationships)))
+
+
 @updates.get(schema=bodhi.schemas.ListUpdateSchema,
              accept=('application/json', 'text/json'), renderer='json',
-             validators=(validate_releases, validate_enums, validate_username))
+             validators=(validate_updates_unchanged, validate_releases,
+                         validate_enums, validate_username,
+                         validate_search_cursor,
+                         validate_after(Update.id, Update.date_submitted)),
+             decorator=cached_view('updates', 'releases', 'groups'))
 @updates.get(schema=bodhi.schemas.ListUpdateSchema,
              accept=('application/javascript'), renderer='jsonp',
-             validators=(validate_releases, validate_enums, validate_username))
+             validators=(validate_updates_unchanged, validate_releases,
+                         validate_enums, validate_username,
+                         validate_search_cursor,
+                         validate_after(Update.id, Update.date_submitted)),
+             decorator=cached_view('updates', 'releases', 'groups'))
 @updates.get(schema=bodhi.schemas.ListUpdateSchema,
              accept=('application/rss'), renderer='rss',
-             validators=(validate_releases, validate_enums, validate_username))
+             validators=(validate_updates_unchanged, validate_releases,
+                         validate_enums, validate_username,
+                         validate_search_cursor,
+                         validate_after(Update.id, Update.date_submitted)),
+             decorator=cached_view('updates', 'releases', 'groups'))
 @updates.get(schema=bodhi.schemas.ListUpdateSchema,
              accept=('text/html'), renderer='updates.html',
-             validators=(validate_releases, validate_enums, validate_username))
+             validators=(validate_updates_unchanged, validate_releases,
+                         validate_enums, validate_username,
+                         validate_search_cursor,
+                         validate_after(Update.id, Update.date_submitted)),
+             decorator=cached_view('updates', 'releases', 'groups'))
 def query_updates(request):
     db = request.db
     data = request.validated
@@ -149,6 +196,10 @@ def query_updates(request):
             Update.title.like('%%%s%%' % like)
         ]))
 
+    search = data.get('search')
+    if search is not None:
+        query = Update.search_index.filter(query, search)
+
     locked = data.get('locked')
     if locked is not None:
         query = query.filter(Update.locked==locked)
@@ -202,22 +253,20 @@ def query_updates(request):
     if user is not None:
         query = query.filter(Update.user==user)
 
-    query = query.order_by(Update.date_submitted.desc())
-    total = query.count()
-
-    page = data.get('page')
-    rows_per_page = data.get('rows_per_page')
-    pages = int(math.ceil(total / float(rows_per_page)))
-    query = query.offset(rows_per_page * (page - 1)).limit(rows_per_page)
+    relationships = None
+    if data.get('fields') is not None or data.get('expand') is not None:
+        relationships = Update.json_relationships(data.get('fields'),
+                                                  data.get('expand'))
+    query = query.options(*Update.loading_options('list', relationships))
+    updates, pagination = paginate(query, data, Update.id,
+                                   Update.date_submitted,
+                                   keyset=search is None)
 
     return dict(
-        updates=query.all(),
-        page=page,
-        pages=pages,
-        rows_per_page=rows_per_page,
-        total=total,
+        updates=updates,
         chrome=data.get('chrome'),
         display_user=data.get('display_user'),
+        **pagination
     )
 
 
@@ -16,7 +16,6 @@ from cornice import Service
 from pyramid.exceptions import HTTPNotFound
 from sqlalchemy.sql import or_, and_
 
-import math
 
 from bodhi.models import (
     BuildrootOverride,
@@ -26,12 +25,14 @@ from bodhi.models import (
     Update,
     User,
 )
+from bodhi.pagination import paginate
 import bodhi.services.updates
 import bodhi.schemas
 from bodhi.validators import (
     validate_updates,
     validate_packages,
     validate_groups,
+    validate_after,
 )
 
 
@@ -70,13 +71,16 @@ def get_user(request):
 
 @users.get(schema=bodhi.schemas.ListUserSchema,
            accept=("application/json", "text/json"), renderer="json",
-           validators=(validate_groups, validate_updates, validate_packages))
+           validators=(validate_groups, validate_updates, validate_packages,
+                       validate_after(User.id)))
 @users.get(schema=bodhi.schemas.ListUserSchema,
            accept=("application/javascript"), renderer="jsonp",
-           validators=(validate_groups, validate_updates, validate_packages))
+           validators=(validate_groups, validate_updates, validate_packages,
+                       validate_after(User.id)))
 @users.get(schema=bodhi.schemas.ListUserSchema,
            accept=("application/rss"), renderer="rss",
-           validators=(validate_groups, validate_updates, validate_packages))
+           validators=(validate_groups, validate_updates, validate_packages,
+                       validate_after(User.id)))
 def query_users(request):
     db = request.db
     data = request.validated
@@ -110,17 +114,9 @@ def query_users(request):
         query = query.join(User.packages)
         query = query.filter(or_(*[Package.id==p.id for p in packages]))
 
-    total = query.count()
-
-    page = data.get('page')
-    rows_per_page = data.get('rows_per_page')
-    pages = int(math.ceil(total / float(rows_per_page)))
-    query = query.offset(rows_per_page * (page - 1)).limit(rows_per_page)
+    users, pagination = paginate(query, data, User.id, descending=False)
 
     return dict(
-        users=query.all(),
-        page=page,
-        pages=pages,
-        rows_per_page=rows_per_page,
-        total=total,
+        users=users,
+        **pagination
     )
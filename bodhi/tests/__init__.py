@@ -15,6 +15,7 @@ from bodhi.models import (
     User,
     UpdateStatus,
     UpdateRequest,
+    UpdateVote,
     TestCase,
 )
 
@@ -70,6 +71,8 @@ def populate(db):
     comment.user = user
     update.comments.append(comment)
     update.karma = 1
+    db.add(UpdateVote(update=update, user=user, karma=1, karma_total=1,
+                      voted_up=True))
 
     comment = Comment(karma=0, text="srsly.  pretty good.", anonymous=True)
     comment.user = anonymous
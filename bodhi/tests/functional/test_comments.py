@@ -235,6 +235,38 @@ class TestCommentsService(bodhi.tests.functional.base.BaseWSGICase):
         self.assertEquals(res.json_body['comment']['user_id'], 1)
         self.assertEquals(res.json_body['comment']['id'], 1)
 
+    def test_get_single_comment_not_modified(self):
+        res = self.app.get('/comments/1')
+        self.app.get('/comments/1',
+                     headers={'If-None-Match': res.headers['ETag']},
+                     status=304)
+
+    def test_list_comments_not_modified(self):
+        res = self.app.get('/comments/', {'rows_per_page': 1})
+        last_modified = res.headers['Last-Modified']
+        self.app.get('/comments/', {'rows_per_page': 1},
+                     headers={'If-Modified-Since': last_modified},
+                     status=304)
+
+        # Other filters are another resource
+        self.app.get('/comments/', {'rows_per_page': 2},
+                     headers={'If-None-Match': res.headers['ETag']},
+                     status=200)
+
+    def test_list_comments_not_modified_after_delete(self):
+        update = self.db.query(Update).first()
+        user = self.db.query(User).first()
+        first = self.db.query(Comment).first()
+        self.db.add(Comment(text=u'Fair', karma=0, update=update, user=user))
+        self.db.flush()
+        etag = self.app.get('/comments/').headers['ETag']
+
+        # Removing an older comment leaves the newest ids and dates alone
+        self.db.delete(first)
+        self.db.flush()
+        res = self.app.get('/comments/', headers={'If-None-Match': etag})
+        self.assertNotEquals(res.headers['ETag'], etag)
+
     def test_get_single_comment_page(self):
         res = self.app.get('/comments/1', headers=dict(accept='text/html'))
         self.assertIn('text/html', res.headers['Content-Type'])
@@ -260,6 +292,28 @@ class TestCommentsService(bodhi.tests.functional.base.BaseWSGICase):
         self.assertEquals(comment['text'], u'srsly.  pretty good.')
         self.assertEquals(comment['karma'], 0)
 
+    def test_list_comments_sparse_fields(self):
+        res = self.app.get('/comments/', {'fields': 'text,user'})
+        comment = res.json_body['comments'][0]
+        self.assertEquals(sorted(comment), ['text', 'user'])
+        self.assertEquals(comment['user']['name'], u'anonymous')
+
+    def test_list_comments_query_count(self):
+        def queries():
+            self.db.expire_all()
+            del self.sql_statements[:]
+            self.app.get('/comments/')
+            return len(self.sql_statements)
+
+        before = queries()
+        update = Update.get(u'bodhi-2.0-1.fc17', self.db)
+        for name in (u'lmacken', u'bowlofeggs'):
+            self.db.add(User(name=name))
+            self.db.flush()
+            update.comment(u'Works for me', author=name)
+        self.db.flush()
+        self.assertEquals(queries(), before)
+
     def test_list_comments_jsonp(self):
         res = self.app.get('/comments/',
                            {'callback': 'callback'},
@@ -291,6 +345,20 @@ class TestCommentsService(bodhi.tests.functional.base.BaseWSGICase):
         body = res.json_body
         self.assertEquals(len(body['comments']), 0)
 
+    def test_full_text_search_comments(self):
+        res = self.app.get('/comments/', {'search': 'pretty'})
+        body = res.json_body
+        self.assertEquals(len(body['comments']), 1)
+        self.assertEquals(body['comments'][0]['text'],
+                          u'srsly.  pretty good.')
+
+        # The last word is matched as a prefix
+        res = self.app.get('/comments/', {'search': 'srsly pre'})
+        self.assertEquals(len(res.json_body['comments']), 1)
+
+        res = self.app.get('/comments/', {'search': 'pretty bad'})
+        self.assertEquals(len(res.json_body['comments']), 0)
+
     def test_list_comments_pagination(self):
         # Then, test pagination
         res = self.app.get('/comments/',
@@ -307,6 +375,43 @@ class TestCommentsService(bodhi.tests.functional.base.BaseWSGICase):
 
         self.assertNotEquals(comment1, comment2)
 
+    def test_list_comments_after_cursor(self):
+        res = self.app.get('/comments/', {"rows_per_page": 1, "page": 2})
+        comment2 = res.json_body['comments'][0]
+
+        res = self.app.get('/comments/', {"rows_per_page": 1})
+        body = res.json_body
+        self.assertIsNotNone(body['next'])
+
+        res = self.app.get('/comments/',
+                           {"rows_per_page": 1, "after": body['next']})
+        body = res.json_body
+        self.assertEquals(body['comments'], [comment2])
+
+    def test_list_comments_cached_total(self):
+        res = self.app.get('/comments/')
+        total = res.json_body['total']
+
+        update = self.db.query(Update).first()
+        user = self.db.query(User).first()
+        self.db.add(Comment(text=u'Fair', karma=0, update=update, user=user))
+        self.db.flush()
+        res = self.app.get('/comments/')
+        eq_(res.json_body['total'], total + 1)
+
+        # Bulk writes skip the flush, but are noticed as well
+        res = self.app.get('/comments/', {'like': 'Unfair'})
+        eq_(res.json_body['total'], 0)
+        self.db.query(Comment).filter_by(text=u'Fair').update(
+            {'text': u'Unfair'}, synchronize_session=False)
+        res = self.app.get('/comments/', {'like': 'Unfair'})
+        eq_(res.json_body['total'], 1)
+
+        self.db.query(Comment).filter_by(text=u'Unfair').delete(
+            synchronize_session=False)
+        res = self.app.get('/comments/')
+        eq_(res.json_body['total'], total)
+
     def test_list_comments_by_since(self):
         tomorrow = datetime.utcnow() + timedelta(days=1)
         fmt = "%Y-%m-%d %H:%M:%S"
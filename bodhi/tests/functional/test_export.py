@@ -0,0 +1,83 @@
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import json
+
+from nose.tools import eq_
+
+import bodhi.tests.functional.base
+
+from bodhi.models import Update
+
+
+class TestExportService(bodhi.tests.functional.base.BaseWSGICase):
+
+    def lines(self, res):
+        return [json.loads(line) for line in res.body.splitlines()]
+
+    def test_export_updates(self):
+        res = self.app.get('/export/updates')
+        eq_(res.content_type, 'application/x-ndjson')
+        lines = self.lines(res)
+        eq_(len(lines), 1)
+        up = lines[0]['update']
+        eq_(up['title'], u'bodhi-2.0-1.fc17')
+        eq_(up['builds'][0]['nvr'], u'bodhi-2.0-1.fc17')
+        eq_(len(up['comments']), len(self.db.query(Update).one().comments))
+
+    def test_export_updates_fields(self):
+        res = self.app.get('/export/updates', {'fields': 'title,status'})
+        up = self.lines(res)[0]['update']
+        eq_(sorted(up.keys()), [u'status', u'title'])
+
+    def test_export_updates_by_status(self):
+        res = self.app.get('/export/updates', {'status': 'stable'})
+        eq_(self.lines(res), [])
+
+    def test_export_comments_resume(self):
+        update = self.db.query(Update).one()
+        update.comment(u'another one', author=u'guest')
+        self.db.flush()
+
+        lines = self.lines(self.app.get('/export/comments'))
+        eq_(len(lines), len(update.comments))
+        ids = [line['comment']['id'] for line in lines]
+        eq_(ids, sorted(ids))
+
+        res = self.app.get('/export/comments', {'after': lines[0]['cursor']})
+        eq_([line['comment']['id'] for line in self.lines(res)], ids[1:])
+
+    def test_export_comments_query_count(self):
+        def statements():
+            del self.sql_statements[:]
+            self.lines(self.app.get('/export/comments'))
+            return len(self.sql_statements)
+
+        update = self.db.query(Update).one()
+        update.comment(u'another one', author=u'guest')
+        self.db.flush()
+        count = statements()
+        for i in range(3):
+            update.comment(u'one more', author=u'user%d' % i)
+        self.db.flush()
+        eq_(statements(), count)
+
+    def test_export_comments_fields(self):
+        res = self.app.get('/export/comments', {'fields': 'text,user'})
+        comment = self.lines(res)[0]['comment']
+        eq_(sorted(comment.keys()), [u'text', u'user'])
+
+    def test_export_invalid_cursor(self):
+        res = self.app.get('/export/comments', {'after': 'garbage'}, status=400)
+        eq_(res.json_body['errors'][0]['name'], 'after')
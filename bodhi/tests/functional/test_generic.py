@@ -12,12 +12,18 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
+import mock
+
 import bodhi.tests.functional.base
 
+from bodhi import main
 from bodhi.security import remember_me
-from bodhi.models import DBSession, User, Group
+from bodhi.views.search import package_index
+from bodhi.models import (DBSession, User, Group, Release, Update,
+                          UpdateStatus)
 
 from pyramid.testing import DummyRequest
+from webtest import TestApp
 
 
 class TestGenericViews(bodhi.tests.functional.base.BaseWSGICase):
@@ -162,3 +168,78 @@ class TestGenericViews(bodhi.tests.functional.base.BaseWSGICase):
     def test_metrics(self):
         res = self.app.get('/metrics')
         self.assertIn('$.plot', res)
+
+    def test_metrics_counts_stable_updates(self):
+        update = self.db.query(Update).one()
+        update.status = UpdateStatus.stable
+        self.db.flush()
+        res = self.app.get('/metrics')
+        self.assertIn('{"data": [[0, 1]], "label": "Bug fixes"}', res)
+        self.assertIn('{"data": [[0, 0]], "label": "Security updates"}', res)
+
+    def test_metrics_cached_until_release_changes(self):
+        settings = self.app_settings.copy()
+        settings['dogpile.cache.expiration_time'] = 300
+        app = TestApp(main({}, testing=u'guest', **settings))
+        app.get('/metrics')
+        release = self.db.query(Release).one()
+        release.name = u'F18'
+        self.db.flush()
+        res = app.get('/metrics')
+        self.assertIn('[[0, "F18"]]', res)
+
+    @mock.patch('bodhi.views.search.get_all_packages')
+    def test_search_packages(self, get_all_packages):
+        get_all_packages.return_value = [
+            'python-nose', 'nethack', 'nose', 'PyYAML', 'python-yaml']
+        package_index.invalidate()
+        try:
+            res = self.app.get('/search/packages', {'term': 'nose'})
+            self.assertEquals([p['id'] for p in res.json_body],
+                              ['nose', 'python-nose'])
+
+            res = self.app.get('/search/packages', {'term': 'pyy'})
+            self.assertEquals([p['id'] for p in res.json_body], ['PyYAML'])
+
+            res = self.app.get('/search/packages', {'term': 'n',
+                                                    'limit': '2'})
+            self.assertEquals([p['id'] for p in res.json_body],
+                              ['nethack', 'nose'])
+
+            # The index is only built once
+            self.assertEquals(get_all_packages.call_count, 1)
+        finally:
+            package_index.invalidate()
+
+    @mock.patch('bodhi.views.search.time')
+    @mock.patch('bodhi.views.search.get_all_packages')
+    def test_search_packages_koji_down(self, get_all_packages, time):
+        now = time.time
+        get_all_packages.return_value = ['nose']
+        now.return_value = 0
+        package_index.invalidate()
+        try:
+            self.app.get('/search/packages', {'term': 'nose'})
+
+            # Koji goes down once the index has expired
+            get_all_packages.side_effect = IOError
+            now.return_value = 3600
+            res = self.app.get('/search/packages', {'term': 'nose'})
+            self.assertEquals([p['id'] for p in res.json_body], ['nose'])
+            self.assertEquals(get_all_packages.call_count, 2)
+
+            # The old index is searched without asking Koji again...
+            now.return_value = 3630
+            res = self.app.get('/search/packages', {'term': 'nose'})
+            self.assertEquals([p['id'] for p in res.json_body], ['nose'])
+            self.assertEquals(get_all_packages.call_count, 2)
+
+            # ...until the retry delay is over
+            get_all_packages.side_effect = None
+            get_all_packages.return_value = ['nose', 'python-nose']
+            now.return_value = 3660
+            res = self.app.get('/search/packages', {'term': 'nose'})
+            self.assertEquals([p['id'] for p in res.json_body],
+                              ['nose', 'python-nose'])
+        finally:
+            package_index.invalidate()
@@ -69,6 +69,16 @@ class TestReleasesService(bodhi.tests.functional.base.BaseWSGICase):
         res = self.app.get('/releases/Fedora%2022')
         self.assertEquals(res.json_body['name'], 'F22')
 
+    def test_get_single_release_html(self):
+        res = self.app.get('/releases/F17', headers={'Accept': 'text/html'})
+        self.assertIn('"1984/11"', res)
+        self.assertIn('<td>1</td>', res)
+
+    def test_get_single_release_html_without_updates(self):
+        res = self.app.get('/releases/F22', headers={'Accept': 'text/html'})
+        self.assertIn('Fedora 22', res)
+        self.assertIn('<td>0</td>', res)
+
     def test_list_releases(self):
         res = self.app.get('/releases/')
         body = res.json_body
@@ -113,6 +113,28 @@ class TestStacksService(bodhi.tests.functional.base.BaseWSGICase):
         self.assertEquals(len(body['stacks']), 1)
         self.assertEquals(body['stacks'][0]['name'], 'GNOME')
 
+    def test_list_stacks_by_search(self):
+        res = self.app.get('/stacks/', {'search': 'gno'})
+        body = res.json_body
+        self.assertEquals(len(body['stacks']), 1)
+        self.assertEquals(body['stacks'][0]['name'], 'GNOME')
+
+        res = self.app.get('/stacks/', {'search': 'KDE'})
+        self.assertEquals(len(res.json_body['stacks']), 0)
+
+    def test_list_stacks_by_search_without_fts5(self):
+        # Like a database made by an SQLite built without FTS5
+        Stack.search_index._drop(Stack.__table__, self.db.connection())
+        self.db.add(Stack(name=u'KDE', description=u'The Plasma desktop'))
+        self.db.flush()
+
+        res = self.app.get('/stacks/', {'search': 'gno'})
+        self.assertEquals([stack['name'] for stack in res.json_body['stacks']],
+                          [u'GNOME'])
+        res = self.app.get('/stacks/', {'search': 'plasma desk'})
+        self.assertEquals([stack['name'] for stack in res.json_body['stacks']],
+                          [u'KDE'])
+
     def test_list_stacks_by_package_name(self):
         res = self.app.get('/stacks/', {"packages": 'gnome-shell'})
         body = res.json_body
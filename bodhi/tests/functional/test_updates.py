@@ -23,6 +23,7 @@ import bodhi.tests.functional.base
 
 from bodhi import main
 from bodhi.config import config
+from bodhi.pagination import encode_cursor
 from bodhi.models import (
     Build,
     DBSession,
@@ -32,6 +33,7 @@ from bodhi.models import (
     User,
     UpdateStatus,
     UpdateRequest,
+    UpdateType,
 )
 
 mock_valid_requirements = {
@@ -211,6 +213,102 @@ class TestUpdatesService(bodhi.tests.functional.base.BaseWSGICase):
         res = self.app.get('/updates/bodhi-2.0-1.fc17')
         self.assertEquals(res.json_body['update']['title'], 'bodhi-2.0-1.fc17')
         self.assertIn('application/json', res.headers['Content-Type'])
+        self.assertEquals(res.json_body['feedback'],
+                          {'bugs': {'12345': [0, 0]}, 'testcases': {'Wat': [0, 0]}})
+
+    def test_get_single_update_not_modified(self):
+        res = self.app.get('/updates/bodhi-2.0-1.fc17')
+        etag = res.headers['ETag']
+        self.assertIn('Last-Modified', res.headers)
+
+        res = self.app.get('/updates/bodhi-2.0-1.fc17',
+                           headers={'If-None-Match': etag}, status=304)
+        self.assertEquals(res.headers['ETag'], etag)
+        self.assertEquals(res.body, '')
+
+        # A different representation has its own ETag
+        res = self.app.get('/updates/bodhi-2.0-1.fc17',
+                           headers={'If-None-Match': etag,
+                                    'Accept': 'text/html'})
+        self.assertNotEquals(res.headers['ETag'], etag)
+
+        # New comments change the update
+        update = Update.get(u'bodhi-2.0-1.fc17', self.db)
+        update.comment(u'Works for me', author=u'guest')
+        self.db.flush()
+        res = self.app.get('/updates/bodhi-2.0-1.fc17',
+                           headers={'If-None-Match': etag})
+        self.assertNotEquals(res.headers['ETag'], etag)
+
+    def test_get_single_update_not_modified_related_rows(self):
+        def etag():
+            return self.app.get('/updates/bodhi-2.0-1.fc17').headers['ETag']
+
+        update = Update.get(u'bodhi-2.0-1.fc17', self.db)
+        seen = set([etag()])
+        for change in (lambda: setattr(update.bugs[0], 'title', u'Fixed'),
+                       lambda: setattr(update.builds[0], 'inherited', True),
+                       lambda: setattr(update.user, 'name', u'someone'),
+                       lambda: setattr(update.release, 'long_name',
+                                       u'Fedora 17 (Beefy Miracle)')):
+            change()
+            self.db.flush()
+            current = etag()
+            self.assertNotIn(current, seen)
+            seen.add(current)
+
+    def test_get_single_update_loads_it_once(self):
+        del self.sql_statements[:]
+        self.app.get('/updates/bodhi-2.0-1.fc17',
+                     headers={'Accept': 'application/json'})
+        loads = [sql for sql in self.sql_statements
+                 if sql.startswith('SELECT updates.id AS updates_id')]
+        # The conditional request check only reads a few columns, the
+        # update is loaded by validate_update_id alone and the ACL is never
+        # built for a read
+        self.assertEquals(len(loads), 2)
+        self.assertIn('latest_comment', loads[0])
+        self.assertNotIn('comments.id AS comments_id', loads[0])
+
+    def test_get_single_update_not_modified_query_count(self):
+        etag = self.app.get('/updates/bodhi-2.0-1.fc17').headers['ETag']
+        del self.sql_statements[:]
+        self.app.get('/updates/bodhi-2.0-1.fc17',
+                     headers={'If-None-Match': etag}, status=304)
+        self.assertEquals(len(self.sql_statements), 1)
+
+    def test_get_single_update_cached(self):
+        settings = self.app_settings.copy()
+        settings['dogpile.cache.expiration_time'] = 300
+        app = TestApp(main({}, testing=u'guest', **settings))
+        url = '/updates/bodhi-2.0-1.fc17'
+        app.get(url)
+
+        # A new comment invalidates the update's page
+        update = Update.get(u'bodhi-2.0-1.fc17', self.db)
+        update.comment(u'Works for me', author=u'guest')
+        self.db.flush()
+        body = app.get(url).json_body
+        self.assertEquals(body['update']['comments'][-1]['text'],
+                          u'Works for me')
+
+        # So do changes to the rows shown with it
+        update.bugs[0].title = u'Fixed'
+        self.db.flush()
+        body = app.get(url).json_body
+        self.assertEquals(body['update']['bugs'][0]['title'], u'Fixed')
+
+        update.builds[0].override.notes = u'Still needed'
+        self.db.flush()
+        body = app.get(url).json_body
+        self.assertEquals(body['update']['builds'][0]['override']['notes'],
+                          u'Still needed')
+
+        update.release.long_name = u'Fedora 17 (Beefy Miracle)'
+        self.db.flush()
+        body = app.get(url).json_body
+        self.assertEquals(body['update']['release']['long_name'],
+                          u'Fedora 17 (Beefy Miracle)')
 
     def test_get_single_update_jsonp(self):
         res = self.app.get('/updates/bodhi-2.0-1.fc17',
@@ -256,6 +354,31 @@ class TestUpdatesService(bodhi.tests.functional.base.BaseWSGICase):
         self.assertEquals(up['alias'], None)
         self.assertEquals(up['karma'], 1)
 
+    def test_list_updates_query_count(self):
+        """The number of queries should not grow with the number of updates"""
+        self.db.expire_all()
+        self.sql_statements = []
+        self.app.get('/updates/')
+        num_statements = len(self.sql_statements)
+
+        release = self.db.query(Update).one().release
+        user = self.db.query(User).filter_by(name=u'guest').one()
+        for i in range(5):
+            build = Build(nvr=u'bodhi-2.0-%d.fc17' % (i + 2), release=release,
+                          package=Package(name=u'pkg%d' % i))
+            update = Update(title=build.nvr, builds=[build], user=user,
+                            release=release, notes=u'Update %d' % i,
+                            type=UpdateType.bugfix, karma=0)
+            update.comment(u'Works', karma=1, author=u'guest')
+            self.db.add(update)
+        self.db.flush()
+
+        self.db.expire_all()
+        self.sql_statements = []
+        res = self.app.get('/updates/')
+        self.assertEquals(len(res.json_body['updates']), 6)
+        self.assertEquals(len(self.sql_statements), num_statements)
+
     def test_list_updates_jsonp(self):
         res = self.app.get('/updates/',
                            {'callback': 'callback'},
@@ -289,6 +412,21 @@ class TestUpdatesService(bodhi.tests.functional.base.BaseWSGICase):
         body = res.json_body
         self.assertEquals(len(body['updates']), 0)
 
+    def test_full_text_search_updates(self):
+        res = self.app.get('/updates/', {'search': 'useful'})
+        body = res.json_body
+        self.assertEquals(len(body['updates']), 1)
+        self.assertEquals(body['updates'][0]['title'], u'bodhi-2.0-1.fc17')
+
+        # Edits are picked up by the index
+        up = self.db.query(Update).one()
+        up.notes = u'Nothing to see here'
+        self.db.flush()
+        res = self.app.get('/updates/', {'search': 'useful'})
+        self.assertEquals(len(res.json_body['updates']), 0)
+        res = self.app.get('/updates/', {'search': 'noth'})
+        self.assertEquals(len(res.json_body['updates']), 1)
+
     def test_list_updates_pagination(self):
 
         # First, stuff a second update in there
@@ -309,6 +447,92 @@ class TestUpdatesService(bodhi.tests.functional.base.BaseWSGICase):
 
         self.assertNotEquals(update1, update2)
 
+    def test_list_updates_sparse_fields(self):
+        res = self.app.get('/updates/', {'fields': 'title,status'})
+        self.assertEquals(res.json_body['updates'],
+                          [{'title': 'bodhi-2.0-1.fc17', 'status': 'pending'}])
+
+        del self.sql_statements[:]
+        res = self.app.get('/updates/', {'expand': 'builds'})
+        update = res.json_body['updates'][0]
+        self.assertEquals(update['title'], 'bodhi-2.0-1.fc17')
+        self.assertEquals(update['builds'][0]['nvr'], 'bodhi-2.0-1.fc17')
+        for rel in ('comments', 'bugs', 'cves', 'user', 'release'):
+            self.assertNotIn(rel, update)
+        self.assertFalse([sql for sql in self.sql_statements
+                          if 'comments.text' in sql])
+
+        # An empty expansion leaves out every relationship
+        res = self.app.get('/updates/', {'expand': ''})
+        self.assertNotIn('builds', res.json_body['updates'][0])
+
+    def test_lookup_updates(self):
+        update = self.db.query(Update).one()
+        update.alias = u'FEDORA-2015-0001'
+        self.db.flush()
+
+        res = self.app.post_json('/lookup/updates', {'ids': [
+            u'FEDORA-2015-0001', u'bodhi-2.0-1.fc17', u'nope-1.0-1.fc17']})
+        updates = res.json_body['updates']
+        self.assertEquals(sorted(updates.keys()), [
+            u'FEDORA-2015-0001', u'bodhi-2.0-1.fc17', u'nope-1.0-1.fc17'])
+        self.assertEquals(updates[u'FEDORA-2015-0001']['title'],
+                          u'bodhi-2.0-1.fc17')
+        self.assertEquals(updates[u'bodhi-2.0-1.fc17']['alias'],
+                          u'FEDORA-2015-0001')
+        self.assertEquals(updates[u'nope-1.0-1.fc17'], None)
+
+    def test_lookup_updates_by_nvr(self):
+        update = self.db.query(Update).one()
+        self.db.add(Build(nvr=u'bodhi-2.0-1.fc18', update=update,
+                          package=update.builds[0].package))
+        self.db.flush()
+
+        res = self.app.post('/lookup/updates?fields=title',
+                            {'ids': [u'bodhi-2.0-1.fc18']})
+        self.assertEquals(res.json_body['updates'], {
+            u'bodhi-2.0-1.fc18': {u'title': u'bodhi-2.0-1.fc17'}})
+
+    def test_lookup_updates_without_ids(self):
+        res = self.app.post_json('/lookup/updates', {'ids': []}, status=400)
+        self.assertEquals(res.json_body['errors'][0]['name'], 'ids')
+
+    def test_list_updates_without_total(self):
+        res = self.app.get('/updates/', {"count": "none"})
+        body = res.json_body
+        self.assertEquals(len(body['updates']), 1)
+        self.assertEquals(body['total'], None)
+        self.assertEquals(body['pages'], None)
+
+    def test_list_updates_invalid_cursor(self):
+        res = self.app.get('/updates/', {"after": "garbage"}, status=400)
+        self.assertEquals(res.json_body['errors'][0]['name'], 'after')
+
+    def test_list_updates_by_cursor_of_another_listing(self):
+        res = self.app.get('/updates/', {'after': encode_cursor([1])},
+                           status=400)
+        self.assertEquals(res.json_body['errors'][0]['name'], 'after')
+
+    def test_search_updates_by_cursor(self):
+        update = self.db.query(Update).one()
+        build = Build(nvr=u'bodhi-2.0-2.fc17', release=update.release,
+                      package=update.builds[0].package)
+        self.db.add(Update(title=build.nvr, builds=[build], user=update.user,
+                           release=update.release, notes=u'Also useful',
+                           type=UpdateType.bugfix, karma=0))
+        self.db.flush()
+
+        # Relevance can't be expressed as a cursor, so search results are
+        # only paged by number
+        res = self.app.get('/updates/', {'search': 'useful', 'rows_per_page': 1})
+        self.assertEquals(res.json_body['pages'], 2)
+        self.assertEquals(res.json_body['next'], None)
+
+        after = encode_cursor([update.date_submitted, update.id])
+        res = self.app.get('/updates/', {'search': 'useful', 'after': after},
+                           status=400)
+        self.assertEquals(res.json_body['errors'][0]['name'], 'after')
+
     def test_list_updates_by_approved_since(self):
         now = datetime.utcnow()
 
@@ -1176,6 +1400,26 @@ class TestUpdatesService(bodhi.tests.functional.base.BaseWSGICase):
         self.assertEquals(up.comments[-1].text,
                           u'This update has been obsoleted by bodhi-2.0.0-3.fc17')
 
+    @mock.patch(**mock_valid_requirements)
+    @mock.patch('bodhi.notifications.publish')
+    def test_obsoletion_of_multibuild_update(self, publish, *args):
+        nvrs = [u'bodhi-2.0.0-2.fc17', u'python-nose-1.3.0-2.fc17']
+        self.app.post_json('/updates/', self.get_update(nvrs))
+        up = DBSession.query(Update).filter_by(title=u' '.join(nvrs)).one()
+        up.status = UpdateStatus.testing
+        up.request = None
+
+        r = self.app.post_json('/updates/', self.get_update(
+            [u'bodhi-2.0.0-3.fc17', u'python-nose-1.3.0-3.fc17'])).json_body
+        obsoletions = [c['text'] for c in r['comments']
+                       if 'has obsoleted' in c['text']]
+        self.assertEquals(len(obsoletions), 1)
+
+        up = DBSession.query(Update).filter_by(title=u' '.join(nvrs)).one()
+        self.assertEquals(up.status, UpdateStatus.obsolete)
+        self.assertEquals(len([c for c in up.comments
+                               if 'has been obsoleted' in c.text]), 1)
+
     @mock.patch(**mock_valid_requirements)
     @mock.patch('bodhi.notifications.publish')
     def test_obsoletion_with_open_request(self, publish, *args):
@@ -1245,6 +1489,7 @@ class TestUpdatesService(bodhi.tests.functional.base.BaseWSGICase):
         up.request = None
         up.comment('This update has been pushed to testing', author='bodhi')
         up.comments[-1].timestamp -= timedelta(days=7)
+        up.date_testing -= timedelta(days=7)
         DBSession.flush()
         eq_(up.days_in_testing, 7)
         eq_(up.meets_testing_requirements, True)
@@ -1266,6 +1511,7 @@ class TestUpdatesService(bodhi.tests.functional.base.BaseWSGICase):
         up.request = None
         up.comment('This update has been pushed to testing', author='bodhi')
         up.comments[-1].timestamp -= timedelta(days=7)
+        up.date_testing -= timedelta(days=7)
         DBSession.flush()
         eq_(up.days_in_testing, 7)
         eq_(up.meets_testing_requirements, True)
@@ -1286,6 +1532,7 @@ class TestUpdatesService(bodhi.tests.functional.base.BaseWSGICase):
         up.request = None
         up.comment('This update has been pushed to testing', author='bodhi')
         up.comments[-1].timestamp -= timedelta(days=7)
+        up.date_testing -= timedelta(days=7)
         DBSession.flush()
         eq_(up.days_in_testing, 7)
         eq_(up.meets_testing_requirements, True)
@@ -150,6 +150,17 @@ class TestUsersService(bodhi.tests.functional.base.BaseWSGICase):
         self.assertEquals(len(body['users']), 1)
         self.assertEquals(body['users'][0]['name'], 'bodhi')
 
+    def test_list_users_with_cursor(self):
+        names = []
+        params = {'rows_per_page': 1}
+        while True:
+            body = self.app.get('/users/', params).json_body
+            names.extend(user['name'] for user in body['users'])
+            if body['next'] is None:
+                break
+            params['after'] = body['next']
+        self.assertEquals(names, ['guest', 'anonymous', 'bodhi'])
+
     def test_list_users_by_name(self):
         res = self.app.get('/users/', {"name": 'guest'})
         body = res.json_body
@@ -22,7 +22,10 @@ import mock
 
 from nose.tools import eq_, raises
 from datetime import datetime, timedelta
+from sqlalchemy import create_engine
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects import postgresql
 from pyramid.testing import DummyRequest
 
 from bodhi import models as model, buildsys
@@ -57,6 +60,31 @@ class TestRelease(ModelTest):
     def test_version_int(self):
         eq_(self.obj.version_int, 11)
 
+    def test_registry(self):
+        db = model.DBSession
+        eq_(model.Release.get_tags(db)[1][u'dist-f11-updates'], u'F11')
+        eq_(model.Release.from_tags([u'dist-f11-updates'], db), self.obj)
+
+        # Edits made in this process are seen straight away
+        self.obj.override_tag = u'dist-f11-build-override'
+        db.flush()
+        assert u'dist-f11-build-override' in model.Release.get_tags(db)[1]
+
+        # Another process changing the release bumps the version counter,
+        # which is checked again once this transaction has finished
+        table = model.Release.__table__
+        db.execute(table.update().values(stable_tag=u'dist-f11-stable'))
+        model.CacheVersion.bump(u'releases', db)
+        eq_(model.Release.get_tags(db)[1][u'dist-f11-updates'], u'F11')
+        db().info.pop('release_registry')
+        db.expire_all()
+
+        tag_types, tag_rels = model.Release.get_tags(db)
+        eq_(tag_rels[u'dist-f11-stable'], u'F11')
+        assert u'dist-f11-updates' not in tag_rels
+        eq_(model.Release.registry.get(u'F11', db).stable_tag,
+            u'dist-f11-stable')
+
 
 class MockWiki(object):
     """ Mocked simplemediawiki.MediaWiki class. """
@@ -242,7 +270,9 @@ class TestUpdate(ModelTest):
         eq_(update.alias, u'%s-%s-0003' % (update.release.id_prefix, year))
 
         ## 10k bug
-        update.alias = u'FEDORA-%s-9999' % year
+        model.DBSession.query(model.UpdateAliasSequence).filter_by(
+            id_prefix=u'FEDORA', year=year).one().value = 9999
+        model.DBSession.flush()
         newupdate = self.get_update(name=u'nethack-2.5.6-1.fc10')
         newupdate.release = otherrel
         newupdate.assign_alias()
@@ -262,6 +292,44 @@ class TestUpdate(ModelTest):
         newest.assign_alias()
         eq_(newest.alias, u'FEDORA-%s-10002' % year)
 
+    def test_assign_aliases(self):
+        year = time.localtime()[0]
+        self.obj.alias = u'FEDORA-%s-0042' % year
+        updates = [self.get_update(name=u'TurboGears-0.4.4-%d.fc11' % i)
+                   for i in range(3)]
+        model.DBSession.flush()
+        model.Update.assign_aliases([self.obj] + updates)
+        eq_(self.obj.alias, u'FEDORA-%s-0042' % year)
+        eq_([update.alias for update in updates],
+            [u'FEDORA-%s-%04d' % (year, i) for i in range(43, 46)])
+
+        update = self.get_update(name=u'TurboGears-0.4.4-9.fc11')
+        update.assign_alias()
+        eq_(update.alias, u'FEDORA-%s-0046' % year)
+
+    def test_title_lookup_uses_hash_index(self):
+        query = model.DBSession.query(model.Update.id).filter_by(
+            title=u'x' * 4096)
+        sql = unicode(query.statement.compile(dialect=postgresql.dialect()))
+        assert 'md5(updates.title) = md5(' in sql, sql
+        eq_(query.all(), [])
+
+    def test_allocate_alias_race(self):
+        year = time.localtime()[0]
+        table = model.UpdateAliasSequence.__table__
+
+        def racing(db):
+            # Another push created the counter while we waited for the lock
+            db.execute(table.insert().values(
+                id_prefix=u'FEDORA', year=year, value=5))
+
+        with mock.patch.object(model.UpdateAliasSequence, 'lock',
+                               staticmethod(racing)):
+            eq_(model.UpdateAliasSequence.allocate(
+                u'FEDORA', year, model.DBSession), 6)
+        eq_(model.DBSession.query(model.UpdateAliasSequence.value).filter_by(
+            id_prefix=u'FEDORA', year=year).scalar(), 6)
+
     def test_epel_id(self):
         """ Make sure we can handle id_prefixes that contain dashes.
         eg: FEDORA-EPEL
@@ -313,6 +381,103 @@ class TestUpdate(ModelTest):
         publish.assert_called_with(topic='update.comment', msg=mock.ANY)
         #publish.assert_called_with(topic='update.request.stable', msg=mock.ANY)
 
+    @mock.patch('bodhi.notifications.publish')
+    def test_release_stats(self, publish):
+        update = self.obj
+        stats = model.ReleaseStat.for_release(update.release, model.DBSession)
+        eq_(stats['updates'], 1)
+        eq_(stats['status:pending'], 1)
+        eq_(stats['type:security'], 1)
+
+        update.comment(u"works", 1, u'foo')
+        update.comment(u"works", 1, u'bar')
+        update.comment(u"meh", 0, u'biz')
+        update.date_testing = datetime(2015, 1, 1)
+        update.date_stable = datetime(2015, 1, 8)
+        update.status = UpdateStatus.stable
+        model.DBSession.flush()
+
+        stats = model.ReleaseStat.for_release(update.release, model.DBSession)
+        eq_(stats['status:pending'], 0)
+        eq_(stats['status:stable'], 1)
+        eq_(stats['karma:1'], 2)
+        eq_(stats['karma:0'], 1)
+        eq_(stats['feedback:authenticated'], 2)
+        eq_(stats['feedback'], 1)
+        eq_(stats['testing_days:7'], 1)
+
+        # Rebuilding the counters from scratch gives the same numbers
+        counted = dict(item for item in stats.items() if item[1])
+        model.ReleaseStat.rebuild(model.DBSession)
+        stats = model.ReleaseStat.for_release(update.release, model.DBSession)
+        eq_(dict(item for item in stats.items() if item[1]), counted)
+
+    def test_release_stats_applied_after_commit(self):
+        engine = create_engine('sqlite://')
+        model.Base.metadata.create_all(engine)
+        session = Session(bind=engine)
+        stored = session.query(model.ReleaseStat.name, model.ReleaseStat.value)
+        release = model.Release(id=1)
+        model.ReleaseStat.queue(session, 1, u'updates', 2)
+        model.ReleaseStat.queue(session, 1, u'karma:1')
+        eq_(stored.all(), [])
+        eq_(model.ReleaseStat.for_release(release, session)['updates'], 2)
+
+        session.commit()
+        eq_(dict(stored.all()), {u'updates': 2, u'karma:1': 1})
+        model.ReleaseStat.queue(session, 1, u'updates', -1)
+        session.commit()
+        eq_(dict(stored.all()), {u'updates': 1, u'karma:1': 1})
+
+        # Changes are dropped with the transaction they were made in
+        model.ReleaseStat.queue(session, 1, u'updates', -1)
+        session.rollback()
+        session.commit()
+        eq_(dict(stored.all()), {u'updates': 1, u'karma:1': 1})
+
+    @mock.patch('bodhi.notifications.publish')
+    def test_release_stats_moved_update(self, publish):
+        update = self.obj
+        update.comment(u"works", 1, u'foo')
+        update.comment(u"meh", 0, u'bar')
+        old_release = update.release
+        update.release = model.Release(
+            name=u'F12', long_name=u'Fedora 12', id_prefix=u'FEDORA',
+            version=12, dist_tag=u'dist-f12', stable_tag=u'dist-f12-updates',
+            testing_tag=u'dist-f12-updates-testing',
+            candidate_tag=u'dist-f12-updates-candidate',
+            pending_testing_tag=u'dist-f12-updates-testing-pending',
+            pending_stable_tag=u'dist-f12-updates-pending',
+            override_tag=u'dist-f12-override')
+        model.DBSession.flush()
+
+        counted = [
+            dict(item for item in model.ReleaseStat.for_release(
+                release, model.DBSession).items() if item[1])
+            for release in (old_release, update.release)]
+        eq_(counted[0], {})
+        eq_(counted[1]['karma:1'], 1)
+        eq_(counted[1]['feedback'], 1)
+
+        model.ReleaseStat.rebuild(model.DBSession)
+        eq_([dict(item for item in model.ReleaseStat.for_release(
+                release, model.DBSession).items() if item[1])
+             for release in (old_release, update.release)], counted)
+
+    @mock.patch.dict(config, {'critpath.min_karma': '2'})
+    @mock.patch('bodhi.notifications.publish')
+    def test_release_stats_critpath(self, publish):
+        update = self.obj
+        update.critpath = True
+        update.status = UpdateStatus.testing
+        update.comment(u"works", 1, u'foo')
+        update.comment(u"works", 1, u'bar')
+        model.DBSession.flush()
+        eq_(update.karma, 2)
+        stats = model.ReleaseStat.for_release(update.release, model.DBSession)
+        eq_(stats['critpath:approved'], 1)
+        eq_(stats['critpath:unapproved'], 0)
+
     @mock.patch('bodhi.notifications.publish')
     def test_unstable_karma(self, publish):
         update = self.obj
@@ -330,6 +495,42 @@ class TestUpdate(ModelTest):
         eq_(update.status, UpdateStatus.obsolete)
         publish.assert_called_with(topic='update.comment', msg=mock.ANY)
 
+    @mock.patch('bodhi.notifications.publish')
+    def test_changing_votes(self, publish):
+        update = self.obj
+        update.comment(u"foo", 1, u'foo')
+        eq_(update.karma, 1)
+        update.comment(u"foo", 1, u'foo')
+        eq_(update.karma, 1)
+        update.comment(u"foo", -1, u'foo')
+        eq_(update.karma, -1)
+        # Changing back again doesn't count
+        update.comment(u"foo", 1, u'foo')
+        eq_(update.karma, -1)
+        vote = update.get_vote(model.User.get(u'foo', model.DBSession))
+        eq_(vote.karma, 1)
+        eq_(vote.karma_total, 2)
+        assert vote.voted_up and vote.voted_down
+        eq_(update.has_negative_feedback, False)
+        update.comment(u"bar", -1, u'bar')
+        eq_(update.has_negative_feedback, True)
+
+    @mock.patch('bodhi.notifications.publish')
+    def test_bug_karma(self, publish):
+        update = self.obj
+        bug = update.bugs[0]
+        update.comment(u"foo", 1, u'foo',
+                       bug_feedback=[{'bug': bug, 'karma': 1}])
+        update.comment(u"bar", 0, u'bar',
+                       bug_feedback=[{'bug': bug, 'karma': -1}])
+        eq_(update.get_bug_karma(bug), (1, -1))
+        eq_(update.get_bug_karma(update.bugs[1]), (0, 0))
+        eq_(update.get_feedback_karma(),
+            {'bugs': {1: (1, -1), 2: (0, 0)}, 'testcases': {}})
+        # Only a user's latest comment is taken into account
+        update.comment(u"bar", 0, u'bar')
+        eq_(update.get_bug_karma(bug), (1, 0))
+
     def test_update_bugs(self):
         update = self.obj
         eq_(len(update.bugs), 2)
@@ -387,6 +588,7 @@ class TestUpdate(ModelTest):
         # Pretend it's been in testing for a week
         self.obj.comment(u'This update has been pushed to testing', author=u'bodhi')
         self.obj.comments[-1].timestamp -= timedelta(days=7)
+        self.obj.date_testing -= timedelta(days=7)
         eq_(self.obj.days_in_testing, 7)
         eq_(self.obj.meets_testing_requirements, True)
 
@@ -416,6 +618,35 @@ class TestUpdate(ModelTest):
         assert self.obj.date_pushed
         eq_(self.obj.status, UpdateStatus.testing)
 
+    def test_days_in_testing(self):
+        eq_(self.obj.days_in_testing, None)
+        self.obj.status = UpdateStatus.testing
+        self.obj.status_comment()
+        self.obj.date_testing -= timedelta(days=7)
+        eq_(self.obj.days_in_testing, 7)
+        self.obj.date_stable = self.obj.date_testing + timedelta(days=3)
+        eq_(self.obj.days_in_testing, 7)
+        self.obj.status = UpdateStatus.stable
+        eq_(self.obj.days_in_testing, 3)
+
+    def test_date_stable(self):
+        self.obj.status = UpdateStatus.stable
+        self.obj.status_comment()
+        date_stable = self.obj.date_stable
+        assert date_stable
+        self.obj.status_comment()
+        eq_(self.obj.date_stable, date_stable)
+
+    def test_met_testing_requirements(self):
+        self.obj.status = UpdateStatus.testing
+        self.obj.status_comment()
+        self.obj.date_testing -= timedelta(days=7)
+        eq_(self.obj.met_testing_requirements, False)
+        self.obj.comment(config.get('testing_approval_msg') % 7,
+                         author=u'bodhi')
+        assert self.obj.date_testing_approved
+        eq_(self.obj.met_testing_requirements, True)
+
     def test_status_comment(self):
         self.obj.status = UpdateStatus.testing
         self.obj.status_comment()
@@ -493,3 +724,87 @@ class TestBuildrootOverride(ModelTest):
                               release=model.Release(**TestRelease.attrs)),
             submitter=model.User(name=u'lmacken'),
             )
+
+
+class TestBuildTag(ModelTest):
+    klass = model.BuildTag
+    attrs = dict(nvr=u'TurboGears-1.0.8-3.fc11',
+                 package_name=u'TurboGears',
+                 tag=u'dist-f11-updates-testing',
+                 koji_build_id=16058)
+
+    def do_get_dependencies(self):
+        model.Release.registry.invalidate()
+        return dict()
+
+    def setup(self):
+        super(TestBuildTag, self).setup()
+        model.DBSession.add(model.Release(**TestRelease.attrs))
+        model.DBSession.flush()
+        config['koji_index'] = True
+
+    def tearDown(self):
+        config['koji_index'] = False
+        model.Release.registry.invalidate()
+        super(TestBuildTag, self).tearDown()
+
+    def test_tags_for(self):
+        eq_(model.BuildTag.tags_for(self.obj.nvr, model.DBSession, None),
+            [u'dist-f11-updates-testing'])
+
+    def test_tagged_event(self):
+        model.BuildTag.tagged_event(model.DBSession, u'dist-f11-updates-testing',
+                                    u'TurboGears-1.0.8-4.fc11', u'TurboGears')
+        model.BuildTag.tagged_event(model.DBSession, u'some-other-tag',
+                                    u'TurboGears-1.0.8-4.fc11', u'TurboGears')
+        latest = model.BuildTag.latest(u'dist-f11-updates-testing',
+                                       model.DBSession)
+        eq_([row.nvr for row in latest], [u'TurboGears-1.0.8-4.fc11'])
+        eq_(model.BuildTag.tags_for(u'TurboGears-1.0.8-4.fc11',
+                                    model.DBSession, None),
+            [u'dist-f11-updates-testing'])
+
+    def test_latest(self):
+        tag = u'dist-f11-updates-testing'
+        when = datetime(2015, 5, 1)
+        for nvr, package, tagged in [
+                (u'TurboGears-1.0.8-5.fc11', u'TurboGears', when),
+                (u'TurboGears-1.0.8-6.fc11', u'TurboGears', when),
+                (u'kernel-3.0-1.fc11', u'kernel', when),
+                (u'kernel-3.0-2.fc11', u'kernel', datetime(2015, 4, 1))]:
+            model.DBSession.add(model.BuildTag(nvr=nvr, package_name=package,
+                                               tag=tag, tagged=tagged))
+        model.DBSession.add(model.BuildTag(
+            nvr=u'kernel-3.0-3.fc11', package_name=u'kernel',
+            tag=u'dist-f11-updates', tagged=datetime(2015, 6, 1)))
+        model.DBSession.flush()
+        # The setup's build was tagged just now, the others of a tie go to
+        # the one recorded last
+        eq_([row.nvr for row in model.BuildTag.latest(tag, model.DBSession)],
+            [self.obj.nvr, u'kernel-3.0-1.fc11'])
+        self.obj.tagged = datetime(2015, 1, 1)
+        model.DBSession.flush()
+        eq_([row.nvr for row in model.BuildTag.latest(tag, model.DBSession)],
+            [u'TurboGears-1.0.8-6.fc11', u'kernel-3.0-1.fc11'])
+        eq_([row.nvr for row in model.BuildTag.latest(
+                tag, model.DBSession, package=u'kernel')],
+            [u'kernel-3.0-1.fc11'])
+
+    def test_untagged_event(self):
+        model.BuildTag.untagged_event(model.DBSession,
+                                      u'dist-f11-updates-testing',
+                                      self.obj.nvr)
+        eq_(model.BuildTag.tags_for(self.obj.nvr, model.DBSession, None), [])
+
+    def test_sync(self):
+        koji = buildsys.DevBuildsys()
+        tags = [u'dist-f11-updates', u'dist-f11-updates-testing']
+        tagged = [{'nvr': u'TurboGears-1.0.8-7.fc11', 'build_id': 16059,
+                   'package_name': u'TurboGears', 'create_ts': 1234567890.0}]
+        with mock.patch.object(koji, 'multiCall',
+                               return_value=[[tagged], [[]]]):
+            eq_(model.BuildTag.sync(model.DBSession, koji, tags=tags), (1, 1))
+        eq_(model.BuildTag.tags_for(u'TurboGears-1.0.8-7.fc11',
+                                    model.DBSession, None),
+            [u'dist-f11-updates'])
+        eq_(model.BuildTag.tags_for(self.obj.nvr, model.DBSession, None), [])
@@ -0,0 +1,353 @@
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import os
+import shutil
+import tempfile
+
+from collections import defaultdict
+
+from dogpile.cache import make_region
+from nose.tools import eq_, raises
+
+from bodhi.buildsys import (DevBuildsys, KojiCache, CachedBuildsystem,
+                            RecordingBuildsystem, ReplayBuildsystem,
+                            MulticallExecutor, BoundedDict)
+
+
+class CountingBuildsys(DevBuildsys):
+    """A DevBuildsys that counts how often each method is called"""
+
+    def __init__(self):
+        self.calls = defaultdict(int)
+
+    def getBuild(self, *args, **kw):
+        self.calls['getBuild'] += 1
+        return DevBuildsys.getBuild(self, *args, **kw)
+
+    def listTags(self, *args, **kw):
+        self.calls['listTags'] += 1
+        return DevBuildsys.listTags(self, *args, **kw)
+
+    def listTagged(self, *args, **kw):
+        self.calls['listTagged'] += 1
+        return DevBuildsys.listTagged(self, *args, **kw)
+
+
+class TestCachedBuildsystem(object):
+
+    def setUp(self):
+        self.session = CountingBuildsys()
+        self.session.clear()
+        self.koji = CachedBuildsystem(self.session,
+                                      cache=KojiCache(shared=True))
+
+    def tearDown(self):
+        self.session.clear()
+
+    def test_permanent_cache(self):
+        build = self.koji.getBuild('bodhi-2.0-1.fc17')
+        assert self.koji.getBuild('bodhi-2.0-1.fc17') == build
+        assert self.session.calls['getBuild'] == 1, self.session.calls
+
+    def test_returns_copies(self):
+        self.koji.getBuild('bodhi-2.0-1.fc17')['nvr'] = 'tampered'
+        assert self.koji.getBuild('bodhi-2.0-1.fc17')['nvr'] != 'tampered'
+
+    def test_tag_build_invalidates(self):
+        self.koji.listTags('bodhi-2.0-1.fc17')
+        self.koji.listTagged('f17-updates-testing')
+        self.koji.listTags('bodhi-2.0-1.fc17')
+        self.koji.listTagged('f17-updates-testing')
+        assert self.session.calls['listTags'] == 1, self.session.calls
+        assert self.session.calls['listTagged'] == 1, self.session.calls
+
+        self.koji.tagBuild('f17-updates-testing', 'bodhi-2.0-1.fc17')
+        self.koji.listTags('bodhi-2.0-1.fc17')
+        self.koji.listTagged('f17-updates-testing')
+        assert self.session.calls['listTags'] == 2, self.session.calls
+        assert self.session.calls['listTagged'] == 2, self.session.calls
+        assert ('f17-updates-testing', 'bodhi-2.0-1.fc17') in \
+            DevBuildsys.__added__
+
+    def test_move_build_invalidates_both_tags(self):
+        self.koji.listTagged('f17-updates-testing')
+        self.koji.listTagged('f17-updates')
+        self.koji.moveBuild('f17-updates-testing', 'f17-updates',
+                            'bodhi-2.0-1.fc17')
+        self.koji.listTagged('f17-updates-testing')
+        self.koji.listTagged('f17-updates')
+        assert self.session.calls['listTagged'] == 4, self.session.calls
+
+    def test_invalidate_from_tag_event(self):
+        self.koji.listTags('bodhi-2.0-1.fc17')
+        self.koji._cache.invalidate(build='bodhi-2.0-1.fc17',
+                                    tag='f17-updates')
+        self.koji.listTags('bodhi-2.0-1.fc17')
+        assert self.session.calls['listTags'] == 2, self.session.calls
+
+    def test_invalidated_while_asking_koji(self):
+        koji = self.koji
+
+        class Racing(CountingBuildsys):
+            def listTags(self, build, *args, **kw):
+                # The tag message for a change Koji's answer predates
+                result = CountingBuildsys.listTags(self, build, *args, **kw)
+                if self.calls['listTags'] == 1:
+                    koji._cache.invalidate(build=build)
+                return result
+
+        self.session = Racing()
+        self.koji.__dict__['_session'] = self.session
+        self.koji.listTags('bodhi-2.0-1.fc17')
+        self.koji.listTags('bodhi-2.0-1.fc17')
+        assert self.session.calls['listTags'] == 2, self.session.calls
+
+    def test_normalizes_arguments(self):
+        nvr = 'bodhi-2.0-1.fc17'
+
+        class ById(CountingBuildsys):
+            def getBuild(self, build, *args, **kw):
+                if build == 16058:
+                    build = nvr
+                return CountingBuildsys.getBuild(self, build, *args, **kw)
+
+            def listTags(self, build, *args, **kw):
+                if build == 16058:
+                    build = nvr
+                return CountingBuildsys.listTags(self, build, *args, **kw)
+
+        self.session = ById()
+        self.koji.__dict__['_session'] = self.session
+        tags = self.koji.listTags(nvr)
+        assert self.koji.listTags(build=nvr) == tags
+        assert self.koji.listTags(16058) == tags
+        assert self.session.calls['listTags'] == 1, self.session.calls
+
+        # Tag messages name the build by NVR, which reaches all three
+        self.koji._cache.invalidate(build=nvr)
+        self.koji.listTags(16058)
+        assert self.session.calls['listTags'] == 2, self.session.calls
+
+    def test_private_cache_is_bounded(self):
+        region = make_region().configure(
+            'dogpile.cache.memory', arguments={'cache_dict': BoundedDict(2)})
+        koji = CachedBuildsystem(self.session, cache=KojiCache(region=region))
+        koji.getBuild('bodhi-2.0-1.fc17')
+        koji.getBuild('bodhi-2.0-2.fc17')
+        koji.getBuild('bodhi-2.0-3.fc17')
+        koji.getBuild('bodhi-2.0-3.fc17')
+        assert self.session.calls['getBuild'] == 3, self.session.calls
+        # The least recently used build was dropped
+        koji.getBuild('bodhi-2.0-1.fc17')
+        assert self.session.calls['getBuild'] == 4, self.session.calls
+
+    def test_invalidates_after_tagging(self):
+        koji = self.koji
+
+        class SlowTagger(CountingBuildsys):
+            def tagBuild(self, tag, build, *args, **kw):
+                # A reader racing the tag call still sees the old membership,
+                # and must not be able to cache it past the tag call.
+                koji.listTags(build)
+                return DevBuildsys.tagBuild(self, tag, build, *args, **kw)
+
+        self.session = SlowTagger()
+        self.koji.__dict__['_session'] = self.session
+        self.koji.tagBuild('f17-updates-testing', 'bodhi-2.0-1.fc17')
+        self.koji.listTags('bodhi-2.0-1.fc17')
+        assert self.session.calls['listTags'] == 2, self.session.calls
+
+    def test_multicall_invalidates_after_multicall(self):
+        self.koji.listTagged('f17-updates-testing')
+        self.koji.multicall = True
+        self.koji.tagBuild('f17-updates-testing', 'bodhi-2.0-1.fc17')
+        self.koji.multicall = False
+        self.koji.listTagged('f17-updates-testing')
+        # Still cached, the queued tagBuild has not run yet
+        assert self.session.calls['listTagged'] == 1, self.session.calls
+        self.koji.multicall = True
+        self.koji.multiCall()
+        self.koji.multicall = False
+        self.koji.listTagged('f17-updates-testing')
+        assert self.session.calls['listTagged'] == 2, self.session.calls
+
+    def test_private_cache_skips_tag_methods(self):
+        koji = CachedBuildsystem(self.session, cache=KojiCache())
+        koji.getBuild('bodhi-2.0-1.fc17')
+        koji.getBuild('bodhi-2.0-1.fc17')
+        koji.listTags('bodhi-2.0-1.fc17')
+        koji.listTags('bodhi-2.0-1.fc17')
+        assert self.session.calls['getBuild'] == 1, self.session.calls
+        assert self.session.calls['listTags'] == 2, self.session.calls
+
+    def test_multicall_bypasses_cache(self):
+        self.koji.multicall = True
+        assert self.session.multicall is True
+        self.koji.listTags('bodhi-2.0-1.fc17')
+        self.koji.listTags('bodhi-2.0-1.fc17')
+        assert self.session.calls['listTags'] == 2, self.session.calls
+        self.koji.multiCall()
+
+
+class TestRecordReplay(object):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp('bodhi')
+        self.corpus = os.path.join(self.tempdir, 'koji.json.gz')
+        koji = RecordingBuildsystem(DevBuildsys(), self.corpus)
+        self.build = koji.getBuild('bodhi-2.0-1.fc17')
+        self.tags = koji.listTags('bodhi-2.0-1.fc17')
+        self.koji = ReplayBuildsystem(ReplayBuildsystem.load(self.corpus))
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_replay(self):
+        eq_(self.koji.getBuild('bodhi-2.0-1.fc17'), self.build)
+        eq_(self.koji.listTags('bodhi-2.0-1.fc17'), self.tags)
+
+    @raises(Exception)
+    def test_replay_unrecorded(self):
+        self.koji.getBuild('bodhi-2.0-2.fc17')
+
+    def test_replay_multicall(self):
+        self.koji.multicall = True
+        self.koji.listTags('bodhi-2.0-1.fc17')
+        self.koji.listTags('bodhi-2.0-2.fc17')
+        self.koji.tagBuild('f17-updates', 'bodhi-2.0-1.fc17')
+        results = self.koji.multiCall()
+        eq_(results[0], [self.tags])
+        assert isinstance(results[1], dict), results
+        assert isinstance(results[2][0], int), results
+        assert self.koji.taskFinished(results[2][0])
+        eq_(self.koji.multicall, False)
+
+
+class FlakyBuildsys(ReplayBuildsystem):
+    """A replayed buildsystem whose first multicall blows up"""
+    failed = []
+
+    def multiCall(self):
+        if not self.failed:
+            self.failed.append(True)
+            self._queued = []
+            raise Exception('Request timed out')
+        return ReplayBuildsystem.multiCall(self)
+
+
+class TestMulticallExecutor(object):
+
+    def setUp(self):
+        self.sessions = []
+        FlakyBuildsys.failed = []
+
+    def session(self, cls=ReplayBuildsystem):
+        corpus = {}
+        for i in range(10):
+            corpus['["listTags", ["pkg-%d-1"], {}]' % i] = {'result': i}
+
+        def factory():
+            session = cls(corpus)
+            self.sessions.append(session)
+            return session
+        return factory
+
+    def test_chunks(self):
+        executor = MulticallExecutor(chunk_size=3, workers=2,
+                                     session_factory=self.session())
+        for i in range(10):
+            executor.add('listTags', 'pkg-%d-1' % i)
+        eq_(executor.run(), range(10))
+        eq_(executor.failures, [])
+        # At most one session per worker
+        assert len(self.sessions) <= 2, self.sessions
+
+    def test_failures(self):
+        executor = MulticallExecutor(chunk_size=3, retries=1,
+                                     session_factory=self.session())
+        executor.add('listTags', 'pkg-1-1')
+        executor.add('listTags', 'missing-1-1')
+        eq_(executor.run(), [1, None])
+        eq_(len(executor.failures), 1)
+        eq_(executor.failures[0][0], ('listTags', ('missing-1-1',), {}))
+        # The failed call was retried on its own, on the same session
+        eq_(len(self.sessions), 1)
+
+    def test_retry_failed_chunk(self):
+        executor = MulticallExecutor(chunk_size=5, workers=1,
+                                     session_factory=self.session(
+                                         FlakyBuildsys))
+        for i in range(10):
+            executor.add('listTags', 'pkg-%d-1' % i)
+        eq_(executor.run(), range(10))
+        eq_(executor.failures, [])
+        eq_(len(self.sessions), 1)
+
+    def test_checks_tags_after_failed_chunk(self):
+        corpus = {
+            '["listTags", ["pkg-1-1"], {}]': {
+                'result': [{'name': 'f17-updates', 'id': 1}]},
+            '["listTags", ["pkg-2-1"], {}]': {'result': []},
+        }
+
+        def factory():
+            session = FlakyBuildsys(corpus)
+            self.sessions.append(session)
+            return session
+
+        executor = MulticallExecutor(chunk_size=5, session_factory=factory)
+        executor.add('tagBuild', 'f17-updates', 'pkg-1-1')
+        executor.add('tagBuild', 'f17-updates', 'pkg-2-1')
+        results = executor.run()
+        eq_(executor.failures, [])
+        # pkg-1-1 made it into the tag before the chunk failed, so only
+        # pkg-2-1 was tagged again
+        eq_(results[0], None)
+        assert isinstance(results[1], int), results
+        eq_(len(self.sessions), 1)
+
+    def test_lost_tag_change_lands_late(self):
+        class RacingBuildsys(FlakyBuildsys):
+            tags = []
+
+            def listTags(self, build):
+                return [{'name': tag, 'id': 1} for tag in self.tags]
+
+            def getTaskInfo(self, task):
+                # The lost tagBuild finished first, failing the new one
+                self.tags.append('f17-updates')
+                return {'state': 5}  # FAILED
+
+        executor = MulticallExecutor(session_factory=lambda: RacingBuildsys(
+            {}))
+        executor.add('tagBuild', 'f17-updates', 'pkg-1-1')
+        results = executor.run()
+        eq_(executor.failures, [])
+        eq_(executor.wait_for_tasks(results, sleep=0), [])
+
+        # Tasks that fail for other reasons are still reported
+        executor = MulticallExecutor(session_factory=lambda: RacingBuildsys(
+            {}))
+        executor.add('tagBuild', 'f17-updates', 'pkg-2-1')
+        results = executor.run()
+        eq_(executor.wait_for_tasks(results, sleep=0), results)
+
+    def test_dev_buildsys(self):
+        executor = MulticallExecutor()
+        executor.add('tagBuild', 'f17-updates', 'bodhi-2.0-1.fc17')
+        eq_(executor.run(), [None])
+        eq_(executor.failures, [])
+        eq_(DevBuildsys.__added__, [('f17-updates', 'bodhi-2.0-1.fc17')])
+        DevBuildsys().clear()
@@ -408,7 +408,7 @@ References:
             db.add(update)
 
             # Wipe out the tag cache so it picks up our new release
-            Release._tag_cache = None
+            Release.registry.invalidate()
 
         self.msg['body']['msg']['updates'] += ' bodhi-2.0-1.fc18'
 
@@ -465,7 +465,7 @@ References:
             db.add(update)
 
             # Wipe out the tag cache so it picks up our new release
-            Release._tag_cache = None
+            Release.registry.invalidate()
 
         self.msg['body']['msg']['updates'] += ' bodhi-2.0-1.fc18'
 
@@ -523,7 +523,7 @@ References:
             db.add(update)
 
             # Wipe out the tag cache so it picks up our new release
-            Release._tag_cache = None
+            Release.registry.invalidate()
 
         self.msg['body']['msg']['updates'] += ' bodhi-2.0-1.fc18'
 
@@ -30,10 +30,12 @@ import hashlib
 import collections
 import pkg_resources
 import functools
+import transaction
 
 
 from os.path import isdir, join, dirname, basename, isfile
 from datetime import datetime
+from contextlib import contextmanager
 from collections import defaultdict
 
 from sqlalchemy import create_engine
@@ -204,6 +206,22 @@ def get_db_from_config(dev=False):
     return DBSession()
 
 
+@contextmanager
+def transactional_session_maker():
+    """Provide a transactional scope around a series of operations."""
+    from .models import DBSession
+    session = DBSession()
+    transaction.begin()
+    try:
+        yield session
+        transaction.commit()
+    except:
+        transaction.abort()
+        raise
+    finally:
+        session.close()
+
+
 @memoized
 def get_critpath_pkgs(collection='master'):
     """Return a list of critical path packages for a given collection"""
@@ -297,7 +315,7 @@ def avatar(context, username, size):
     request = context['request']
     https = request.registry.settings.get('prefer_ssl'),
 
-    @request.cache.cache_on_arguments()
+    @request.cache.cache_on_arguments(namespace='avatar')
     def work(username, size):
         openid = "http://%s.id.fedoraproject.org/" % username
         if asbool(config.get('libravatar_enabled', True)):
@@ -12,18 +12,25 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
+import hashlib
+
 from datetime import datetime
 
+from sqlalchemy import func, select
 from sqlalchemy.sql import or_
 from pyramid.exceptions import HTTPNotFound, HTTPBadRequest
+from pyramid.httpexceptions import HTTPNotModified
+from pyramid.security import unauthenticated_userid
+from webob.datetime_utils import UTC
 
 from . import captcha
 from . import log
-from .models import (Release, Package, Build, Update, UpdateStatus,
+from .models import (Release, Package, Build, BuildTag, Update, UpdateStatus,
                      UpdateRequest, UpdateSeverity, UpdateType,
                      UpdateSuggestion, User, Group, Comment,
-                     Bug, TestCase, ReleaseState, Stack)
-from .util import get_nvr, tokenize, taskotron_results
+                     Bug, TestCase, ReleaseState, Stack, CacheVersion)
+from .pagination import parse_cursor
+from .util import get_nvr, tokenize, taskotron_results, version
 
 try:
     import rpm
@@ -76,16 +83,15 @@ def validate_builds(request):
 
 def validate_build_tags(request):
     """ Ensure that all of the builds are tagged as candidates """
-    tag_types, tag_rels = Release.get_tags()
+    tag_types, tag_rels = Release.get_tags(request.db)
     if request.validated.get('edited'):
         valid_tags = tag_types['candidate'] + tag_types['testing']
     else:
         valid_tags = tag_types['candidate']
     for build in request.validated.get('builds', []):
         valid = False
-        tags = request.buildinfo[build]['tags'] = [
-            tag['name'] for tag in request.koji.listTags(build)
-        ]
+        tags = request.buildinfo[build]['tags'] = BuildTag.tags_for(
+            build, request.db, request.koji)
         for tag in tags:
             if tag in valid_tags:
                 valid = True
@@ -97,7 +103,7 @@ def validate_build_tags(request):
 
 def validate_tags(request):
     """Ensure that all the tags are valid Koji tags"""
-    tag_types, tag_rels = Release.get_tags()
+    tag_types, tag_rels = Release.get_tags(request.db)
 
     for tag_type in tag_types:
         tag_name = request.validated.get("%s_tag" % tag_type)
@@ -128,7 +134,7 @@ def validate_acls(request):
 
         # Get the Package object
         package_name = buildinfo['nvr'][0]
-        package = db.query(Package).filter_by(name=package_name).first()
+        package = Package.get(package_name, db)
         if not package:
             package = Package(name=package_name)
             db.add(package)
@@ -200,7 +206,7 @@ def validate_version(request):
     db = request.db
     for build in request.validated.get('builds', []):
         nvr = request.buildinfo[build]['nvr']
-        pkg = db.query(Package).filter_by(name=nvr[0]).first()
+        pkg = Package.get(nvr[0], db)
         if pkg:
             last = db.query(Build).filter_by(package=pkg) \
                      .order_by(Build.id.desc()).limit(1).first()
@@ -317,7 +323,7 @@ def validate_groups(request):
     validated_groups = []
 
     for g in groups:
-        group = db.query(Group).filter(Group.name==g).first()
+        group = Group.get(g, db)
 
         if not group:
             bad_groups.append(g)
@@ -339,7 +345,7 @@ def validate_release(request):
         return
 
     db = request.db
-    release = db.query(Release).filter_by(name=releasename).first()
+    release = Release.registry.get(releasename, db)
 
     if release:
         request.validated["release"] = release
@@ -383,7 +389,7 @@ def validate_username(request):
         return
 
     db = request.db
-    user = db.query(User).filter_by(name=username).first()
+    user = User.get(username, db)
 
     if user:
         request.validated["user"] = user
@@ -392,6 +398,29 @@ def validate_username(request):
                            "Invalid user specified: {}".format(username))
 
 
+def validate_after(id, key=None):
+    """Return a validator that decodes the ``after`` token of a listing
+    sorted by ``key`` and ``id`` (see :func:`bodhi.pagination.paginate`)"""
+    def validate_after(request):
+        after = request.validated.get('after')
+        if after is None:
+            return
+        try:
+            request.validated['after'] = parse_cursor(after, id, key)
+        except ValueError:
+            request.errors.add("querystring", "after", "Invalid cursor")
+    return validate_after
+
+
+def validate_search_cursor(request):
+    """Make sure search results are paged by number"""
+    data = request.validated
+    if data.get('search') is not None and data.get('after') is not None:
+        request.errors.add("querystring", "after",
+                           "Search results are ordered by relevance and "
+                           "can only be paged by number")
+
+
 def validate_update(request):
     """Make sure this update exists"""
     idx = request.validated.get('update')
@@ -412,7 +441,7 @@ def validate_update_owner(request):
         return
 
     db = request.db
-    user = db.query(User).filter_by(name=username).first()
+    user = User.get(username, db)
 
     if user:
         request.validated["update_owner"] = user
@@ -423,7 +452,8 @@ def validate_update_owner(request):
 
 def validate_update_id(request):
     """Ensure that a given update id exists"""
-    update = Update.get(request.matchdict['id'], request.db)
+    update = Update.get(request.matchdict['id'], request.db,
+                        options=Update.loading_options('detail'))
     if update:
         request.validated['update'] = update
     else:
@@ -560,11 +590,12 @@ def validate_override_build(request):
         if not build.release:
             # Oddly, the build has no associated release.  Let's try to figure
             # that out and apply it.
-            tag_types, tag_rels = Release.get_tags()
+            tag_types, tag_rels = Release.get_tags(request.db)
             valid_tags = tag_types['candidate'] + tag_types['testing']
 
-            tags = [tag['name'] for tag in request.koji.listTags(nvr)
-                    if tag['name'] in valid_tags]
+            tags = [tag for tag in
+                    BuildTag.tags_for(nvr, request.db, request.koji)
+                    if tag in valid_tags]
 
             release = Release.from_tags(tags, request.db)
 
@@ -588,11 +619,12 @@ def validate_override_build(request):
             return
 
     else:
-        tag_types, tag_rels = Release.get_tags()
+        tag_types, tag_rels = Release.get_tags(request.db)
         valid_tags = tag_types['candidate'] + tag_types['testing']
 
-        tags = [tag['name'] for tag in request.koji.listTags(nvr)
-                if tag['name'] in valid_tags]
+        tags = [tag for tag in
+                BuildTag.tags_for(nvr, request.db, request.koji)
+                if tag in valid_tags]
 
         release = Release.from_tags(tags, request.db)
 
@@ -690,3 +722,123 @@ def validate_requirements(request):
                     requirement, ", ".join(valid_requirements)))
             request.errors.status = HTTPBadRequest.code
             return
+
+
+#
+# Conditional GET
+#
+# These run before the other validators, and answer a request with 304 Not
+# Modified when the client's copy is still current, so unchanged resources
+# are never serialized or rendered again.  They only look at a few indexed
+# columns and counters, which the model events keep current (see
+# Update.related_version and CacheVersion), and never load the rows that
+# they describe.
+#
+
+def _respond_if_unchanged(request, state, last_modified=None):
+    """
+    Set the ETag and Last-Modified of the response about to be rendered from
+    ``state``, or raise HTTPNotModified if the client already has it.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return
+
+    # The representation also depends on what was asked for, and by whom
+    etag = hashlib.sha1(repr((
+        state,
+        request.path_qs,
+        request.headers.get('Accept'),
+        unauthenticated_userid(request),
+        version(None),
+    ))).hexdigest()
+
+    response = request.response
+    response.etag = etag
+    response.vary = ('Accept', 'Cookie')
+    if last_modified is not None:
+        response.last_modified = last_modified.replace(microsecond=0,
+                                                       tzinfo=UTC)
+
+    if request.if_none_match:
+        unchanged = etag in request.if_none_match
+    elif request.if_modified_since and last_modified is not None:
+        unchanged = response.last_modified <= request.if_modified_since
+    else:
+        unchanged = False
+
+    if unchanged:
+        raise HTTPNotModified(headers=[
+            (name, value) for name, value in response.headerlist
+            if name in ('ETag', 'Last-Modified', 'Vary')])
+
+
+def _latest(*dates):
+    dates = [date for date in dates if date is not None]
+    return max(dates) if dates else None
+
+
+def _update_state(db, id):
+    """
+    The row of an update, of its release and submitter, its related_version
+    and the time of its latest comment, or None if there is no such update.
+    """
+    updates, comments = Update.__table__, Comment.__table__
+    releases, users = Release.__table__, User.__table__
+    latest_comment = select([func.max(comments.c.timestamp)]).where(
+        comments.c.update_id == updates.c.id).label('latest_comment')
+    return db.execute(
+        select([updates, releases, users, latest_comment])
+        .select_from(updates
+                     .outerjoin(releases, releases.c.id == updates.c.release_id)
+                     .outerjoin(users, users.c.id == updates.c.user_id))
+        .where(or_(updates.c.title == id, updates.c.alias == id))
+        .apply_labels()).first()
+
+
+def validate_update_unchanged(request):
+    """Answer conditional requests for a single update"""
+    state = _update_state(request.db, request.matchdict['id'])
+    if state is None:
+        return
+    _respond_if_unchanged(request, tuple(state), _latest(
+        state.updates_date_submitted, state.updates_date_modified,
+        state.updates_date_pushed, state.latest_comment))
+
+
+def validate_comment_unchanged(request):
+    """Answer conditional requests for a single comment"""
+    try:
+        idx = int(request.matchdict['id'])
+    except ValueError:
+        return
+    db = request.db
+    row = db.query(Comment.__table__).filter(Comment.id == idx).first()
+    if row is None:
+        return
+    update = db.query(Update.__table__).filter(Update.id == row.update_id)\
+               .first()
+    _respond_if_unchanged(request, (tuple(row), update and tuple(update)),
+                          row.timestamp)
+
+
+def _maxima(db, *columns):
+    """ The greatest values of some indexed columns, in a single query """
+    return db.query(*[select([func.max(column)]).as_scalar()
+                      for column in columns]).one()
+
+
+def validate_updates_unchanged(request):
+    """Answer conditional requests for the list of updates"""
+    db = request.db
+    maxima = _maxima(db, Update.date_submitted, Update.date_modified,
+                     Update.date_pushed, Comment.timestamp, Comment.id)
+    state = (tuple(maxima), CacheVersion.current(u'updates:deleted', db))
+    _respond_if_unchanged(request, state, _latest(*maxima[:4]))
+
+
+def validate_comments_unchanged(request):
+    """Answer conditional requests for the list of comments"""
+    db = request.db
+    comments = _maxima(db, Comment.id, Comment.timestamp)
+    state = (tuple(comments), CacheVersion.current(u'comments:deleted', db))
+    _respond_if_unchanged(request, state, comments[1])
@@ -20,6 +20,7 @@ from pyramid.view import view_config, notfound_view_config
 from pyramid.exceptions import HTTPNotFound, HTTPForbidden
 
 from bodhi import log
+from bodhi.cache import cache, cached_view
 import bodhi.models
 from bodhi.util import markup
 
@@ -74,12 +75,12 @@ def get_latest_updates(request, critpath, security):
     return query.limit(5).all()
 
 
-@view_config(route_name='home', renderer='home.html')
+@view_config(route_name='home', renderer='home.html',
+             decorator=cached_view('frontpage', 'releases', 'groups'))
 def home(request):
     """ Returns data for the frontpage """
     r = request
 
-    @request.cache.cache_on_arguments()
     def work():
         top_testers = get_top_testers(request)
         critpath_updates = get_latest_updates(request, True, False)
@@ -91,7 +92,8 @@ def home(request):
             "security_updates": [obj.__json__(r) for obj in security_updates],
         }
 
-    return work()
+    return cache.get_or_create('data', work,
+                               namespaces=['frontpage', 'releases', 'groups'])
 
 
 @view_config(route_name='new_update', renderer='new_update.html')
@@ -117,10 +119,9 @@ def latest_candidates(request):
     koji = request.koji
     db = request.db
 
-    @request.cache.cache_on_arguments()
+    @request.cache.cache_on_arguments(namespace='latest_candidates')
     def work(pkg):
         result = []
-        koji.multicall = True
 
         releases = db.query(bodhi.models.Release) \
                      .filter(
@@ -128,6 +129,14 @@ def latest_candidates(request):
                              (bodhi.models.ReleaseState.pending,
                               bodhi.models.ReleaseState.current)))
 
+        if bodhi.models.BuildTag.enabled():
+            for release in releases:
+                for row in bodhi.models.BuildTag.latest(
+                        release.candidate_tag, db, package=pkg):
+                    result.append({'nvr': row.nvr, 'id': row.koji_build_id})
+            return result
+
+        koji.multicall = True
         for release in releases:
             koji.listTagged(release.candidate_tag, package=pkg, latest=True)
 
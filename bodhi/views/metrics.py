@@ -15,14 +15,15 @@
 import json
 
 from pyramid.view import view_config
+from sqlalchemy import func
 
+from bodhi.cache import cache
 import bodhi.models as m
 
 
 @view_config(route_name='metrics', renderer='metrics.html')
 def metrics(request):
     db = request.db
-    data, ticks = [], []
 
     update_types = {
         'bugfix': 'Bug fixes',
@@ -31,22 +32,32 @@ def metrics(request):
         'newpackage': 'New packages'
     }
 
-    releases = db.query(m.Release).filter(m.Release.name.like('F%')).all()
-
-    for i, release in enumerate(sorted(releases, cmp=lambda x, y:
-            cmp(int(x.version_int), int(y.version_int)))):
-        ticks.append([i, release.name])
-
-    for update_type, label in update_types.items():
-        d = []
-        type = m.UpdateType.from_string(update_type)
+    def work():
+        data, ticks = [], []
+        releases = sorted((release for release in m.Release.registry.all(db)
+                           if release.name.startswith('F')),
+                          key=lambda release: int(release.version_int))
         for i, release in enumerate(releases):
-            num = db.query(m.Update).filter_by(
-                release=release,
-                type=type,
-                status=m.UpdateStatus.stable
-            ).count()
-            d.append([i, num])
-        data.append(dict(data=d, label=label))
-
-    return {'data': json.dumps(data), 'ticks': json.dumps(ticks)}
+            ticks.append([i, release.name])
+
+        # The number of stable updates of each type in each release
+        counts = {}
+        if releases:
+            counts = dict(((release_id, type), num) for release_id, type, num
+                          in db.query(m.Update.release_id, m.Update.type,
+                                      func.count(m.Update.id))
+                          .filter(m.Update.status == m.UpdateStatus.stable)
+                          .filter(m.Update.release_id.in_(
+                              [release.id for release in releases]))
+                          .group_by(m.Update.release_id, m.Update.type))
+
+        for update_type, label in update_types.items():
+            type = m.UpdateType.from_string(update_type)
+            d = [[i, counts.get((release.id, type), 0)]
+                 for i, release in enumerate(releases)]
+            data.append(dict(data=d, label=label))
+
+        return {'data': json.dumps(data), 'ticks': json.dumps(ticks)}
+
+    return cache.get_or_create('data', work,
+                               namespaces=['metrics', 'releases'])
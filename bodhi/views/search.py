@@ -12,9 +12,16 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
+import time
+import bisect
+import threading
+
+from itertools import izip
+
 from pyramid.view import view_config
 
 from bodhi import log, buildsys
+from bodhi.config import config
 
 
 def get_all_packages():
@@ -24,10 +31,87 @@ def get_all_packages():
     return [pkg['package_name'] for pkg in koji.listPackages()]
 
 
+class PackageIndex(object):
+    """
+    A process-wide, sorted index of the names of every package in Koji.
+
+    The index is rebuilt from Koji once it is older than the
+    ``package_index.max_age`` setting (an hour by default).  Only one request
+    rebuilds it at a time; the others keep searching the previous index in
+    the meantime.  If Koji can't be reached, everybody keeps searching the
+    previous index until the next attempt, ``package_index.retry_delay``
+    seconds later (a minute by default).
+    """
+
+    def __init__(self):
+        self._state = None  # (built at, names, lowercased names)
+        self._lock = threading.Lock()
+
+    def _build(self):
+        names = sorted(set(get_all_packages()), key=lambda name: name.lower())
+        return time.time(), names, [name.lower() for name in names]
+
+    def _load(self):
+        state = self._state
+        max_age = int(config.get('package_index.max_age', 3600))
+        if state is not None and time.time() - state[0] < max_age:
+            return state
+        # Wait for the first index, but not for a newer one
+        if not self._lock.acquire(state is None):
+            return state
+        try:
+            if self._state is state:
+                self._state = self._build()
+        except Exception:
+            if state is None:
+                raise
+            log.exception('Unable to refresh the package index')
+            # Don't have every request wait for Koji until it is back
+            retry_delay = int(config.get('package_index.retry_delay', 60))
+            self._state = (time.time() - max_age + retry_delay,) + state[1:]
+        finally:
+            self._lock.release()
+        return self._state
+
+    def invalidate(self):
+        self._state = None
+
+    def search(self, term, limit=20):
+        """
+        Return up to ``limit`` package names that contain ``term``, ignoring
+        case.  Names that start with it come first.
+        """
+        built, names, lowered = self._load()
+        term = term.lower()
+
+        # Prefixes sort together, so finding them is a binary search
+        results = []
+        index = bisect.bisect_left(lowered, term)
+        while index < len(lowered) and len(results) < limit and \
+                lowered[index].startswith(term):
+            results.append(names[index])
+            index += 1
+
+        if len(results) < limit:
+            for name, lower in izip(names, lowered):
+                if term in lower and not lower.startswith(term):
+                    results.append(name)
+                    if len(results) == limit:
+                        break
+        return results
+
+
+# The process-wide package index
+package_index = PackageIndex()
+
+
 @view_config(route_name='search_packages', renderer='json',
              request_method='GET')
 def search_packages(request):
     """ Called by the NewUpdateForm.builds AutocompleteWidget """
-    packages = get_all_packages()
-    return [{'id': p, 'label': p, 'value': p} for p in packages
-            if request.GET['term'] in p]
+    try:
+        limit = min(max(int(request.GET.get('limit', 20)), 1), 100)
+    except ValueError:
+        limit = 20
+    packages = package_index.search(request.GET['term'], limit)
+    return [{'id': p, 'label': p, 'value': p} for p in packages]
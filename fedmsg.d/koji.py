@@ -0,0 +1,3 @@
+config = dict(
+    koji_consumer=True,
+)
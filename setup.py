@@ -99,8 +99,11 @@ setup(name='bodhi',
       initialize_bodhi_db = bodhi.scripts.initializedb:main
       bodhi = bodhi.cli:cli
       bodhi-expire-overrides = bodhi.scripts.expire_overrides:main
+      bodhi-sync-build-tags = bodhi.scripts.sync_build_tags:main
+      bodhi-rebuild-release-stats = bodhi.scripts.rebuild_release_stats:main
       [moksha.consumer]
       masher = bodhi.masher:Masher
+      koji = bodhi.consumers:KojiTagConsumer
       """,
       paster_plugins=['pyramid'],
       )
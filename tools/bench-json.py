@@ -0,0 +1,91 @@
+""" bench-json.py
+
+Build a synthetic bodhi database and time how long it takes to serialize
+updates to JSON, both directly and through the /updates/ service, and how many
+SQL statements and result rows the service needs.
+
+Usage: python tools/bench-json.py [num_updates] [rounds]
+"""
+
+import os
+import sys
+import time
+import json
+import tempfile
+import transaction
+
+from sqlalchemy import create_engine, event
+from webtest import TestApp
+
+from bodhi import main
+from bodhi.models import Base, DBSession, Update
+from bodhi.tests.functional.base import BaseWSGICase
+from sampledata import populate
+
+
+def clock(func, rounds):
+    best = None
+    for i in range(rounds):
+        start = time.time()
+        func()
+        duration = time.time() - start
+        best = duration if best is None else min(best, duration)
+    return best
+
+
+def main_(num_updates=500, rounds=5):
+    fd, filename = tempfile.mkstemp(prefix='bodhi-bench-', suffix='.db')
+    os.close(fd)
+    try:
+        url = 'sqlite:///%s' % filename
+        engine = create_engine(url)
+        DBSession.configure(bind=engine)
+        Base.metadata.create_all(engine)
+        with transaction.manager:
+            populate(DBSession(), num_updates)
+        db = DBSession()
+
+        query = db.query(Update).order_by(Update.date_submitted.desc())
+        if hasattr(Update, 'loading_options'):
+            query = query.options(*Update.loading_options('list'))
+        updates = query.limit(100).all()
+        direct = clock(lambda: json.dumps([u.__json__() for u in updates]),
+                       rounds)
+        DBSession.remove()
+
+        settings = dict(BaseWSGICase.app_settings)
+        settings['sqlalchemy.url'] = url
+        app = TestApp(main({}, testing=u'user0', **settings))
+        get = lambda: app.get('/updates/', {'rows_per_page': 100},
+                              headers={'Accept': 'application/json'})
+        service = clock(get, rounds)
+
+        statements = []
+
+        def track(conn, cursor, statement, parameters, *args):
+            statements.append((statement, parameters))
+
+        engine = DBSession.get_bind()
+        event.listen(engine, 'before_cursor_execute', track)
+        get()
+        event.remove(engine, 'before_cursor_execute', track)
+
+        # Re-run everything the request executed to count the result rows
+        rows = 0
+        connection = engine.raw_connection()
+        for statement, parameters in statements:
+            cursor = connection.cursor()
+            cursor.execute(statement, parameters)
+            rows += len(cursor.fetchall())
+        connection.close()
+
+        print 'Serializing 100 updates:', '%.4f' % direct, 'seconds'
+        print 'GET /updates/?rows_per_page=100:', '%.4f' % service, 'seconds'
+        print 'SQL statements per request:', len(statements)
+        print 'Rows fetched per request:', rows
+    finally:
+        os.remove(filename)
+
+
+if __name__ == '__main__':
+    main_(*map(int, sys.argv[1:]))
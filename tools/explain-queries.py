@@ -0,0 +1,125 @@
+""" explain-queries.py
+
+Build a large synthetic bodhi database, issue the common list and lookup
+requests against it, and print the query plan of every SQL statement they
+run.  Statements that have to scan a whole table are flagged, which makes it
+easy to spot a filter or ordering that is missing an index.
+
+Usage: python tools/explain-queries.py [num_updates] [sqlalchemy_url]
+
+Without a URL a temporary SQLite database is used.  A PostgreSQL URL must
+point at an empty database; it is populated and then left in place.
+"""
+
+import os
+import sys
+import urllib
+import tempfile
+import transaction
+
+from sqlalchemy import create_engine, event
+from webtest import TestApp
+
+from bodhi import main
+from bodhi.models import Base, DBSession
+from bodhi.tests.functional.base import BaseWSGICase
+from sampledata import populate
+
+TITLE = 'package7-0-1.0-1.fc17 package7-1-1.0-1.fc17'
+
+REQUESTS = [
+    ('/updates/', {}),
+    ('/updates/', {'releases': 'F17', 'status': 'testing'}),
+    ('/updates/', {'user': 'user1'}),
+    ('/updates/', {'packages': 'package7-0'}),
+    ('/updates/', {'bugs': '70'}),
+    ('/updates/', {'critpath': 'true'}),
+    ('/updates/', {'type': 'security'}),
+    ('/updates/', {'request': 'stable'}),
+    ('/updates/', {'pushed_since': '2014-06-01'}),
+    ('/updates/', {'modified_since': '2014-06-01'}),
+    ('/updates/' + urllib.quote(TITLE), {}),
+    ('/comments/', {}),
+    ('/comments/', {'user': 'user1'}),
+    ('/comments/', {'updates': TITLE}),
+    ('/comments/', {'since': '2014-06-01'}),
+    ('/builds/', {'packages': 'package7-0'}),
+    ('/overrides/', {}),
+    ('/overrides/', {'expired': 'false'}),
+    ('/overrides/', {'user': 'user1'}),
+    ('/releases/F17', {}),
+    ('/users/user1', {}),
+]
+
+
+def explain(connection, dialect, statement, parameters):
+    cursor = connection.cursor()
+    if dialect == 'sqlite':
+        cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+        plan = [row[-1] for row in cursor.fetchall()]
+        # Subqueries are materialized into anon_N, which is fine to scan
+        scans = [line for line in plan if line.startswith('SCAN')
+                 and 'USING' not in line and 'anon_' not in line]
+    else:
+        cursor.execute('EXPLAIN ' + statement, parameters)
+        plan = [row[0] for row in cursor.fetchall()]
+        scans = [line for line in plan if 'Seq Scan' in line]
+    return plan, scans
+
+
+def main_(num_updates=5000, url=None):
+    filename = None
+    if url is None:
+        fd, filename = tempfile.mkstemp(prefix='bodhi-explain-', suffix='.db')
+        os.close(fd)
+        url = 'sqlite:///%s' % filename
+    try:
+        engine = create_engine(url)
+        DBSession.configure(bind=engine)
+        Base.metadata.create_all(engine)
+        with transaction.manager:
+            populate(DBSession(), num_updates)
+        DBSession.remove()
+
+        settings = dict(BaseWSGICase.app_settings)
+        settings['sqlalchemy.url'] = url
+        app = TestApp(main({}, testing=u'user0', **settings))
+        engine = DBSession.get_bind()
+        dialect = engine.dialect.name
+
+        statements = []
+
+        def track(conn, cursor, statement, parameters, *args):
+            statements.append((statement, parameters))
+
+        total_scans = 0
+        connection = engine.raw_connection()
+        for path, params in REQUESTS:
+            del statements[:]
+            event.listen(engine, 'before_cursor_execute', track)
+            app.get(path, params, headers={'Accept': 'application/json'},
+                    expect_errors=True)
+            event.remove(engine, 'before_cursor_execute', track)
+
+            print '=' * 79
+            print 'GET', path, params, '(%d statements)' % len(statements)
+            for statement, parameters in statements:
+                plan, scans = explain(connection, dialect, statement,
+                                      parameters)
+                total_scans += len(scans)
+                print '-' * 79
+                print ' '.join(statement.split())[:300]
+                for line in plan:
+                    print '    %s%s' % (line in scans and '!! ' or '', line)
+        connection.close()
+
+        print '=' * 79
+        print 'Full table scans:', total_scans
+    finally:
+        if filename:
+            os.remove(filename)
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main_(*([int(args[0])] if args else []) + args[1:2])
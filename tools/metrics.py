@@ -17,6 +17,10 @@
 """
 A tool for generating statistics for each release.
 
+The counts come from the release_stats table, which bodhi keeps up to date
+(see ``bodhi-rebuild-release-stats``), and the rankings from grouped
+queries, so that no update is loaded.
+
 .. moduleauthor:: Luke Macken <lmacken@redhat.com>
 """
 
@@ -25,286 +29,219 @@ __requires__ = 'bodhi'
 import sys
 
 from operator import itemgetter
-from datetime import timedelta
 from collections import defaultdict
 
-from sqlalchemy.sql import and_
+from sqlalchemy import func
+from sqlalchemy.sql import and_, exists
 
 from bodhi.util import get_db_from_config, header, get_critpath_pkgs
-from bodhi.models import Update, Release, UpdateStatus, UpdateType
+from bodhi.models import (Bug, Build, Comment, Group, Package, Release,
+                          ReleaseStat, Update, UpdateStatus, User,
+                          STATS_IGNORED_USERS)
 
 statuses = ('stable', 'testing', 'pending', 'obsolete')
 types = ('bugfix', 'enhancement', 'security', 'newpackage')
 
+STABLE_KARMA_TEXT = ('This update has reached the stable karma threshold and '
+                     'will be pushed to the stable updates repository')
+TESTING_TIME_TEXT = ('%days in testing and can be pushed to stable now if the '
+                     'maintainer wishes')
+
+
+def percent(part, whole):
+    return whole and float(part) / whole * 100 or 0.0
+
+
+def short_url(nvr):
+    return 'https://admin.fedoraproject.org/updates/%s' % nvr
 
-def short_url(update):
-    if not update.builds:
-        print('%s missing builds' % update.title)
-        return ''
-    else:
-        return 'https://admin.fedoraproject.org/updates/%s' % update.builds[0].nvr
+
+def testing_time(data):
+    """ Return the mean, median and mode of the days spent in testing """
+    days = sorted((int(name.split(':')[1]), value)
+                  for name, value in data.items()
+                  if name.startswith('testing_days:') and value)
+    total = sum(value for day, value in days)
+    if not total:
+        return 0, 0, 0
+    mean = sum(day * value for day, value in days) / total
+    seen = 0
+    for median, value in days:
+        seen += value
+        if seen > total / 2:
+            break
+    mode = max(days, key=itemgetter(1))[0]
+    return mean, median, mode
+
+
+def ranking(query):
+    return sorted(query.all(), key=itemgetter(1), reverse=True)
 
 
 def main(releases=None):
     db = get_db_from_config()
 
-    stats = {}  # {release: {'stat': ...}}
     feedback = 0  # total number of updates that received feedback
     karma = defaultdict(int)  # {username: # of karma submissions}
     num_updates = db.query(Update).count()
-    proventesters = set()
 
     for release in db.query(Release).all():
         if releases and release.name not in releases:
             continue
-        updates = db.query(Update).filter_by(release=release)
-        critpath_pkgs = get_critpath_pkgs(release.name.lower())
-        total = updates.count()
-        if not total:
+        data = ReleaseStat.for_release(release, db)
+        if not data['updates']:
             continue
         print header(release.long_name)
-        stats[release.name] = {
-            'num_updates': total,
-            'num_tested': 0,
-            'num_tested_without_karma': 0,
-            'num_feedback': 0,
-            'num_anon_feedback': 0,
-            'critpath_pkgs': defaultdict(int),
-            'num_critpath': 0,
-            'num_critpath_approved': 0,
-            'num_critpath_unapproved': 0,
-            'num_stablekarma': 0,
-            'num_testingtime': 0,
-            'critpath_without_karma': set(),
-            'conflicted_proventesters': [],
-            'critpath_positive_karma_including_proventesters': [],
-            'critpath_positive_karma_negative_proventesters': [],
-            'stable_with_negative_karma': updates.filter(
-                and_(Update.status == UpdateStatus.stable,
-                     Update.karma < 0)).count(),
-            'bugs': set(),
-            'karma': defaultdict(int),
-            'deltas': [],
-            'occurrences': {},
-            'accumulative': timedelta(),
-            'packages': defaultdict(int),
-            'proventesters': set(),
-            'proventesters_1': 0,
-            'proventesters_0': 0,
-            'proventesters_-1': 0,
-            'submitters': defaultdict(int),
-            # for tracking number of types of karma
-            '1': 0,
-            '0': 0,
-            '-1': 0,
-        }
-        data = stats[release.name]
-
-        for status in statuses:
-            data['num_%s' % status] = updates.filter(
-                and_(Update.status == UpdateStatus.from_string(status))).count()
-
-        for type in types:
-            data['num_%s' % type] = updates.filter(
-                Update.type == UpdateType.from_string(type)).count()
-
-        for update in updates.all():
-            assert update.user, update.title
-            data['submitters'][update.user.name] += 1
-            for build in update.builds:
-                data['packages'][build.package.name] += 1
-                if build.package.name in critpath_pkgs:
-                    data['critpath_pkgs'][build.package.name] += 1
-            for bug in update.bugs:
-                data['bugs'].add(bug.bug_id)
-
-            feedback_done = False
-            testingtime_done = False
-            stablekarma_done = False
-
-            for comment in update.comments:
-                if not comment.user:
-                    print('Error: None comment for %s' % update.title)
-                if comment.user.name == 'autoqa':
-                    continue
-
-                # Track the # of +1's, -1's, and +0's.
-                if comment.user.name != 'bodhi':
-                    data[str(comment.karma)] += 1
-
-                if 'proventesters' in [g.name for g in comment.user.groups]:
-                    data['proventesters'].add(comment.user.name)
-                    data['proventesters_%d' % comment.karma] += 1
-
-                if update.status == UpdateStatus.stable:
-                    if not stablekarma_done:
-                        if comment.text == 'This update has reached the stable karma threshold and will be pushed to the stable updates repository':
-                            data['num_stablekarma'] += 1
-                            stablekarma_done = True
-                        elif comment.text and comment.text.endswith('days in testing and can be pushed to stable now if the maintainer wishes'):
-                            data['num_testingtime'] += 1
-                            stablekarma_done = True
-
-                # For figuring out if an update has received feedback or not
-                if not feedback_done:
-                    if (not comment.user.name == 'bodhi'
-                        and comment.karma != 0 and not comment.anonymous):
-                        data['num_feedback'] += 1  # per-release tracking of feedback
-                        feedback += 1  # total number of updates that have received feedback
-                        feedback_done = True  # so we don't run this for each comment
-
-                # Tracking per-author karma & anonymous feedback
-                if not comment.user.name == 'bodhi':
-                    if comment.anonymous:
-                        # @@: should we track anon +0 comments as "feedback"?
-                        if comment.karma != 0:
-                            data['num_anon_feedback'] += 1
-                    else:
-                        author = comment.user.name
-                        data['karma'][author] += 1
-                        karma[author] += 1
-
-                if (not testingtime_done and
-                    comment.text == 'This update has been pushed to testing'):
-                    for othercomment in update.comments:
-                        if othercomment.text == 'This update has been pushed to stable':
-                            delta = othercomment.timestamp - comment.timestamp
-                            data['deltas'].append(delta)
-                            data['occurrences'][delta.days] = \
-                                data['occurrences'].setdefault(
-                                        delta.days, 0) + 1
-                            data['accumulative'] += delta
-                            testingtime_done = True
-                            break
-
-            if update.critpath:
-                if update.critpath_approved or update.status == UpdateStatus.stable:
-                    data['num_critpath_approved'] += 1
-                else:
-                    if update.status in (UpdateStatus.testing, UpdateStatus.pending):
-                        data['num_critpath_unapproved'] += 1
-                data['num_critpath'] += 1
-                #if not feedback_done:
-                if update.status == UpdateStatus.stable and update.karma == 0:
-                    data['critpath_without_karma'].add(update)
-
-                # Proventester metrics
-                proventester_karma = defaultdict(int) # {username: karma}
-                positive_proventesters = 0
-                negative_proventesters = 0
-                for comment in update.comments:
-                    if 'proventesters' in [g.name for g in comment.user.groups]:
-                        proventester_karma[comment.user.name] += comment.karma
-                for _karma in proventester_karma.values():
-                    if _karma > 0:
-                        positive_proventesters += 1
-                    elif _karma < 0:
-                        negative_proventesters += 1
-
-                # Conflicting proventesters
-                if positive_proventesters and negative_proventesters:
-                    data['conflicted_proventesters'] += [short_url(update)]
-
-                # Track updates with overall positive karma, including positive
-                # karma from a proventester
-                if update.karma > 0 and positive_proventesters:
-                    data['critpath_positive_karma_including_proventesters'] += [short_url(update)]
-
-                # Track updates with overall positive karma, including negative
-                # karma from a proventester
-                if update.karma > 0 and negative_proventesters:
-                    data['critpath_positive_karma_negative_proventesters'] += [short_url(update)]
-
-            if testingtime_done:
-                data['num_tested'] += 1
-                if not feedback_done:
-                    data['num_tested_without_karma'] += 1
-
-        data['deltas'].sort()
-
-        print " * %d updates" % data['num_updates']
-        print " * %d packages updated" % (len(data['packages']))
+        critpath_pkgs = get_critpath_pkgs(release.name.lower())
+        in_release = Update.release_id == release.id
+        feedback += data['feedback']
+
+        packages = ranking(db.query(Package.name, func.count(Build.id))
+                           .join(Build.package).join(Build.update)
+                           .filter(in_release).group_by(Package.name))
+        critpath_updated = [(name, num) for name, num in packages
+                            if name in critpath_pkgs]
+        submitters = ranking(db.query(User.name, func.count(Update.id))
+                             .join(Update.user).filter(in_release)
+                             .group_by(User.name))
+        num_bugs = db.query(func.count(Bug.bug_id.distinct()))\
+            .join(Bug.updates).filter(in_release).scalar()
+
+        # Comments by logged in users
+        commenters = db.query(User.name, func.count(Comment.id))\
+            .join(Comment.user).join(Comment.update).filter(in_release)\
+            .filter(Comment.anonymous == False)\
+            .filter(~User.name.in_(STATS_IGNORED_USERS))\
+            .group_by(User.name).all()
+        for name, num in commenters:
+            karma[name] += num
+        num_authenticated = sum(num for name, num in commenters)
+
+        # Proventester feedback, per critpath update and tester
+        proventester_comments = db.query(Comment.karma, func.count(Comment.id))\
+            .join(Comment.update).join(Comment.user).join(User.groups)\
+            .filter(in_release).filter(Group.name == u'proventesters')\
+            .group_by(Comment.karma)
+        proventester_karma = dict(proventester_comments.all())
+        num_proventesters = db.query(func.count(func.distinct(User.id)))\
+            .join(User.comments).join(Comment.update).join(User.groups)\
+            .filter(in_release).filter(Group.name == u'proventesters')\
+            .scalar()
+        votes = db.query(Update.id, Update.karma, User.name,
+                         func.sum(Comment.karma))\
+            .join(Update.comments).join(Comment.user).join(User.groups)\
+            .filter(in_release).filter(Update.critpath == True)\
+            .filter(Group.name == u'proventesters')\
+            .group_by(Update.id, Update.karma, User.name)
+        proventesters = defaultdict(lambda: [0, 0])  # {update: [+, -]}
+        update_karma = {}
+        for update_id, update_total, name, tester_total in votes:
+            update_karma[update_id] = update_total
+            if tester_total > 0:
+                proventesters[update_id][0] += 1
+            elif tester_total < 0:
+                proventesters[update_id][1] += 1
+        nvrs = {}
+        if proventesters:
+            nvrs = dict(db.query(Build.update_id, func.min(Build.nvr))
+                        .filter(Build.update_id.in_(proventesters.keys()))
+                        .group_by(Build.update_id))
+        conflicted, positive_including, positive_negative = [], [], []
+        for update_id, (positive, negative) in proventesters.items():
+            url = short_url(nvrs.get(update_id, ''))
+            if positive and negative:
+                conflicted.append(url)
+            if update_karma[update_id] > 0 and positive:
+                positive_including.append(url)
+            if update_karma[update_id] > 0 and negative:
+                positive_negative.append(url)
+
+        stable = db.query(Update.id).filter(in_release)\
+            .filter(Update.status == UpdateStatus.stable)
+        num_stablekarma = stable.filter(Update.comments.any(
+            Comment.text == STABLE_KARMA_TEXT)).count()
+        num_testingtime = stable.filter(Update.comments.any(
+            Comment.text.like(TESTING_TIME_TEXT))).count()
+        tested = stable.filter(and_(Update.date_testing != None,
+                                    Update.date_stable != None))
+        num_tested = tested.count()
+        num_tested_without_karma = tested.filter(~Update.comments.any(and_(
+            Comment.karma != 0, Comment.anonymous == False,
+            Comment.user.has(~User.name.in_(STATS_IGNORED_USERS))))).count()
+        critpath_without_karma = stable.filter(Update.critpath == True)\
+            .filter(Update.karma == 0).count()
+        mean, median, mode = testing_time(data)
+
+        num_critpath = data['critpath']
+        num_stable = data['status:stable']
+        print " * %d updates" % data['updates']
+        print " * %d packages updated" % len(packages)
         for status in statuses:
-            print " * %d %s updates" % (data['num_%s' % status], status)
+            print " * %d %s updates" % (data['status:%s' % status], status)
         for type in types:
-            print " * %d %s updates (%0.2f%%)" % (data['num_%s' % type], type,
-                    float(data['num_%s' % type]) / data['num_updates'] * 100)
-        print " * %d bugs resolved" % len(data['bugs'])
-        print " * %d critical path updates (%0.2f%%)" % (data['num_critpath'],
-                float(data['num_critpath']) / data['num_updates'] * 100)
+            print " * %d %s updates (%0.2f%%)" % (data['type:%s' % type], type,
+                    percent(data['type:%s' % type], data['updates']))
+        print " * %d bugs resolved" % num_bugs
+        print " * %d critical path updates (%0.2f%%)" % (num_critpath,
+                percent(num_critpath, data['updates']))
         print " * %d approved critical path updates" % (
-                data['num_critpath_approved'])
+                data['critpath:approved'])
         print " * %d unapproved critical path updates" % (
-                data['num_critpath_unapproved'])
+                data['critpath:unapproved'])
         print " * %d updates received feedback (%0.2f%%)" % (
-                data['num_feedback'], (float(data['num_feedback']) /
-                 data['num_updates'] * 100))
-        print " * %d +0 comments" % data['0']
-        print " * %d +1 comments" % data['1']
-        print " * %d -1 comments" % data['-1']
+                data['feedback'], percent(data['feedback'], data['updates']))
+        print " * %d +0 comments" % data['karma:0']
+        print " * %d +1 comments" % data['karma:1']
+        print " * %d -1 comments" % data['karma:-1']
         print " * %d unique authenticated karma submitters" % (
-                len(data['karma']))
-        print " * %d proventesters" % len(data['proventesters'])
-        print "   * %d +1's from proventesters" % data['proventesters_1']
-        print "   * %d -1's from proventesters" % data['proventesters_-1']
-        if data['num_critpath']:
-            print " * %d critpath updates with conflicting proventesters (%0.2f%% of critpath)" % (len(data['conflicted_proventesters']), float(len(data['conflicted_proventesters'])) / data['num_critpath'] * 100)
-            for u in sorted(data['conflicted_proventesters']):
+                len(commenters))
+        print " * %d proventesters" % num_proventesters
+        print "   * %d +1's from proventesters" % proventester_karma.get(1, 0)
+        print "   * %d -1's from proventesters" % proventester_karma.get(-1, 0)
+        if num_critpath:
+            print " * %d critpath updates with conflicting proventesters (%0.2f%% of critpath)" % (len(conflicted), percent(len(conflicted), num_critpath))
+            for u in sorted(conflicted):
                 print '   <li><a href="%s">%s</a></li>' % (u, u.split('/')[-1])
-            print " * %d critpath updates with positive karma and negative proventester feedback (%0.2f%% of critpath)" % (len(data['critpath_positive_karma_negative_proventesters']), float(len(data['critpath_positive_karma_negative_proventesters'])) / data['num_critpath'] * 100)
-            for u in sorted(data['critpath_positive_karma_negative_proventesters']):
+            print " * %d critpath updates with positive karma and negative proventester feedback (%0.2f%% of critpath)" % (len(positive_negative), percent(len(positive_negative), num_critpath))
+            for u in sorted(positive_negative):
                 print '   <li><a href="%s">%s</a></li>' % (u, u.split('/')[-1])
-            print " * %d critpath updates with positive karma and positive proventester feedback (%0.2f%% of critpath)" % (len(data['critpath_positive_karma_including_proventesters']), float(len(data['critpath_positive_karma_including_proventesters'])) / data['num_critpath'] * 100)
+            print " * %d critpath updates with positive karma and positive proventester feedback (%0.2f%% of critpath)" % (len(positive_including), percent(len(positive_including), num_critpath))
         print " * %d anonymous users gave feedback (%0.2f%%)" % (
-                data['num_anon_feedback'], float(data['num_anon_feedback']) /
-                (data['num_anon_feedback'] + sum(data['karma'].values())) * 100)
-# This does not take into account updates that reach stablekarma before being pushed to testing!
-#        print " * %d out of %d stable updates went through testing (%0.2f%%)" %(
-#                data['num_tested'], data['num_stable'],
-#                float(data['num_tested']) / data['num_stable'] * 100)
-        print " * %d stable updates reached the stable karma threshold (%0.2f%%)" %(
-                data['num_stablekarma'],
-                float(data['num_stablekarma']) / data['num_stable'] * 100)
+                data['feedback:anonymous'], percent(
+                    data['feedback:anonymous'],
+                    data['feedback:anonymous'] + num_authenticated))
+        print " * %d stable updates reached the stable karma threshold (%0.2f%%)" % (
+                num_stablekarma, percent(num_stablekarma, num_stable))
         print " * %d stable updates reached the minimum time in testing threshold (%0.2f%%)" % (
-                data['num_testingtime'],
-                float(data['num_testingtime']) / data['num_stable'] * 100)
-        print " * %d went from testing to stable *without* karma (%0.2f%%)" %(
-                data['num_tested_without_karma'],
-                float(data['num_tested_without_karma']) /
-                data['num_tested'] * 100)
+                num_testingtime, percent(num_testingtime, num_stable))
+        print " * %d went from testing to stable *without* karma (%0.2f%%)" % (
+                num_tested_without_karma,
+                percent(num_tested_without_karma, num_tested))
         print " * %d updates were pushed to stable with negative karma (%0.2f%%)" % (
-                data['stable_with_negative_karma'], float(data['stable_with_negative_karma']) / data['num_stable'] * 100)
+                data['stable:negative_karma'],
+                percent(data['stable:negative_karma'], num_stable))
         print " * %d critical path updates pushed to stable *without* karma" % (
-                len(data['critpath_without_karma']))
-        #for update in data['critpath_without_karma']:
-        #    print "   * %s submitted by %s" % (update.title, update.submitter)
+                critpath_without_karma)
         print " * Time spent in testing:"
-        print "   * mean = %d days" % (data['accumulative'].days /
-                len(data['deltas']))
-        print "   * median = %d days" % (
-                data['deltas'][len(data['deltas']) / 2].days)
-        print "   * mode = %d days" % (
-                sorted(data['occurrences'].items(), key=itemgetter(1))[-1][0])
-
-        print "Out of %d packages updated, the top 50 were:" % (
-                len(data['packages']))
-        for package in sorted(data['packages'].iteritems(), key=itemgetter(1), reverse=True)[:50]:
-            print " * %s (%d)" % (package[0], package[1])
-
-        print "Out of %d update submitters, the top 50 were:" % (
-                len(data['submitters']))
-        for submitter in sorted(data['submitters'].iteritems(), key=itemgetter(1), reverse=True)[:50]:
-            print " * %s (%d)" % (submitter[0], submitter[1])
+        print "   * mean = %d days" % mean
+        print "   * median = %d days" % median
+        print "   * mode = %d days" % mode
+
+        print "Out of %d packages updated, the top 50 were:" % len(packages)
+        for package in packages[:50]:
+            print " * %s (%d)" % package
+
+        print "Out of %d update submitters, the top 50 were:" % len(submitters)
+        for submitter in submitters[:50]:
+            print " * %s (%d)" % submitter
 
         print "Out of %d critical path updates, the top 50 updated were:" % (
-                len(data['critpath_pkgs']))
-        for x in sorted(data['critpath_pkgs'].iteritems(), key=itemgetter(1), reverse=True)[:50]:
-            print " * %s (%d)" % (x[0], x[1])
-
-        critpath_not_updated = set()
-        for pkg in critpath_pkgs:
-            if pkg not in data['critpath_pkgs']:
-                critpath_not_updated.add(pkg)
+                len(critpath_updated))
+        for x in critpath_updated[:50]:
+            print " * %s (%d)" % x
+
+        critpath_not_updated = set(critpath_pkgs) - set(
+            name for name, num in critpath_updated)
         print "Out of %d critical path packages, %d were never updated:" % (
                 len(critpath_pkgs), len(critpath_not_updated))
         for pkg in sorted(critpath_not_updated):
@@ -314,7 +251,7 @@ def main(releases=None):
 
     print
     print "Out of %d total updates, %d received feedback (%0.2f%%)" % (
-            num_updates, feedback, (float(feedback) / num_updates * 100))
+            num_updates, feedback, percent(feedback, num_updates))
     print "Out of %d total unique commenters, the top 50 were:" % (
             len(karma))
     for submitter in sorted(karma.iteritems(), key=itemgetter(1), reverse=True)[:50]:
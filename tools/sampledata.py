@@ -0,0 +1,62 @@
+""" sampledata.py
+
+Fill a bodhi database with synthetic updates, for the scripts in this
+directory that measure how bodhi copes with a lot of data.
+
+Every update has two builds of its own packages, three bugs and five
+comments, and every fifth update has a buildroot override.  Titles are the
+space separated build NVRs, so update N is titled
+``packageN-0-1.0-1.fc17 packageN-1-1.0-1.fc17``.
+"""
+
+from datetime import datetime, timedelta
+
+from bodhi.models import (Bug, Build, BuildrootOverride, Comment, Package,
+                          Release, Update, UpdateStatus, UpdateType, User)
+
+
+def populate(db, num_updates):
+    users = [User(name=u'user%d' % i) for i in range(50)]
+    db.add_all(users)
+    release = Release(
+        name=u'F17', long_name=u'Fedora 17', id_prefix=u'FEDORA',
+        version='17', dist_tag=u'f17', stable_tag=u'f17-updates',
+        testing_tag=u'f17-updates-testing',
+        candidate_tag=u'f17-updates-candidate',
+        pending_testing_tag=u'f17-updates-testing-pending',
+        pending_stable_tag=u'f17-updates-pending',
+        override_tag=u'f17-override', branch=u'f17')
+    db.add(release)
+    start = datetime(2014, 1, 1)
+    statuses = [UpdateStatus.pending, UpdateStatus.testing,
+                UpdateStatus.stable]
+    for i in range(num_updates):
+        builds = []
+        for j in range(2):
+            package = Package(name=u'package%d-%d' % (i, j))
+            builds.append(Build(nvr=u'package%d-%d-1.0-1.fc17' % (i, j),
+                                release=release, package=package))
+        submitted = start + timedelta(hours=i)
+        update = Update(
+            title=u' '.join(build.nvr for build in builds),
+            builds=builds, user=users[i % len(users)], release=release,
+            notes=u'Update %d' % i, critpath=i % 10 == 0,
+            type=i % 7 and UpdateType.bugfix or UpdateType.security,
+            status=statuses[i % len(statuses)],
+            date_submitted=submitted, date_modified=submitted,
+            date_pushed=submitted + timedelta(days=1))
+        update.bugs = [Bug(bug_id=i * 10 + j) for j in range(3)]
+        for j in range(5):
+            comment = Comment(text=u'Comment %d' % j, karma=1,
+                              timestamp=submitted + timedelta(minutes=j))
+            comment.user = users[(i + j) % len(users)]
+            update.comments.append(comment)
+        db.add(update)
+        if i % 5 == 0:
+            db.add(BuildrootOverride(
+                build=builds[0], submitter=update.user, notes=u'Override',
+                submission_date=submitted,
+                expiration_date=submitted + timedelta(days=7)))
+        if i % 1000 == 0:
+            db.flush()
+    db.flush()